@@ -0,0 +1,496 @@
+"""
+OpenAI-compatible HTTP API for the Llama 4 Chat Interface
+
+A headless asyncio server next to the Streamlit UI, so other services can
+call the model:
+
+    python api.py --port 8000
+    curl http://127.0.0.1:8000/v1/chat/completions -d '{"messages": [{"role": "user", "content": "Salom!"}], "stream": true}'
+
+Endpoints: POST /v1/chat/completions, POST /v1/completions, GET /v1/models
+and GET /health. "model" is a MODEL_REGISTRY key; sampling parameters the
+request leaves out come from INFERENCE_CONFIG and the model's registry
+entry. With "stream": true tokens are sent as server-sent events.
+
+Connections are coroutines; only the blocking steps of a running or queued
+inference request hold a thread. HTTP/1.1 is spoken directly, like the
+metrics endpoint, so no web framework is needed.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
+
+from config import API_CONFIG, SCHEDULER_CONFIG, MODEL_REGISTRY, DEFAULT_MODEL, setup_environment
+from backends import get_backend
+from context_window import fit_conversation
+from metrics import start_metrics_server
+from residency import start_model_warmup
+from scheduler import get_scheduler
+from utils import (
+    format_prompt,
+    get_chat_format,
+    resolve_inference_config,
+    stream_llama_inference,
+    sanitize_input,
+    estimate_tokens,
+    InferenceError,
+    InferenceBusyError,
+    InferenceTimeoutError
+)
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+    504: "Gateway Timeout"
+}
+
+# Request fields passed through to the inference config
+SAMPLING_PARAMS = ("max_tokens", "temperature", "top_p", "seed")
+
+_DONE = object()
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+class HttpError(Exception):
+    """An error answered with an OpenAI-style JSON error body"""
+
+    def __init__(self, status: int, message: str, error_type: str = "invalid_request_error"):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+class HttpRequest:
+    """A parsed HTTP/1.1 request"""
+
+    def __init__(self, method: str, path: str, version: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        return connection != "close" if self.version == "HTTP/1.1" else connection == "keep-alive"
+
+    def json(self) -> Dict[str, Any]:
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError as e:
+            raise HttpError(400, f"Invalid JSON body: {e}")
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return payload
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[HttpRequest]:
+    """
+    Read one request from a connection.
+
+    Args:
+        reader: Connection stream
+
+    Returns:
+        The request, or None when the client closed the connection
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, path, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise HttpError(400, "Too many headers")
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(400, "Chunked request bodies are not supported; send Content-Length")
+    length = int(headers.get("content-length") or 0)
+    if length > API_CONFIG["max_body_bytes"]:
+        raise HttpError(413, f"Request body is larger than {API_CONFIG['max_body_bytes']} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return HttpRequest(method, path.split("?", 1)[0], version, headers, body)
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                    keep_alive: bool = True) -> None:
+    """Write a complete JSON response"""
+    body = json.dumps(payload).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+def error_body(message: str, error_type: str) -> Dict[str, Any]:
+    return {"error": {"message": message, "type": error_type, "code": None}}
+
+def inference_error_status(error: InferenceError) -> Tuple[int, str]:
+    """HTTP status and OpenAI error type of an inference failure"""
+    if isinstance(error, InferenceBusyError):
+        return 429, "server_busy"
+    if isinstance(error, InferenceTimeoutError):
+        return 504, "timeout"
+    return 500, "server_error"
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Threads for blocking inference steps, one per request the scheduler
+    can hold, so a request is never stuck behind others before the
+    scheduler sees it.
+    """
+    global _executor
+    if _executor is None:
+        threads = API_CONFIG["inference_threads"] or get_scheduler().max_concurrent + SCHEDULER_CONFIG["max_queue"]
+        _executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="api-inference")
+    return _executor
+
+async def generate(prompt: str, config: Dict[str, Any], question: Optional[str],
+                   stats: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Run stream_llama_inference without blocking the event loop.
+
+    Each step of the blocking generator runs on the inference executor,
+    inside one context copied per request, so the trace that
+    stream_llama_inference starts follows the request from thread to
+    thread instead of staying with a pool thread. Leaving early (client
+    gone, timeout) sets the cancel event, which stops llama.cpp at once,
+    and closes the generator when its step returns.
+
+    Args:
+        prompt: The formatted prompt
+        config: Inference configuration overrides
+        question: Sanitized user message, for the semantic cache
+        stats: Filled by stream_llama_inference
+
+    Yields:
+        Chunks of generated text
+
+    Raises:
+        InferenceTimeoutError: If the request takes longer than API_CONFIG request_timeout
+        InferenceError: If inference fails
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    cancel_event = threading.Event()
+    context = contextvars.copy_context()
+    chunks = stream_llama_inference(prompt, config, stats=stats, question=question, cancel_event=cancel_event)
+    deadline = loop.time() + API_CONFIG["request_timeout"]
+    step = None
+    finished = False
+    try:
+        while True:
+            step = loop.run_in_executor(executor, context.run, next, chunks, _DONE)
+            try:
+                chunk = await asyncio.wait_for(asyncio.shield(step), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise InferenceTimeoutError(f"Request did not finish within {API_CONFIG['request_timeout']} seconds")
+            if chunk is _DONE:
+                finished = True
+                return
+            yield chunk
+    finally:
+        if not finished:
+            cancel_event.set()
+            if step is not None and not step.done():
+                step.add_done_callback(lambda _: executor.submit(context.run, chunks.close))
+            else:
+                executor.submit(context.run, chunks.close)
+
+def resolve_model(payload: Dict[str, Any]) -> str:
+    """The request's MODEL_REGISTRY key"""
+    model = payload.get("model") or DEFAULT_MODEL
+    if model not in MODEL_REGISTRY:
+        raise HttpError(404, f"Model {model!r} not found, expected one of: {', '.join(MODEL_REGISTRY)}",
+                        "model_not_found")
+    return model
+
+def request_config(payload: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """
+    Inference config overrides from the request's sampling parameters.
+
+    Stop strings are added to the model's own end-of-turn tokens rather
+    than replacing them.
+    """
+    config = {"model": model}
+    for name in SAMPLING_PARAMS:
+        value = payload.get(name)
+        if value is None:
+            continue
+        # bool is an int subclass, but true/false is never a valid value here
+        if name in ("max_tokens", "seed"):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise HttpError(400, f"'{name}' must be an integer")
+            if name == "max_tokens" and value < 0:
+                raise HttpError(400, "'max_tokens' must not be negative")
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise HttpError(400, f"'{name}' must be a number")
+        config[name] = value
+    stop = payload.get("stop")
+    if stop:
+        stop = [stop] if isinstance(stop, str) else stop
+        if not isinstance(stop, list) or not all(isinstance(item, str) for item in stop):
+            raise HttpError(400, "'stop' must be a string or a list of strings")
+        config["stop"] = resolve_inference_config({"model": model})["stop"] + stop
+    return config
+
+def chat_prompt(payload: Dict[str, Any], config: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Format chat messages into a prompt that fits the model's context window.
+
+    Returns:
+        (prompt, question, config) with max_tokens limited to the room left
+    """
+    messages = payload.get("messages")
+    if not isinstance(messages, list) or not messages:
+        raise HttpError(400, "'messages' must be a non-empty list")
+    system_parts: List[str] = []
+    history: List[Tuple[str, str]] = []
+    pending_user: Optional[str] = None
+    for message in messages:
+        if not isinstance(message, dict) or not isinstance(message.get("content"), str):
+            raise HttpError(400, "Each message needs a role and string content")
+        role, content = message.get("role"), sanitize_input(message["content"])
+        if role == "system":
+            system_parts.append(content)
+        elif role == "user":
+            if pending_user is not None:
+                raise HttpError(400, "User messages must alternate with assistant messages")
+            pending_user = content
+        elif role == "assistant":
+            if pending_user is None:
+                raise HttpError(400, "Assistant messages must follow a user message")
+            history.append((pending_user, content))
+            pending_user = None
+        else:
+            raise HttpError(400, f"Unsupported message role {role!r}")
+    if pending_user is None:
+        raise HttpError(400, "The last message must be from the user")
+
+    context = fit_conversation(history, pending_user, "\n\n".join(system_parts) or None, config)
+    return context["prompt"], pending_user, dict(config, max_tokens=context["max_tokens"])
+
+def completion_prompt(payload: Dict[str, Any], config: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+    """Format a completion request's prompt as a single user turn"""
+    prompt = payload.get("prompt")
+    if isinstance(prompt, list) and len(prompt) == 1:
+        prompt = prompt[0]
+    if not isinstance(prompt, str):
+        raise HttpError(400, "'prompt' must be a string")
+    question = sanitize_input(prompt)
+    return format_prompt(question, chat_format=get_chat_format(config["model"])), question, config
+
+def finish_reason(stats: Dict[str, Any]) -> str:
+    return "length" if stats.get("stop_reason") == "length" else "stop"
+
+def usage(prompt: str, text: str, model: str, stats: Dict[str, Any]) -> Dict[str, int]:
+    """Token counts from llama.cpp's timings, estimated when served from cache"""
+    prompt_tokens = stats.get("prompt_n") or estimate_tokens(prompt, model)
+    completion_tokens = stats.get("predicted_n") or estimate_tokens(text, model, add_bos=False)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+async def handle_completion(request: HttpRequest, writer: asyncio.StreamWriter, chat: bool) -> bool:
+    """
+    Answer a /v1/chat/completions or /v1/completions request.
+
+    Returns:
+        Whether the connection can be kept open
+    """
+    payload = request.json()
+    model = resolve_model(payload)
+    # Reading the GGUF and profile and tokenizing the conversation block, so
+    # they run off the event loop like inference does
+    loop = asyncio.get_running_loop()
+    config = await loop.run_in_executor(None, request_config, payload, model)
+    prompt, question, config = await loop.run_in_executor(
+        None, chat_prompt if chat else completion_prompt, payload, config
+    )
+
+    response_id = f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex}"
+    created = int(time.time())
+    base = {
+        "id": response_id,
+        "object": "chat.completion.chunk" if chat else "text_completion",
+        "created": created,
+        "model": model
+    }
+    stats: Dict[str, Any] = {}
+
+    def choice(text: Optional[str], reason: Optional[str], first: bool = False) -> Dict[str, Any]:
+        if not chat:
+            return {"index": 0, "text": text or "", "logprobs": None, "finish_reason": reason}
+        delta = {"role": "assistant"} if first else {}
+        if text:
+            delta["content"] = text
+        return {"index": 0, "delta": delta, "finish_reason": reason}
+
+    if not payload.get("stream"):
+        try:
+            text = "".join([chunk async for chunk in generate(prompt, config, question, stats)]).strip()
+        except InferenceError as e:
+            status, error_type = inference_error_status(e)
+            await send_json(writer, status, error_body(str(e), error_type), request.keep_alive)
+            return request.keep_alive
+        if chat:
+            choices = [{"index": 0, "message": {"role": "assistant", "content": text},
+                        "finish_reason": finish_reason(stats)}]
+        else:
+            choices = [choice(text, finish_reason(stats))]
+        result = dict(base, object="chat.completion" if chat else "text_completion", choices=choices,
+                      usage=await loop.run_in_executor(None, usage, prompt, text, model, stats))
+        await send_json(writer, 200, result, request.keep_alive)
+        return request.keep_alive
+
+    # Server-sent events: one JSON chunk per piece of text, then [DONE]. The
+    # status line waits for the first chunk, so a request the scheduler
+    # rejects or that fails before generating still gets its error status.
+    chunks = generate(prompt, config, question, stats)
+    try:
+        pending: Optional[str] = await chunks.__anext__()
+    except StopAsyncIteration:
+        pending = None
+    except InferenceError as e:
+        await chunks.aclose()
+        status, error_type = inference_error_status(e)
+        await send_json(writer, status, error_body(str(e), error_type), request.keep_alive)
+        return request.keep_alive
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/event-stream\r\n"
+        b"Cache-Control: no-cache\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+
+    async def send_event(data: Any) -> None:
+        writer.write(f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode("utf-8"))
+        await writer.drain()
+
+    text = ""
+    try:
+        first = True
+        if pending is not None:
+            await send_event(dict(base, choices=[choice(pending, None, first)]))
+            text += pending
+            first = False
+        async for chunk in chunks:
+            await send_event(dict(base, choices=[choice(chunk, None, first)]))
+            text += chunk
+            first = False
+        await send_event(dict(base, choices=[choice(None, finish_reason(stats), first)],
+                              usage=await loop.run_in_executor(None, usage, prompt, text, model, stats)))
+    except InferenceError as e:
+        await send_event(error_body(str(e), inference_error_status(e)[1]))
+    finally:
+        # A client that disconnected mid-stream stops generation here
+        await chunks.aclose()
+    await send_event("[DONE]")
+    return False
+
+def list_models() -> Dict[str, Any]:
+    return {
+        "object": "list",
+        "data": [
+            {"id": key, "object": "model", "owned_by": "local", "name": entry["name"]}
+            for key, entry in MODEL_REGISTRY.items()
+        ]
+    }
+
+async def dispatch(request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+    """
+    Route a request.
+
+    Returns:
+        Whether the connection can be kept open
+    """
+    routes = {
+        "/v1/chat/completions": "POST",
+        "/v1/completions": "POST",
+        "/v1/models": "GET",
+        "/health": "GET"
+    }
+    if request.path not in routes:
+        raise HttpError(404, f"Unknown endpoint {request.path}", "not_found")
+    if request.method != routes[request.path]:
+        raise HttpError(405, f"{request.path} expects {routes[request.path]}")
+    if request.path == "/v1/chat/completions":
+        return await handle_completion(request, writer, chat=True)
+    if request.path == "/v1/completions":
+        return await handle_completion(request, writer, chat=False)
+    if request.path == "/v1/models":
+        await send_json(writer, 200, list_models(), request.keep_alive)
+    else:
+        await send_json(writer, 200, {"status": "ok", "scheduler": get_scheduler().status()}, request.keep_alive)
+    return request.keep_alive
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Serve requests on one connection until it closes or idles out"""
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request(reader), API_CONFIG["keepalive_timeout"])
+                if request is None:
+                    break
+                keep_alive = await dispatch(request, writer)
+            except HttpError as e:
+                await send_json(writer, e.status, error_body(str(e), e.error_type), keep_alive=False)
+                break
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception:
+        logger.exception("Unhandled error while serving a request")
+    finally:
+        writer.close()
+
+async def serve(host: str, port: int) -> None:
+    """Run the API server until cancelled"""
+    server = await asyncio.start_server(handle_connection, host, port)
+    logger.info(f"Serving the OpenAI-compatible API on http://{host}:{port}/v1")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    """Main API function"""
+    parser = argparse.ArgumentParser(description="Serve the local Llama model over an OpenAI-compatible HTTP API")
+    parser.add_argument("--host", default=API_CONFIG["host"], help="Address to listen on")
+    parser.add_argument("--port", type=int, default=API_CONFIG["port"], help="Port to listen on")
+    args = parser.parse_args()
+
+    setup_environment()
+    start_metrics_server()
+    start_model_warmup(DEFAULT_MODEL)
+    get_backend().start()
+    get_executor()
+
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("API server stopped")
+
+if __name__ == "__main__":
+    main()
@@ -1,200 +1,428 @@
-"""
-Llama 4 Chat Interface - Main Application
-"""
-
-import streamlit as st
-import time
-from typing import Optional
-
-from config import UI_CONFIG, setup_environment, validate_system_requirements
-from utils import (
-    format_prompt, 
-    run_llama_inference, 
-    validate_model_exists, 
-    validate_llama_cpp_exists,
-    get_system_info,
-    sanitize_input,
-    estimate_tokens,
-    format_response_time
-)
-
-def main():
-    """Main application function"""
-    # Setup environment
-    setup_environment()
-    
-    # Configure Streamlit page
-    st.set_page_config(
-        page_title=UI_CONFIG["page_title"],
-        page_icon=UI_CONFIG["page_icon"],
-        layout=UI_CONFIG["layout"],
-        initial_sidebar_state=UI_CONFIG["initial_sidebar_state"]
-    )
-    
-    # Custom CSS for better styling
-    st.markdown("""
-    <style>
-    .main-header {
-        font-size: 3rem;
-        font-weight: bold;
-        color: #FF6B6B;
-        text-align: center;
-        margin-bottom: 2rem;
-    }
-    .stTextArea textarea {
-        border-radius: 10px;
-        border: 2px solid #e0e0e0;
-    }
-    .stButton button {
-        border-radius: 10px;
-        background-color: #FF6B6B;
-        color: white;
-        font-weight: bold;
-        padding: 0.5rem 2rem;
-    }
-    .stButton button:hover {
-        background-color: #FF5252;
-    }
-    .info-box {
-        background-color: #f0f2f6;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #FF6B6B;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
-    # Header
-    st.markdown('<h1 class="main-header">🦙 Llama 4 Chat Interface</h1>', unsafe_allow_html=True)
-    st.markdown("### Local AI Chat with Llama 4 Scout 17B")
-    
-    # Sidebar
-    with st.sidebar:
-        st.header("⚙️ Settings")
-        
-        # System validation
-        st.subheader("🔍 System Check")
-        try:
-            validate_system_requirements()
-            st.success("✅ System requirements met")
-        except Exception as e:
-            st.error(f"❌ System check failed: {e}")
-            return
-        
-        # Model validation
-        model_exists = validate_model_exists()
-        llama_exists = validate_llama_cpp_exists()
-        
-        if model_exists:
-            st.success("✅ Model found")
-        else:
-            st.error("❌ Model not found")
-            st.info("Run `python download.py` to download the model")
-        
-        if llama_exists:
-            st.success("✅ llama.cpp found")
-        else:
-            st.error("❌ llama.cpp not found")
-            st.info("Clone and build llama.cpp in the project directory")
-        
-        # System info
-        if st.checkbox("Show system information"):
-            sys_info = get_system_info()
-            st.json(sys_info)
-        
-        # Generation parameters
-        st.subheader("🎛️ Generation Parameters")
-        temperature = st.slider("Temperature", 0.0, 1.0, 0.6, 0.1, 
-                              help="Controls randomness in generation")
-        top_p = st.slider("Top-p", 0.0, 1.0, 0.9, 0.05,
-                         help="Nucleus sampling parameter")
-        max_tokens = st.slider("Max tokens", 100, 4096, 2048, 100,
-                              help="Maximum number of tokens to generate")
-        
-        # Custom config
-        custom_config = {
-            "temperature": temperature,
-            "top_p": top_p,
-            "max_tokens": max_tokens
-        }
-    
-    # Main chat interface
-    if not model_exists or not llama_exists:
-        st.error("⚠️ Please ensure both the model and llama.cpp are properly set up before using the chat interface.")
-        return
-    
-    # Chat history
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-    
-    # Display chat history
-    for i, (user_msg, assistant_msg, response_time) in enumerate(st.session_state.chat_history):
-        with st.chat_message("user"):
-            st.write(user_msg)
-        with st.chat_message("assistant"):
-            st.write(assistant_msg)
-            st.caption(f"Response time: {response_time}")
-    
-    # Input area
-    user_input = st.text_area(
-        "Your message:",
-        height=UI_CONFIG["text_area_height"],
-        placeholder=UI_CONFIG["placeholder_text"],
-        key="user_input"
-    )
-    
-    # Generate button
-    col1, col2, col3 = st.columns([1, 2, 1])
-    with col2:
-        generate_button = st.button("🚀 Generate Response", use_container_width=True)
-    
-    # Processing
-    if generate_button:
-        if not user_input.strip():
-            st.warning("⚠️ Please enter a message.")
-        else:
-            # Sanitize input
-            sanitized_input = sanitize_input(user_input)
-            
-            # Estimate tokens
-            estimated_tokens = estimate_tokens(sanitized_input)
-            st.info(f"📊 Estimated input tokens: {estimated_tokens}")
-            
-            # Generate response
-            with st.spinner("🤔 Thinking..."):
-                start_time = time.time()
-                
-                # Format prompt
-                prompt = format_prompt(sanitized_input)
-                
-                # Run inference
-                response = run_llama_inference(prompt, custom_config)
-                
-                response_time = time.time() - start_time
-                formatted_time = format_response_time(response_time)
-                
-                # Add to chat history
-                st.session_state.chat_history.append((sanitized_input, response, formatted_time))
-                
-                # Display response
-                st.markdown("### ✨ Response:")
-                st.markdown(response)
-                st.success(f"⏱️ Generated in {formatted_time}")
-    
-    # Clear chat button
-    if st.session_state.chat_history:
-        if st.button("🗑️ Clear Chat History"):
-            st.session_state.chat_history = []
-            st.rerun()
-    
-    # Footer
-    st.markdown("---")
-    st.markdown("""
-    <div style='text-align: center; color: #666;'>
-        <p>Built with ❤️ using Streamlit and llama.cpp</p>
-        <p>Model: Llama 4 Scout 17B (IQ2_XXS quantized)</p>
-    </div>
-    """, unsafe_allow_html=True)
-
-if __name__ == "__main__":
-    main()
+"""
+Llama 4 Chat Interface - Main Application
+"""
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import RerunException, StopException
+import html
+import time
+import uuid
+from contextlib import closing
+from typing import Optional, Dict, Any
+
+from config import UI_CONFIG, HISTORY_CONFIG, MODEL_REGISTRY, setup_environment, validate_system_requirements, get_model_path
+from gguf import get_model_info
+from context_window import fit_conversation
+from response_cache import get_response_cache
+from semantic_cache import get_semantic_cache
+from scheduler import get_scheduler
+from metrics import start_metrics_server
+from tracing import start_trace, span
+from prefix_cache import build_prefix_snapshots
+from backends import get_backend
+from history_store import get_history_store
+from residency import start_model_warmup, model_residency
+from utils import (
+    clear_session_cache,
+    cancel_inference,
+    stream_llama_inference, 
+    InferenceError,
+    validate_model_exists, 
+    get_system_info,
+    sanitize_input,
+    estimate_tokens,
+    format_response_time
+)
+
+def show_earlier_messages():
+    """Render one more page of older turns on the next run"""
+    st.session_state.history_pages += 1
+
+def start_new_conversation():
+    """Start an empty conversation; the old one stays in the history store"""
+    clear_session_cache(st.session_state.session_id)
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.pop("chat_history", None)
+    st.session_state.context_window = None
+    st.session_state.history_pages = 1
+
+def render_turn(user_msg: str, assistant_msg: str, response_time: str):
+    """Render one completed turn"""
+    with st.chat_message("user"):
+        st.write(user_msg)
+    with st.chat_message("assistant"):
+        st.write(assistant_msg)
+        st.caption(f"Response time: {response_time}")
+
+@st.fragment
+def chat_turn(history_end: int, custom_config: Dict[str, Any], model: str, trace_next: bool):
+    """
+    Message input, generation and the turns added since the last full run.
+    
+    Runs as a fragment: sending a message reruns only this function, so the
+    completed turns rendered above it are not rendered again.
+    
+    Args:
+        history_end: Number of turns the last full run rendered
+        custom_config: Generation parameters from the sidebar
+        model: Selected MODEL_REGISTRY key
+        trace_next: Whether to trace the next response
+    """
+    session_id = st.session_state.session_id
+    store = get_history_store()
+    for turn in store.get_turns(session_id, history_end):
+        render_turn(*turn)
+    
+    # Input area
+    user_input = st.text_area(
+        "Your message:",
+        height=UI_CONFIG["text_area_height"],
+        placeholder=UI_CONFIG["placeholder_text"],
+        key="user_input"
+    )
+    
+    # Generate button
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        generate_button = st.button("🚀 Generate Response", use_container_width=True)
+    
+    # Processing
+    if generate_button:
+        if not user_input.strip():
+            st.warning("⚠️ Please enter a message.")
+        else:
+            # Trace the turn when asked to, otherwise at the configured sample rate
+            with start_trace("chat turn", sampled=trace_next or None) as trace:
+                # Sanitize input
+                with span("sanitize_input"):
+                    sanitized_input = sanitize_input(user_input)
+                
+                # Show the user's turn right away
+                with st.chat_message("user"):
+                    st.write(sanitized_input)
+                
+                # Stream the response into the assistant bubble
+                with st.chat_message("assistant"):
+                    placeholder = st.empty()
+                    placeholder.markdown("🤔 Thinking...")
+                    start_time = time.time()
+                    
+                    # Format prompt with as many previous turns as fit the context window
+                    if "chat_history" not in st.session_state:
+                        st.session_state.chat_history = store.get_turns(session_id)
+                    with span("fit_conversation"):
+                        context = fit_conversation(
+                            st.session_state.chat_history,
+                            sanitized_input,
+                            system_prompt=UI_CONFIG["system_prompt"],
+                            custom_config=custom_config,
+                            window=st.session_state.context_window
+                        )
+                    st.session_state.context_window = context["window"]
+                    prompt = context["prompt"]
+                    request_config = dict(custom_config, max_tokens=context["max_tokens"])
+                    context_note = f"📊 Prompt tokens: {estimate_tokens(sanitized_input, model, add_bos=False)} new, {context['prompt_tokens']} with history"
+                    if context["dropped_turns"] or context["compacted_turns"]:
+                        context_note += f" ({context['dropped_turns']} old turns dropped, {context['compacted_turns']} compacted)"
+                    st.caption(context_note)
+                    
+                    # Show the queue position while other sessions hold the model
+                    def show_queue_position(position: int, wait_seconds: float):
+                        placeholder.markdown(f"⏳ Waiting in queue: position {position}, about {format_response_time(wait_seconds)}")
+                    
+                    # Clicking Stop interrupts this run at the next token, which closes the
+                    # stream and kills llama-cli; the callback covers requests still queued
+                    st.button("⏹️ Stop", key="stop_generation", on_click=cancel_inference,
+                              args=(session_id,))
+                    
+                    # Run inference, rendering tokens as they arrive
+                    response = ""
+                    stats = {}
+                    try:
+                        stream = stream_llama_inference(prompt, request_config, session_id,
+                                                        stats=stats, on_wait=show_queue_position,
+                                                        question=sanitized_input)
+                        with closing(stream):
+                            for chunk in stream:
+                                response += chunk
+                                placeholder.markdown(response + "▌")
+                        response = response.strip()
+                    except InferenceError as e:
+                        response = f"Error: {e}"
+                    except (RerunException, StopException):
+                        # Stop reruns the script from inside the loop above; keep the
+                        # partial reply rather than losing the turn. The marker goes in
+                        # the response time caption, which is never sent to the model
+                        if response.strip():
+                            turn = (sanitized_input, response.strip(),
+                                    f"{format_response_time(time.time() - start_time)} · ⏹️ stopped")
+                            st.session_state.chat_history.append(turn)
+                            store.append_turn(session_id, *turn, model=model)
+                        raise
+                    placeholder.markdown(response)
+                    if "semantic_similarity" in stats:
+                        st.caption(f"🧠 Answer to a similar question (similarity {stats['semantic_similarity']:.2f})")
+                    if stats.get("stop_reason") == "length":
+                        st.caption("✂️ Stopped at the max tokens limit")
+                    
+                    response_time = time.time() - start_time
+                    formatted_time = format_response_time(response_time)
+                    st.caption(f"Response time: {formatted_time}")
+                    
+                    # Add to chat history
+                    turn = (sanitized_input, response, formatted_time)
+                    st.session_state.chat_history.append(turn)
+                    store.append_turn(session_id, *turn, model=model)
+            
+            if trace and trace.path:
+                st.download_button(
+                    "⬇️ Download trace",
+                    trace.path.read_bytes(),
+                    file_name=trace.path.name,
+                    mime="application/json",
+                    help="Open in chrome://tracing or ui.perfetto.dev"
+                )
+    
+    # Clear chat button
+    if store.count_turns(session_id):
+        if st.button("🗑️ Clear Chat History"):
+            start_new_conversation()
+            st.rerun()
+
+def main():
+    """Main application function"""
+    # Setup environment
+    setup_environment()
+    start_metrics_server()
+    
+    # Configure Streamlit page
+    st.set_page_config(
+        page_title=UI_CONFIG["page_title"],
+        page_icon=UI_CONFIG["page_icon"],
+        layout=UI_CONFIG["layout"],
+        initial_sidebar_state=UI_CONFIG["initial_sidebar_state"]
+    )
+    
+    # Custom CSS for better styling
+    st.markdown("""
+    <style>
+    .main-header {
+        font-size: 3rem;
+        font-weight: bold;
+        color: #FF6B6B;
+        text-align: center;
+        margin-bottom: 2rem;
+    }
+    .stTextArea textarea {
+        border-radius: 10px;
+        border: 2px solid #e0e0e0;
+    }
+    .stButton button {
+        border-radius: 10px;
+        background-color: #FF6B6B;
+        color: white;
+        font-weight: bold;
+        padding: 0.5rem 2rem;
+    }
+    .stButton button:hover {
+        background-color: #FF5252;
+    }
+    .info-box {
+        background-color: #f0f2f6;
+        padding: 1rem;
+        border-radius: 10px;
+        border-left: 4px solid #FF6B6B;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+    
+    # Header
+    st.markdown('<h1 class="main-header">🦙 Llama 4 Chat Interface</h1>', unsafe_allow_html=True)
+    # Filled in once the sidebar has picked the model
+    subtitle = st.empty()
+    
+    # Sidebar
+    with st.sidebar:
+        st.header("⚙️ Settings")
+        
+        # System validation
+        st.subheader("🔍 System Check")
+        try:
+            validate_system_requirements()
+            st.success("✅ System requirements met")
+        except Exception as e:
+            st.error(f"❌ System check failed: {e}")
+            return
+        
+        # Model selection and validation
+        model = st.selectbox(
+            "🤖 Model",
+            list(MODEL_REGISTRY),
+            format_func=lambda key: f"{MODEL_REGISTRY[key]['name']} · {MODEL_REGISTRY[key]['description']}",
+            help="Loaded models stay in memory until another one needs the room"
+        )
+        model_exists = validate_model_exists(model)
+        backend = get_backend()
+        llama_exists = backend.is_available()
+        
+        model_info = get_model_info(get_model_path(model))
+        # The quantization actually on disk, after any per-host variant choice
+        model_label = MODEL_REGISTRY[model]["name"]
+        if model_info.get("quant_type"):
+            model_label += f" ({model_info['quant_type']} quantized)"
+        subtitle.markdown(f"### Local AI Chat with {MODEL_REGISTRY[model]['name']}")
+        if model_exists:
+            st.success("✅ Model found")
+            st.caption(
+                f"{model_info['architecture']} · {model_info['quant_type']} · "
+                f"{model_info['file_size'] / (1024**3):.2f} GB · context {model_info['context_length']}"
+            )
+            # Page-cache residency: pages not resident are faulted in by the next request
+            warming = start_model_warmup(model)
+            residency = model_residency(model)
+            if residency:
+                state = " · warming up..." if warming else ""
+                locked = " · 🔒 pinned" if residency["locked"] else ""
+                st.caption(f"🔥 {residency['resident_fraction']:.0%} resident in RAM{locked}{state}")
+        elif model_info.get("file_size") is not None:
+            st.error(f"❌ Model file is corrupt: {model_info['error']}")
+            st.info(f"Run `python download.py --model {model}` to download the model again")
+        else:
+            st.error("❌ Model not found")
+            st.info(f"Run `python download.py --model {model}` to download the model")
+        
+        if llama_exists:
+            st.success(f"✅ Inference backend: {backend.name}")
+        elif backend.name == "in_process":
+            st.error("❌ llama-cpp-python not installed")
+            st.info("Run `pip install llama-cpp-python`")
+        else:
+            st.error("❌ llama.cpp not found")
+            st.info("Clone and build llama.cpp in the project directory")
+        
+        # Warm inference worker (loads the model once per process)
+        if model_exists and backend.name == "server":
+            from worker import get_worker
+            try:
+                with st.spinner("🔥 Loading model into the inference worker..."):
+                    worker_status = get_worker(model).status()
+                st.success(f"✅ Inference worker running (pid {worker_status['pid']})")
+            except Exception as e:
+                st.warning(f"⚠️ Inference worker unavailable: {e}")
+        elif model_exists and llama_exists and backend.name == "in_process":
+            try:
+                with st.spinner("🔥 Loading model into this process..."):
+                    backend.start(model)
+                st.success("✅ Model loaded in process")
+            except InferenceError as e:
+                st.warning(f"⚠️ In-process model unavailable: {e}")
+        
+        # Shared system-prompt state, evaluated once per model
+        if model_exists and llama_exists and backend.prompt_cache_kind:
+            with st.spinner("🧠 Precomputing the shared system prompt..."):
+                build_prefix_snapshots(backend.prompt_cache_kind, model)
+        
+        # Models kept loaded between requests
+        if backend.pool is not None:
+            pool_status = backend.pool.status()
+            st.caption(
+                f"🧠 Loaded models: {', '.join(pool_status['loaded']) or 'none'} "
+                f"({pool_status['used_gb']:.1f} GB)"
+            )
+        
+        # Response cache counters
+        cache = get_response_cache()
+        if cache:
+            cache_stats = cache.stats()
+            st.caption(f"💾 Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        semantic_cache = get_semantic_cache()
+        if semantic_cache:
+            semantic_stats = semantic_cache.stats()
+            st.caption(
+                f"🧠 Semantic cache: {semantic_stats['hits']} hits / {semantic_stats['misses']} misses, "
+                f"{semantic_stats['entries']} entries"
+            )
+        
+        # Inference queue
+        queue_status = get_scheduler().status()
+        st.caption(
+            f"🚦 Queue: {queue_status['running']}/{queue_status['max_concurrent']} running, "
+            f"{queue_status['queued']} waiting, {queue_status['rejected']} rejected"
+        )
+        
+        # System info
+        if st.checkbox("Show system information"):
+            sys_info = get_system_info()
+            st.json(sys_info)
+        
+        # Tracing
+        trace_next = st.checkbox("🔍 Trace next response", help="Record where the next response spends its time")
+        
+        # Generation parameters
+        st.subheader("🎛️ Generation Parameters")
+        temperature = st.slider("Temperature", 0.0, 1.0, 0.6, 0.1, 
+                              help="Controls randomness in generation")
+        top_p = st.slider("Top-p", 0.0, 1.0, 0.9, 0.05,
+                         help="Nucleus sampling parameter")
+        max_tokens = st.slider("Max tokens", 100, 4096, 2048, 100,
+                              help="Maximum number of tokens to generate")
+        
+        # Custom config
+        custom_config = {
+            "model": model,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens
+        }
+    
+    # Conversation, resumed from the ?c= link so a reload or restart keeps it
+    store = get_history_store()
+    requested = st.query_params.get("c", "")
+    if requested and requested != st.session_state.get("session_id") and store.count_turns(requested):
+        st.session_state.session_id = requested
+        st.session_state.pop("chat_history", None)
+        st.session_state.context_window = None
+        st.session_state.history_pages = 1
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    st.query_params["c"] = st.session_state.session_id
+    if "context_window" not in st.session_state:
+        st.session_state.context_window = None
+    if "history_pages" not in st.session_state:
+        st.session_state.history_pages = 1
+    
+    # Recent conversations
+    with st.sidebar:
+        st.subheader("💬 Conversations")
+        for conversation in store.list_conversations(HISTORY_CONFIG["recent_conversations"]):
+            title = " ".join(conversation["title"].split()).replace("[", "(").replace("]", ")") or "Untitled"
+            marker = "▶️ " if conversation["id"] == st.session_state.session_id else ""
+            st.markdown(f"{marker}[{title}](?c={conversation['id']}) · {conversation['turns']} turns")
+    
+    # Main chat interface
+    if not model_exists or not llama_exists:
+        st.error("⚠️ Please ensure both the model and llama.cpp are properly set up before using the chat interface.")
+        return
+    
+    # Display the latest page of chat history; older pages load on demand
+    history_end = store.count_turns(st.session_state.session_id)
+    history_start = max(0, history_end - HISTORY_CONFIG["page_size"] * st.session_state.history_pages)
+    if history_start:
+        st.button(f"⬆️ Show earlier messages ({history_start} more)", on_click=show_earlier_messages)
+    for turn in store.get_turns(st.session_state.session_id, history_start, history_end):
+        render_turn(*turn)
+    
+    # Input and generation rerun on their own, without the turns above
+    chat_turn(history_end, custom_config, model, trace_next)
+    
+    # Footer
+    st.markdown("---")
+    st.markdown(f"""
+    <div style='text-align: center; color: #666;'>
+        <p>Built with ❤️ using Streamlit and llama.cpp</p>
+        <p>Model: {html.escape(model_label)}</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""
+Inference backends for the Llama 4 Chat Interface
+
+Every request admitted by the scheduler is handed to one backend:
+
+- cli: spawns llama-cli per prompt and parses its output
+- server: streams from the persistent llama-server worker
+- in_process: llama-cpp-python, with the model mmapped in this process
+- fake: deterministic echo without a model, for tests
+
+BACKEND_CONFIG["backend"] (or the LLAMA_BACKEND environment variable)
+selects one; "auto" uses llama-server when it is built and llama-cli
+otherwise.
+"""
+
+import codecs
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional, Dict, Any, Iterator, List
+
+from config import BACKEND_CONFIG, SERVER_CONFIG, DEFAULT_MODEL, get_model_path, get_llama_cpp_path
+from metrics import MODEL_LOAD_SECONDS
+from model_pool import ModelPool
+from prefix_cache import find_prefix_snapshot
+from tracing import span, add_timing_spans, now_us
+from utils import (
+    CHAT_FORMATS, InferenceError, InferenceTimeoutError, get_chat_format,
+    get_session_cache_path, parse_llama_timings, resolve_inference_config,
+    validate_llama_cpp_exists, validate_llama_server_exists
+)
+
+logger = logging.getLogger(__name__)
+
+class InferenceBackend:
+    """
+    Interface of an inference backend.
+
+    Attributes:
+        name: Backend name, also the metrics label
+        prompt_cache_kind: Kind of session prompt-cache file the backend
+            keeps ("cli" or "slot"), or None when it keeps none
+        pool: Models the backend keeps loaded, or None when it keeps none
+    """
+
+    name = "base"
+    prompt_cache_kind: Optional[str] = None
+    pool: Optional[ModelPool] = None
+
+    def is_available(self) -> bool:
+        """Check that the backend can run here"""
+        return True
+
+    def max_concurrency(self) -> Optional[int]:
+        """Requests the backend can run at once, or None to size from cores and RAM"""
+        return None
+
+    def start(self, model: Optional[str] = None) -> None:
+        """Load a model (MODEL_REGISTRY key) ahead of its first request, where that applies"""
+
+    def stream(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None,
+               stats: Optional[Dict[str, Any]] = None,
+               cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Stream a completion.
+
+        Args:
+            prompt: Formatted prompt
+            config: Resolved inference configuration
+            session_id: Optional chat session whose prompt cache should be reused
+            stats: Optional dictionary receiving the llama.cpp timings
+            cancel_event: Optional flag that stops generation when set
+
+        Yields:
+            Chunks of generated text
+
+        Raises:
+            InferenceTimeoutError: If the backend does not finish in time
+            InferenceError: If the backend fails
+        """
+        raise NotImplementedError
+
+def build_cli_command(config: Dict[str, Any], prompt_path: str) -> List[str]:
+    """
+    Build the llama-cli command line for a resolved config.
+
+    Args:
+        config: Resolved inference configuration
+        prompt_path: File holding the prompt
+
+    Returns:
+        Command as a list of arguments
+    """
+    return [
+        str(get_llama_cpp_path()),
+        "--model", str(get_model_path(config.get("model"))),
+        "--threads", str(config["threads"]),
+        "--ctx-size", str(config["ctx_size"]),
+        "--batch-size", str(config["batch_size"]),
+        "--ubatch-size", str(config["ubatch_size"]),
+        "--n-gpu-layers", str(config["n_gpu_layers"]),
+        "-ot", config["gpu_layers_filter"],
+        "--seed", str(config["seed"]),
+        "--prio", str(config["priority"]),
+        "--temp", str(config["temperature"]),
+        "--min-p", str(config["min_p"]),
+        "--top-p", str(config["top_p"]),
+        "--repeat-penalty", str(config["repeat_penalty"]),
+        "-n", str(config["max_tokens"]),
+        "--no-display-prompt",
+        "--file", prompt_path
+    ]
+
+def _kill_on_cancel(process: subprocess.Popen, cancel_event: threading.Event) -> None:
+    """Kill llama-cli as soon as its request is cancelled"""
+    while process.poll() is None:
+        if cancel_event.wait(0.1):
+            process.kill()
+            return
+
+class CliBackend(InferenceBackend):
+    """Spawns llama-cli for every prompt"""
+
+    name = "cli"
+    prompt_cache_kind = "cli"
+
+    def is_available(self) -> bool:
+        return validate_llama_cpp_exists()
+
+    def stream(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None,
+               stats: Optional[Dict[str, Any]] = None,
+               cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        # Create temporary file for prompt
+        with span("write prompt file", chars=len(prompt)):
+            with tempfile.NamedTemporaryFile(delete=False, mode="w", suffix=".txt", encoding="utf-8") as tmp_prompt:
+                tmp_prompt.write(prompt)
+                tmp_prompt_path = tmp_prompt.name
+
+        with span("llama-cli"):
+            process = None
+            timer = None
+            session_cache = None
+            clean_exit = False
+            try:
+                # Build command
+                cmd = build_cli_command(config, tmp_prompt_path)
+                if session_id:
+                    session_cache = get_session_cache_path(session_id, "cli", config["model"])
+                    if not session_cache.exists():
+                        # A new session starts from the shared system-prompt state
+                        snapshot = find_prefix_snapshot(prompt, "cli", config["model"])
+                        if snapshot:
+                            shutil.copyfile(snapshot, session_cache)
+                    # Save prompt and generation so the next turn's prompt is a cache hit
+                    cmd += ["--prompt-cache", str(session_cache), "--prompt-cache-all"]
+                else:
+                    snapshot = find_prefix_snapshot(prompt, "cli", config["model"])
+                    if snapshot:
+                        cmd += ["--prompt-cache", str(snapshot), "--prompt-cache-ro"]
+
+                spawn_start = now_us()
+                with span("spawn"):
+                    process = subprocess.Popen(
+                        cmd,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        stdin=subprocess.DEVNULL
+                    )
+
+                # Drain stderr on a thread so a chatty llama.cpp cannot block stdout
+                stderr_lines = []
+                stderr_thread = threading.Thread(
+                    target=lambda: stderr_lines.extend(process.stderr.read().decode("utf-8", errors="replace").splitlines()),
+                    daemon=True
+                )
+                stderr_thread.start()
+
+                timed_out = threading.Event()
+                def kill_on_timeout():
+                    timed_out.set()
+                    process.kill()
+                timer = threading.Timer(300, kill_on_timeout)  # 5 minute timeout
+                timer.start()
+                if cancel_event is not None:
+                    threading.Thread(target=_kill_on_cancel, args=(process, cancel_event), daemon=True).start()
+
+                # Decode incrementally so multi-byte characters split across reads survive
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                while True:
+                    data = process.stdout.read1(4096)
+                    if not data:
+                        break
+                    text = decoder.decode(data)
+                    if text:
+                        yield text
+                tail = decoder.decode(b"", final=True)
+                if tail:
+                    yield tail
+
+                process.wait()
+                # A killed process has a negative return code
+                clean_exit = process.returncode == 0
+                stderr_thread.join(timeout=5)
+                timings = parse_llama_timings("\n".join(stderr_lines))
+                add_timing_spans(spawn_start, timings)
+                if stats is not None:
+                    stats.update(timings)
+
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if timed_out.is_set():
+                    logger.error("Inference timed out")
+                    raise InferenceTimeoutError("Inference timed out after 5 minutes")
+                if process.returncode != 0:
+                    stderr = "\n".join(stderr_lines)
+                    logger.error(f"llama.cpp error: {stderr}")
+                    raise InferenceError(stderr or f"llama.cpp exited with code {process.returncode}")
+
+            except InferenceError:
+                raise
+            except Exception as e:
+                logger.error(f"Inference error: {e}")
+                raise InferenceError(str(e)) from e
+            finally:
+                if timer:
+                    timer.cancel()
+                # Stop llama.cpp if the consumer abandoned the stream early
+                if process and process.poll() is None:
+                    process.kill()
+                    process.wait()
+                # --prompt-cache-all rewrites the session file in place, so a killed or
+                # failed run may have left it torn; the next turn starts without it
+                if session_cache is not None and not clean_exit:
+                    session_cache.unlink(missing_ok=True)
+                # Clean up temporary file
+                try:
+                    os.remove(tmp_prompt_path)
+                except OSError:
+                    pass
+
+class ServerBackend(InferenceBackend):
+    """Streams from the persistent llama-server worker"""
+
+    name = "server"
+    prompt_cache_kind = "slot"
+
+    def is_available(self) -> bool:
+        return SERVER_CONFIG["enabled"] and validate_llama_server_exists()
+
+    @property
+    def pool(self) -> ModelPool:
+        from worker import get_worker_pool
+        return get_worker_pool()
+
+    def max_concurrency(self) -> Optional[int]:
+        return max(1, SERVER_CONFIG["parallel"])
+
+    def start(self, model: Optional[str] = None) -> None:
+        from worker import get_worker
+        get_worker(model)
+
+    def stream(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None,
+               stats: Optional[Dict[str, Any]] = None,
+               cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        from worker import use_worker
+
+        try:
+            with use_worker(config["model"]) as worker:
+                yield from worker.stream(prompt, config, session_id, stats)
+        except Exception as e:
+            logger.error(f"Worker inference error: {e}")
+            # urllib wraps connect timeouts in URLError; read timeouts arrive bare
+            if isinstance(e, TimeoutError) or isinstance(getattr(e, "reason", None), TimeoutError):
+                raise InferenceTimeoutError(str(e)) from e
+            raise InferenceError(str(e)) from e
+
+def _token_timings(prompt_n: int, prompt_ms: float, predicted_n: int, predicted_ms: float) -> Dict[str, float]:
+    """Timings in the llama-server format for backends that measure their own"""
+    return {
+        "prompt_n": prompt_n,
+        "prompt_ms": prompt_ms,
+        "prompt_per_second": prompt_n * 1000 / prompt_ms if prompt_ms > 0 else 0.0,
+        "predicted_n": predicted_n,
+        "predicted_ms": predicted_ms,
+        "predicted_per_second": predicted_n * 1000 / predicted_ms if predicted_ms > 0 else 0.0
+    }
+
+class InProcessBackend(InferenceBackend):
+    """
+    llama-cpp-python binding inside this process.
+
+    Models are mmapped once and stay loaded, and requests need no process
+    spawn, prompt file or output parsing. Loaded models share the RAM
+    budget of a ModelPool. A llama.cpp context is not thread-safe, so
+    requests run one at a time. Evaluated prompt states are kept in a RAM
+    cache, so sessions taking turns still only evaluate the part of their
+    prompt that changed.
+
+    Load-time parameters (threads, ctx_size, GPU offload) are fixed when
+    a model is loaded; sampling parameters apply per request.
+    """
+
+    name = "in_process"
+
+    def __init__(self):
+        self.pool = ModelPool("llama_cpp", load=self._load_model, unload=self._unload_model)
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        try:
+            import llama_cpp  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def max_concurrency(self) -> Optional[int]:
+        return 1
+
+    def _load_model(self, model: str):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError as e:
+            raise InferenceError("llama-cpp-python is not installed, run `pip install llama-cpp-python`") from e
+
+        config = resolve_inference_config({"model": model})
+        logger.info(f"Loading {get_model_path(model)} in process")
+        start_time = time.time()
+        with span("load model in process", model=model):
+            try:
+                llama = Llama(
+                    model_path=str(get_model_path(model)),
+                    n_ctx=config["ctx_size"],
+                    n_threads=config["threads"],
+                    n_batch=config["batch_size"],
+                    n_ubatch=config["ubatch_size"],
+                    n_gpu_layers=config["n_gpu_layers"],
+                    seed=config["seed"],
+                    use_mmap=True,
+                    verbose=False
+                )
+            except Exception as e:
+                raise InferenceError(f"Could not load model: {e}") from e
+            llama.set_cache(LlamaRAMCache(capacity_bytes=BACKEND_CONFIG["state_cache_bytes"]))
+        load_seconds = time.time() - start_time
+        MODEL_LOAD_SECONDS.observe(load_seconds, backend=self.name)
+        logger.info(f"Model loaded in process in {load_seconds:.2f} seconds")
+        return llama
+
+    def _unload_model(self, llama) -> None:
+        # Frees the context and unmaps the weights; older bindings free on garbage collection
+        close = getattr(llama, "close", None)
+        if close:
+            close()
+
+    def start(self, model: Optional[str] = None) -> None:
+        with self._lock:
+            self.pool.acquire(model or DEFAULT_MODEL)
+            self.pool.release(model or DEFAULT_MODEL)
+
+    def stream(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None,
+               stats: Optional[Dict[str, Any]] = None,
+               cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        with self._lock, self.pool.use(config["model"]) as llama:
+            with span("llama_cpp completion"):
+                request_start = now_us()
+                start_time = time.time()
+                first_token_time = None
+                predicted_n = 0
+                try:
+                    prompt_n = len(llama.tokenize(prompt.encode("utf-8"), add_bos=True, special=True))
+                    completion = llama.create_completion(
+                        prompt,
+                        max_tokens=config["max_tokens"],
+                        temperature=config["temperature"],
+                        top_p=config["top_p"],
+                        min_p=config["min_p"],
+                        repeat_penalty=config["repeat_penalty"],
+                        seed=config["seed"],
+                        stop=config["stop"],
+                        stream=True
+                    )
+                    for event in completion:
+                        if cancel_event is not None and cancel_event.is_set():
+                            break
+                        text = event["choices"][0]["text"]
+                        if first_token_time is None:
+                            first_token_time = time.time()
+                        predicted_n += 1
+                        if text:
+                            yield text
+                except Exception as e:
+                    logger.error(f"In-process inference error: {e}")
+                    raise InferenceError(str(e)) from e
+                end_time = time.time()
+                first_token_time = first_token_time or end_time
+                timings = _token_timings(prompt_n, (first_token_time - start_time) * 1000,
+                                         predicted_n, (end_time - first_token_time) * 1000)
+                add_timing_spans(request_start, timings)
+                if stats is not None:
+                    stats.update(timings)
+
+class FakeBackend(InferenceBackend):
+    """Deterministic echo of the last user message, so tests need no model or binary"""
+
+    name = "fake"
+
+    def stream(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None,
+               stats: Optional[Dict[str, Any]] = None,
+               cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        header_start, header_end, eot = CHAT_FORMATS[get_chat_format(config.get("model"))]
+        text = prompt.rsplit(header_end, 2)[-2] if header_end in prompt else prompt
+        text = text.replace(eot, "").replace(f"{header_start}assistant", "").strip()
+        words = f"Echo: {text}".split()[:max(1, config["max_tokens"])]
+
+        request_start = now_us()
+        start_time = time.time()
+        predicted_n = 0
+        for i, word in enumerate(words):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            time.sleep(BACKEND_CONFIG["fake_token_delay"])
+            predicted_n += 1
+            yield word if i == 0 else " " + word
+        timings = _token_timings(max(1, len(prompt) // 4), 0.0, predicted_n, (time.time() - start_time) * 1000)
+        add_timing_spans(request_start, timings)
+        if stats is not None:
+            stats.update(timings)
+
+BACKENDS = {
+    "cli": CliBackend,
+    "server": ServerBackend,
+    "in_process": InProcessBackend,
+    "fake": FakeBackend
+}
+
+_backends: Dict[str, InferenceBackend] = {}
+_backends_lock = threading.Lock()
+
+def get_backend(name: Optional[str] = None) -> InferenceBackend:
+    """
+    Get the process-wide instance of a backend.
+
+    Args:
+        name: Backend name, BACKEND_CONFIG["backend"] by default
+
+    Returns:
+        The backend
+
+    Raises:
+        ValueError: If the name is not a known backend
+    """
+    name = name or BACKEND_CONFIG["backend"]
+    if name == "auto":
+        name = "server" if get_backend("server").is_available() else "cli"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of: auto, {', '.join(BACKENDS)}")
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
@@ -0,0 +1,235 @@
+"""
+Offline batch inference for the Llama 4 Chat Interface
+
+Reads prompts from a JSONL file and appends one JSON result per line:
+
+    {"id": "q1", "prompt": "Salom!", "system_prompt": "...", "config": {"max_tokens": 256}}
+
+Only "prompt" is required; "id" defaults to the line number and
+"config": {"model": ...} picks a MODEL_REGISTRY entry. Results
+already present in the output file are skipped, so an interrupted run
+resumes where it stopped.
+
+    python batch.py prompts.jsonl -o results.jsonl --concurrency 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, Set, TextIO
+
+from config import SERVER_CONFIG, setup_environment
+from backends import get_backend
+from utils import (
+    format_prompt,
+    get_chat_format,
+    stream_llama_inference,
+    estimate_tokens,
+    format_response_time,
+    InferenceError
+)
+
+logger = logging.getLogger(__name__)
+
+def read_prompts(input_path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Read prompt records from a JSONL file.
+
+    Args:
+        input_path: JSONL file, one object with a "prompt" field per line
+
+    Yields:
+        Prompt records with an "id"
+    """
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "prompt" not in record:
+                raise ValueError(f"{input_path}:{line_number}: missing 'prompt'")
+            record.setdefault("id", str(line_number))
+            yield record
+
+def load_completed_ids(output_path: Path) -> Set[str]:
+    """
+    Collect ids that already have a successful result in the output file.
+
+    Args:
+        output_path: Results file of a previous run
+
+    Returns:
+        Set of completed prompt ids
+    """
+    completed = set()
+    if not output_path.exists():
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from an interrupted run; the prompt is redone
+                continue
+            if "error" not in result:
+                completed.add(str(result["id"]))
+    return completed
+
+def trim_torn_line(output_path: Path) -> None:
+    """
+    Cut an unterminated last line left by an interrupted run.
+
+    Otherwise the next result would be appended to it and lost with it.
+
+    Args:
+        output_path: Results file of a previous run
+    """
+    if not output_path.exists():
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if not end:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        # Scan back block by block to the last complete line
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)
+
+def process_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run one prompt through format_prompt and the inference path.
+
+    Args:
+        record: Prompt record from read_prompts
+
+    Returns:
+        Result record for the output file
+    """
+    start_time = time.time()
+    result: Dict[str, Any] = {"id": record["id"]}
+    try:
+        if not isinstance(record["prompt"], str):
+            raise ValueError("'prompt' must be a string")
+        model = (record.get("config") or {}).get("model")
+        prompt = format_prompt(record["prompt"], record.get("system_prompt"), get_chat_format(model))
+        stats: Dict[str, Any] = {}
+        response = "".join(stream_llama_inference(prompt, record.get("config"), stats=stats)).strip()
+        result["response"] = response
+        # Prefer llama.cpp's own count; cached responses fall back to an estimate
+        tokens = stats.get("predicted_n")
+        result["tokens"] = int(tokens if tokens is not None else estimate_tokens(response, model, add_bos=False))
+    except InferenceError as e:
+        result["error"] = str(e)
+        result["tokens"] = 0
+    except Exception as e:
+        # A bad record (unknown model, non-string prompt, ...) fails alone, not the run
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["tokens"] = 0
+    result["seconds"] = round(time.time() - start_time, 3)
+    return result
+
+def write_result(output: TextIO, result: Dict[str, Any]) -> None:
+    """Append a result and flush it to disk so it survives an interruption"""
+    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+    output.flush()
+    if output is not sys.stdout:
+        os.fsync(output.fileno())
+
+def run_batch(input_path: Path, output_path: Optional[Path], concurrency: int) -> Dict[str, Any]:
+    """
+    Process every pending prompt with at most `concurrency` requests in flight.
+
+    Args:
+        input_path: JSONL prompt file
+        output_path: JSONL results file, or None for stdout (no resume)
+        concurrency: Maximum number of simultaneous inference requests
+
+    Returns:
+        Aggregate statistics for the run
+    """
+    if output_path:
+        trim_torn_line(output_path)
+    completed = load_completed_ids(output_path) if output_path else set()
+    if completed:
+        logger.info(f"Resuming: {len(completed)} prompts already done")
+
+    # Load the model once up front instead of inside the first request
+    get_backend().start()
+
+    stats = {"processed": 0, "skipped": len(completed), "errors": 0, "tokens": 0}
+    output = open(output_path, "a", encoding="utf-8") if output_path else sys.stdout
+    start_time = time.time()
+    lock = threading.Lock()
+
+    def record_result(result: Dict[str, Any]) -> None:
+        with lock:
+            write_result(output, result)
+            stats["processed"] += 1
+            stats["tokens"] += result["tokens"]
+            if "error" in result:
+                stats["errors"] += 1
+                logger.warning(f"Prompt {result['id']} failed: {result['error']}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            for record in read_prompts(input_path):
+                if str(record["id"]) in completed:
+                    continue
+                # Bound the number of queued prompts, not just running ones
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record_result(future.result())
+                pending.add(executor.submit(process_record, record))
+            for future in pending:
+                record_result(future.result())
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.time() - start_time
+    stats["seconds"] = round(elapsed, 3)
+    stats["tokens_per_second"] = round(stats["tokens"] / elapsed, 2) if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    """Main batch function"""
+    parser = argparse.ArgumentParser(description="Run JSONL prompts through the local Llama model")
+    parser.add_argument("input", type=Path, help="JSONL file with one prompt object per line")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="JSONL results file (appended to and used to resume); stdout if omitted")
+    parser.add_argument("-c", "--concurrency", type=int, default=SERVER_CONFIG["parallel"],
+                        help="Maximum simultaneous requests (default: llama-server slots)")
+    args = parser.parse_args()
+
+    setup_environment()
+
+    stats = run_batch(args.input, args.output, max(1, args.concurrency))
+    logger.info(
+        f"Processed {stats['processed']} prompts ({stats['errors']} errors, {stats['skipped']} skipped) "
+        f"in {format_response_time(stats['seconds'])}: {stats['tokens']} tokens, "
+        f"{stats['tokens_per_second']} tokens/s"
+    )
+    print(json.dumps(stats), file=sys.stderr)
+    sys.exit(1 if stats["errors"] else 0)
+
+if __name__ == "__main__":
+    main()
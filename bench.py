@@ -0,0 +1,338 @@
+"""
+Inference benchmark for the Llama 4 Chat Interface
+
+Drives the inference path with fixed prompt sets and records model-load
+time, prompt-eval and generation tokens/sec, time-to-first-token and
+latency percentiles. Results are written as JSON and can be compared
+against a stored baseline.
+
+    python bench.py --prompt-set short --runs 5 --output bench.json
+    python bench.py --baseline bench_baseline.json   # exit 1 on regression
+    python bench.py --stub                           # no model needed (CI)
+    python bench.py --compare-draft                  # speculative decoding speedup
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from config import (
+    PROJECT_ROOT, SERVER_CONFIG, BACKEND_CONFIG, RESPONSE_CACHE_CONFIG,
+    MODEL_REGISTRY, DEFAULT_MODEL, setup_environment, get_draft_model_config
+)
+from utils import (
+    format_prompt, get_chat_format, resolve_inference_config, stream_llama_inference,
+    use_server_worker, InferenceError
+)
+from backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+PROMPT_SETS = {
+    "short": [
+        "Salom! Qalaysiz?",
+        "What is the capital of Uzbekistan?",
+        "Name three prime numbers.",
+        "Translate 'good morning' into Uzbek."
+    ],
+    "medium": [
+        "Explain the difference between a process and a thread in a few paragraphs.",
+        "Python dasturlash tilini o'rganishni boshlash uchun qanday maslahat berasiz?",
+        "Write a Python function that checks whether a string is a palindrome, with a docstring.",
+        "Summarize the main causes and consequences of the industrial revolution."
+    ],
+    "long": [
+        "Write a detailed tutorial on building a REST API with Flask, covering routing, "
+        "request validation, error handling, database access with SQLAlchemy, authentication "
+        "and deployment. Include code samples for every step.",
+        "Sun'iy intellekt kelajakda ta'lim, tibbiyot, qishloq xo'jaligi va transport sohalariga "
+        "qanday ta'sir qiladi? Har bir soha uchun ijobiy va salbiy tomonlarini batafsil yozing."
+    ]
+}
+
+# Metrics compared against the baseline: name -> True if higher is better
+BASELINE_METRICS = {
+    "load_seconds": False,
+    "prompt_tokens_per_second": True,
+    "generation_tokens_per_second": True,
+    "ttft_p50": False,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "draft_acceptance_rate": True
+}
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Linear-interpolated percentile.
+
+    Args:
+        values: Samples
+        pct: Percentile in [0, 100]
+
+    Returns:
+        Percentile value, or None for no samples
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def use_stub_backend() -> None:
+    """Route inference to the deterministic fake llama-cli so no model is needed"""
+    os.environ["LLAMA_CLI_PATH"] = str(PROJECT_ROOT / "scripts" / "fake_llama_cli.py")
+    SERVER_CONFIG["enabled"] = False
+    BACKEND_CONFIG["backend"] = "cli"
+
+def measure_load_time(model: Optional[str] = None) -> Optional[float]:
+    """
+    Start the llama-server worker and report how long the model took to load.
+
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        Load time in seconds, or None when running on llama-cli
+    """
+    if not use_server_worker():
+        return None
+    from worker import get_worker, shutdown_worker
+    # Restart so the measurement includes the load, not a warm worker
+    shutdown_worker(model or DEFAULT_MODEL)
+    return get_worker(model).load_seconds
+
+def run_request(prompt: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run one prompt and collect its latency and llama.cpp timings.
+
+    Args:
+        prompt: User message from a prompt set
+        config: Inference configuration overrides
+
+    Returns:
+        Per-request measurements
+    """
+    stats: Dict[str, Any] = {}
+    start_time = time.time()
+    try:
+        prompt = format_prompt(prompt, chat_format=get_chat_format(config.get("model")))
+        for _ in stream_llama_inference(prompt, config, stats=stats):
+            pass
+        error = None
+    except InferenceError as e:
+        error = str(e)
+    stats["latency_seconds"] = time.time() - start_time
+    if error:
+        stats["error"] = error
+    return stats
+
+def summarize(samples: List[Dict[str, Any]], load_seconds: Optional[float]) -> Dict[str, Any]:
+    """
+    Aggregate per-request measurements.
+
+    Args:
+        samples: Results of run_request
+        load_seconds: Worker model-load time, if measured
+
+    Returns:
+        Summary metrics
+    """
+    ok = [s for s in samples if "error" not in s]
+    latencies = [s["latency_seconds"] for s in ok]
+    ttfts = [s["ttft_seconds"] for s in ok if "ttft_seconds" in s]
+    prompt_n = sum(s.get("prompt_n", 0) for s in ok)
+    prompt_ms = sum(s.get("prompt_ms", 0.0) for s in ok)
+    predicted_n = sum(s.get("predicted_n", 0) for s in ok)
+    predicted_ms = sum(s.get("predicted_ms", 0.0) for s in ok)
+    cli_loads = [s["load_ms"] / 1000 for s in ok if "load_ms" in s]
+    draft_n = sum(s.get("draft_n", 0) for s in ok)
+    draft_accepted = sum(s.get("draft_n_accepted", 0) for s in ok)
+
+    if load_seconds is None and cli_loads:
+        # llama-cli loads the model on every request
+        load_seconds = statistics.mean(cli_loads)
+
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "load_seconds": load_seconds,
+        "prompt_tokens": prompt_n,
+        "generated_tokens": predicted_n,
+        "prompt_tokens_per_second": prompt_n * 1000 / prompt_ms if prompt_ms else None,
+        "generation_tokens_per_second": predicted_n * 1000 / predicted_ms if predicted_ms else None,
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "draft_tokens": draft_n,
+        "draft_acceptance_rate": draft_accepted / draft_n if draft_n else None
+    }
+
+def compare_to_baseline(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Find metrics that regressed by more than the tolerance.
+
+    Args:
+        summary: Current summary
+        baseline: Summary from a previous run
+        tolerance: Allowed relative regression (0.1 = 10%)
+
+    Returns:
+        Human-readable descriptions of each regression
+    """
+    regressions = []
+    for name, higher_is_better in BASELINE_METRICS.items():
+        current, previous = summary.get(name), baseline.get(name)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{name}: {previous:.3f} -> {current:.3f} ({change:+.1%})")
+    return regressions
+
+def compare_speculative(with_draft: Dict[str, Any], without_draft: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Speedup of speculative decoding over plain generation.
+
+    Args:
+        with_draft: Summary of requests that used the draft model
+        without_draft: Summary of the same requests without it
+
+    Returns:
+        Acceptance rate, both generation speeds and their ratio
+    """
+    with_tps = with_draft["generation_tokens_per_second"]
+    without_tps = without_draft["generation_tokens_per_second"]
+    return {
+        "draft_acceptance_rate": with_draft["draft_acceptance_rate"],
+        "generation_tokens_per_second": with_tps,
+        "generation_tokens_per_second_without_draft": without_tps,
+        "speedup": with_tps / without_tps if with_tps and without_tps else None
+    }
+
+def run_benchmark(prompt_set: str, runs: int, warmup: int, max_tokens: int,
+                  model: Optional[str] = None, compare_draft: bool = False) -> Dict[str, Any]:
+    """
+    Run the prompt set `runs` times after `warmup` unrecorded passes.
+
+    Args:
+        prompt_set: Key of PROMPT_SETS
+        runs: Recorded passes over the prompt set
+        warmup: Unrecorded passes over the prompt set
+        max_tokens: Generation limit per request
+        model: MODEL_REGISTRY key, the default model when None
+        compare_draft: Also run every prompt with speculative decoding off
+            and report the speedup
+
+    Returns:
+        Benchmark result with environment, summary and raw samples
+    """
+    prompts = PROMPT_SETS[prompt_set]
+    model = model or DEFAULT_MODEL
+    config = {"model": model, "max_tokens": max_tokens}
+    plain_config = dict(config, speculative=False)
+    load_seconds = measure_load_time(model)
+
+    for _ in range(warmup):
+        for prompt in prompts:
+            run_request(prompt, config)
+
+    # With and without the draft alternate, so both see the same machine state
+    samples = []
+    plain_samples = []
+    for run in range(runs):
+        for prompt in prompts:
+            sample = run_request(prompt, config)
+            samples.append(sample)
+            logger.info(f"run {run + 1}/{runs}: {sample['latency_seconds']:.2f}s")
+            if compare_draft:
+                plain_sample = run_request(prompt, plain_config)
+                plain_samples.append(plain_sample)
+                logger.info(f"run {run + 1}/{runs} without draft: {plain_sample['latency_seconds']:.2f}s")
+
+    resolved = resolve_inference_config(config)
+    draft_config = get_draft_model_config(model)
+    summary = summarize(samples, load_seconds)
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "model": MODEL_REGISTRY[model]["name"],
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "threads": resolved["threads"],
+            "ctx_size": resolved["ctx_size"],
+            "server": SERVER_CONFIG["enabled"],
+            "backend": get_backend().name,
+            "draft_model": draft_config["name"] if draft_config and resolved["speculative"] else None,
+            "draft_max": resolved["draft_max"]
+        },
+        "prompt_set": prompt_set,
+        "runs": runs,
+        "summary": summary,
+        "samples": samples
+    }
+    if compare_draft:
+        plain_summary = summarize(plain_samples, None)
+        result["summary_without_draft"] = plain_summary
+        result["speculative"] = compare_speculative(summary, plain_summary)
+        result["samples_without_draft"] = plain_samples
+    return result
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark local Llama inference")
+    parser.add_argument("--prompt-set", choices=sorted(PROMPT_SETS), default="short")
+    parser.add_argument("--model", choices=list(MODEL_REGISTRY), default=DEFAULT_MODEL)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--output", type=Path, default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against this results JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="Write results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression")
+    parser.add_argument("--stub", action="store_true", help="Use the fake llama-cli instead of a real model")
+    parser.add_argument("--compare-draft", action="store_true",
+                        help="Also run every prompt without the draft model and report the speculative decoding speedup")
+    args = parser.parse_args()
+
+    setup_environment()
+    # Repeated prompts must reach the model, not the response cache
+    RESPONSE_CACHE_CONFIG["enabled"] = False
+    if args.stub:
+        use_stub_backend()
+
+    result = run_benchmark(args.prompt_set, args.runs, args.warmup, args.max_tokens, args.model,
+                           args.compare_draft)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding="utf-8")
+    print(json.dumps(result["summary"], indent=2))
+    if "speculative" in result:
+        print(json.dumps({"speculative": result["speculative"]}, indent=2))
+
+    if args.baseline and args.save_baseline:
+        args.baseline.write_text(output, encoding="utf-8")
+        logger.info(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_to_baseline(result["summary"], baseline["summary"], args.tolerance)
+        if regressions:
+            print("Regressions against baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print("No regressions against baseline", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
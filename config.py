@@ -1,107 +1,385 @@
-"""
-Configuration settings for the Llama 4 Chat Interface
-"""
-
-import os
-from pathlib import Path
-
-# Project paths
-PROJECT_ROOT = Path(__file__).parent
-MODELS_DIR = PROJECT_ROOT / "llama_models"
-LLAMA_CPP_DIR = PROJECT_ROOT / "llama.cpp"
-
-# Model configuration
-MODEL_CONFIG = {
-    "name": "Llama-4-Scout-17B",
-    "repo_id": "unsloth/Llama-4-Scout-17B-16E-Instruct-GGUF",
-    "file_pattern": "*IQ2_XXS*",
-    "path": MODELS_DIR / "Llama-4-Scout-17B" / "Llama-4-Scout-17B-16E-Instruct-UD-IQ2_XXS.gguf"
-}
-
-# Llama.cpp inference parameters
-INFERENCE_CONFIG = {
-    "threads": 16,
-    "ctx_size": 16384,
-    "n_gpu_layers": 99,
-    "gpu_layers_filter": ".ffn_.*_exps.=CPU",
-    "seed": 42,
-    "priority": 3,
-    "temperature": 0.6,
-    "min_p": 0.01,
-    "top_p": 0.9,
-    "repeat_penalty": 1.1,
-    "max_tokens": 2048
-}
-
-# Streamlit UI configuration
-UI_CONFIG = {
-    "page_title": "🦙 Llama 4 Chat",
-    "page_icon": "🦙",
-    "layout": "wide",
-    "initial_sidebar_state": "expanded",
-    "text_area_height": 200,
-    "placeholder_text": "Ask me anything...",
-    "theme": {
-        "primaryColor": "#FF6B6B",
-        "backgroundColor": "#FFFFFF",
-        "secondaryBackgroundColor": "#F0F2F6",
-        "textColor": "#262730"
-    }
-}
-
-# Environment variables
-ENV_VARS = {
-    "HF_HUB_ENABLE_HF_TRANSFER": "1",
-    "TOKENIZERS_PARALLELISM": "false"
-}
-
-# System requirements
-SYSTEM_REQUIREMENTS = {
-    "min_ram_gb": 16,
-    "recommended_ram_gb": 32,
-    "min_python_version": "3.8",
-    "supported_platforms": ["linux", "darwin", "win32"]
-}
-
-# Logging configuration
-LOGGING_CONFIG = {
-    "level": "INFO",
-    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    "file": "llama_chat.log"
-}
-
-def setup_environment():
-    """Set up environment variables"""
-    for key, value in ENV_VARS.items():
-        os.environ[key] = value
-
-def validate_system_requirements():
-    """Validate system requirements"""
-    import sys
-    import psutil
-    
-    # Check Python version
-    if sys.version_info < (3, 8):
-        raise RuntimeError(f"Python 3.8+ required, got {sys.version}")
-    
-    # Check available RAM
-    ram_gb = psutil.virtual_memory().total / (1024**3)
-    if ram_gb < SYSTEM_REQUIREMENTS["min_ram_gb"]:
-        raise RuntimeError(f"At least {SYSTEM_REQUIREMENTS['min_ram_gb']}GB RAM required, got {ram_gb:.1f}GB")
-    
-    # Check platform
-    if sys.platform not in SYSTEM_REQUIREMENTS["supported_platforms"]:
-        print(f"Warning: Platform {sys.platform} may not be fully supported")
-
-def get_model_path():
-    """Get the model path, creating directories if needed"""
-    model_path = MODEL_CONFIG["path"]
-    model_path.parent.mkdir(parents=True, exist_ok=True)
-    return model_path
-
-def get_llama_cpp_path():
-    """Get the llama.cpp executable path"""
-    if os.name == 'nt':  # Windows
-        return LLAMA_CPP_DIR / "llama-cli.exe"
-    else:  # Unix-like
-        return LLAMA_CPP_DIR / "llama-cli" 
\ No newline at end of file
+"""
+Configuration settings for the Llama 4 Chat Interface
+"""
+
+import os
+import json
+import socket
+from pathlib import Path
+
+# Project paths
+PROJECT_ROOT = Path(__file__).parent
+MODELS_DIR = PROJECT_ROOT / "llama_models"
+LLAMA_CPP_DIR = PROJECT_ROOT / "llama.cpp"
+CACHE_DIR = PROJECT_ROOT / "cache"
+PROMPT_CACHE_DIR = CACHE_DIR / "prompt_cache"
+PROFILES_DIR = PROJECT_ROOT / "profiles"
+
+# Model registry: the GGUF models the chat can switch between. "inference"
+# holds per-model defaults on top of INFERENCE_CONFIG; "chat_format" names
+# the prompt template (see utils.CHAT_FORMATS); "draft" names the
+# DRAFT_MODELS entry used for speculative decoding.
+MODEL_REGISTRY = {
+    "scout-17b": {
+        "name": "Llama-4-Scout-17B",
+        "description": "Best answers, for hard questions",
+        "repo_id": "unsloth/Llama-4-Scout-17B-16E-Instruct-GGUF",
+        "file_pattern": "*IQ2_XXS*",
+        "path": MODELS_DIR / "Llama-4-Scout-17B" / "Llama-4-Scout-17B-16E-Instruct-UD-IQ2_XXS.gguf",
+        "chat_format": "llama4",
+        # No small Llama 4 exists; llama.cpp translates tokens between the two vocabularies
+        "draft": "llama-3.2-1b",
+        "inference": {}
+    },
+    "llama-3.2-3b": {
+        "name": "Llama-3.2-3B-Instruct",
+        "description": "Quick replies",
+        "repo_id": "unsloth/Llama-3.2-3B-Instruct-GGUF",
+        "file_pattern": "*Q4_K_M*",
+        "path": MODELS_DIR / "Llama-3.2-3B" / "Llama-3.2-3B-Instruct-Q4_K_M.gguf",
+        "chat_format": "llama3",
+        "draft": "llama-3.2-1b",
+        "inference": {
+            "ctx_size": 8192,
+            "threads": 8,
+            "stop": ["<|eot_id|>", "<|start_header_id|>"]
+        }
+    }
+}
+DEFAULT_MODEL = "scout-17b"
+
+# Small models that draft tokens for a larger one to verify in a single batch
+DRAFT_MODELS = {
+    "llama-3.2-1b": {
+        "name": "Llama-3.2-1B-Instruct",
+        "repo_id": "unsloth/Llama-3.2-1B-Instruct-GGUF",
+        "file_pattern": "*Q4_K_M*",
+        "path": MODELS_DIR / "Llama-3.2-1B" / "Llama-3.2-1B-Instruct-Q4_K_M.gguf"
+    }
+}
+
+# Model configuration (the default model)
+MODEL_CONFIG = MODEL_REGISTRY[DEFAULT_MODEL]
+
+# Model download (parallel HTTP range requests against the Hugging Face Hub)
+DOWNLOAD_CONFIG = {
+    "endpoint": os.environ.get("HF_ENDPOINT", "https://huggingface.co"),
+    "revision": "main",
+    "connections": 8,
+    "chunk_size": 16 * 1024**2,  # Unit of parallelism and of resume
+    "max_bytes_per_second": None,  # Bandwidth cap shared by all connections, None for unlimited
+    "timeout": 60,
+    "retries": 5,
+    "report_interval": 5  # Seconds between throughput log lines
+}
+
+# Llama.cpp inference parameters
+INFERENCE_CONFIG = {
+    "threads": 16,
+    "ctx_size": 16384,
+    "batch_size": 2048,
+    "ubatch_size": 512,
+    "n_gpu_layers": 99,
+    "gpu_layers_filter": ".ffn_.*_exps.=CPU",
+    "seed": 42,
+    "priority": 3,
+    "temperature": 0.6,
+    "min_p": 0.01,
+    "top_p": 0.9,
+    "repeat_penalty": 1.1,
+    "max_tokens": 2048,
+    "stop": ["<|eot|>", "<|header_start|>"],  # Generation ends at the first of these
+    # Speculative decoding with the model's draft (llama-server; needs the draft downloaded)
+    "speculative": True,
+    "draft_max": 16,  # Tokens drafted per step
+    "draft_min": 2,  # Shorter drafts are not worth verifying
+    "draft_p_min": 0.75,  # Drafting stops at a token the draft model is less sure of
+    "draft_gpu_layers": 99
+}
+
+# Context window budgeting for long conversations
+CONTEXT_CONFIG = {
+    "safety_margin": 64,  # Tokens kept free for BOS and template overhead
+    "min_generation_tokens": 256,
+    "keep_recent_turns": 2,  # Never compacted
+    "compact_tokens": 256,  # Per message, for compacted old turns
+    "low_water": 0.75  # Fraction of the prompt budget to slide down to
+}
+
+# Hardware auto-tuning (python tune.py)
+TUNING_CONFIG = {
+    "min_ctx_size": 4096,
+    "max_ctx_size": 32768,
+    "ram_headroom_gb": 4,  # Left free for the OS and the Streamlit process
+    "batch_sizes": [512, 1024, 2048],
+    "ubatch_sizes": [256, 512],
+    "prompt_tokens": 512,  # Calibration prompt length
+    "gen_tokens": 64,  # Calibration generation length
+    "repetitions": 2
+}
+
+# Inference backend: "auto" (llama-server when built, else llama-cli), "cli",
+# "server", "in_process" (llama-cpp-python) or "fake" (no model, for tests)
+BACKEND_CONFIG = {
+    "backend": os.environ.get("LLAMA_BACKEND", "auto"),
+    "state_cache_bytes": 2 * 1024**3,  # in_process: evaluated prompt states kept in RAM
+    "fake_token_delay": 0.005  # fake: seconds per generated word
+}
+
+# Persistent llama-server worker (keeps the model loaded between requests)
+SERVER_CONFIG = {
+    "enabled": True,
+    "host": "127.0.0.1",
+    "port": 8080,
+    "parallel": 1,  # Concurrent slots; llama-server splits ctx_size between them
+    "slot_save_path": PROMPT_CACHE_DIR,  # Per-session KV snapshots
+    "startup_timeout": 600,  # Loading a multi-GB GGUF can take minutes
+    "health_timeout": 2,
+    "request_timeout": 300,
+    "max_restarts": 3,
+    "log_file": PROJECT_ROOT / "llama_server.log"
+}
+
+# Loaded models (llama-server workers, in-process models), evicted least
+# recently used first when the next one would not fit
+MODEL_POOL_CONFIG = {
+    "ram_budget_gb": None,  # None uses the available RAM minus the headroom
+    "ram_headroom_gb": 4
+}
+
+# Model page-cache warm-up at startup, so the first request does not fault the GGUF in
+RESIDENCY_CONFIG = {
+    "prewarm": True,
+    "mlock": False,  # Pin the model in RAM; needs a memlock limit (ulimit -l) of at least its size
+    "ram_headroom_gb": 4,  # Only pin when this much stays available afterwards
+    "chunk_bytes": 64 * 1024**2
+}
+
+# Admission control for concurrent inference requests
+SCHEDULER_CONFIG = {
+    "max_concurrent": None,  # None sizes it from cores, RAM and server slots
+    "max_queue": 16,
+    "max_queued_per_session": 1,
+    "max_wait_seconds": 600,  # Reject when the estimated wait is longer
+    "default_service_seconds": 30,  # Initial per-request estimate, refined as requests finish
+    "ram_headroom_gb": 4,
+    "progress_interval": 0.5  # Seconds between queue position updates
+}
+
+# Shared KV snapshots of common prompt prefixes. Only system prompts are
+# shared: set UI_CONFIG["system_prompt"] or list them here to turn it on
+PREFIX_CACHE_CONFIG = {
+    "enabled": True,
+    "system_prompts": []  # Shared besides UI_CONFIG's, e.g. ones used by batch jobs
+}
+
+# OpenAI-compatible HTTP API (python api.py)
+API_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8000,
+    "request_timeout": 300,  # Seconds per request, queueing included
+    "keepalive_timeout": 15,  # Idle seconds before a connection is closed
+    "max_body_bytes": 1024**2,
+    "inference_threads": None  # Threads running blocking inference steps, None for running + queued requests
+}
+
+# Prometheus metrics endpoint
+METRICS_CONFIG = {
+    "enabled": True,
+    "host": "127.0.0.1",
+    "port": 9101
+}
+
+# Request tracing (Chrome trace-event JSON)
+TRACING_CONFIG = {
+    "enabled": True,
+    "sample_rate": 0.0,  # Fraction of requests traced automatically; the UI can trace a chosen turn
+    "output_dir": CACHE_DIR / "traces",
+    "max_files": 200
+}
+
+# Cache of completed responses for fixed-seed generations
+RESPONSE_CACHE_CONFIG = {
+    "enabled": True,
+    "memory_entries": 256,
+    "disk_entries": 10000,
+    "ttl_seconds": 7 * 24 * 3600,
+    "db_path": CACHE_DIR / "responses.sqlite3"
+}
+
+# Cache of responses to paraphrased questions asked in the same context
+SEMANTIC_CACHE_CONFIG = {
+    "enabled": True,
+    "threshold": 0.9,  # Cosine similarity a question needs to reuse an answer (numbers and names must also match)
+    "capacity": 4096,  # Entries; the least recently used one is replaced when full
+    "dim": 1024,  # Hashed n-gram embedding size
+    "ngram": 3,  # Character n-gram length
+    "ttl_seconds": 7 * 24 * 3600,
+    "dir": CACHE_DIR / "semantic"
+}
+
+# Persistent chat history
+HISTORY_CONFIG = {
+    "db_path": CACHE_DIR / "history.sqlite3",
+    "page_size": 20,  # Turns rendered at once; older pages load on demand
+    "title_chars": 60,  # Conversation titles are the start of the first message
+    "recent_conversations": 10
+}
+
+# Streamlit UI configuration
+UI_CONFIG = {
+    "page_title": "🦙 Llama 4 Chat",
+    "page_icon": "🦙",
+    "layout": "wide",
+    "initial_sidebar_state": "expanded",
+    "text_area_height": 200,
+    "placeholder_text": "Ask me anything...",
+    # Sent at the start of every conversation. None sends no system prompt,
+    # which also leaves PREFIX_CACHE_CONFIG with nothing to precompute
+    "system_prompt": None,
+    "theme": {
+        "primaryColor": "#FF6B6B",
+        "backgroundColor": "#FFFFFF",
+        "secondaryBackgroundColor": "#F0F2F6",
+        "textColor": "#262730"
+    }
+}
+
+# Quantization variant selection in download.py (see `python download.py --list-quants`)
+QUANT_CONFIG = {
+    "ram_headroom_gb": 8,  # Left for the OS and the app once the model is loaded
+    "max_weights_gb": None,  # Speed cap: every generated token reads all the weights; None for no cap
+    "kv_fallback_gb": 2  # KV cache assumed when no variant is on disk to read the model's shape from
+}
+
+# Environment variables
+ENV_VARS = {
+    "HF_HUB_ENABLE_HF_TRANSFER": "1",
+    "TOKENIZERS_PARALLELISM": "false"
+}
+
+# System requirements
+SYSTEM_REQUIREMENTS = {
+    "min_ram_gb": 16,
+    "recommended_ram_gb": 32,
+    "min_python_version": "3.8",
+    "supported_platforms": ["linux", "darwin", "win32"]
+}
+
+# Logging configuration
+LOGGING_CONFIG = {
+    "level": "INFO",
+    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    "file": "llama_chat.log"
+}
+
+def setup_environment():
+    """Set up environment variables"""
+    for key, value in ENV_VARS.items():
+        os.environ[key] = value
+
+def validate_system_requirements():
+    """Validate system requirements"""
+    import sys
+    import psutil
+    
+    # Check Python version
+    if sys.version_info < (3, 8):
+        raise RuntimeError(f"Python 3.8+ required, got {sys.version}")
+    
+    # Check available RAM
+    ram_gb = psutil.virtual_memory().total / (1024**3)
+    if ram_gb < SYSTEM_REQUIREMENTS["min_ram_gb"]:
+        raise RuntimeError(f"At least {SYSTEM_REQUIREMENTS['min_ram_gb']}GB RAM required, got {ram_gb:.1f}GB")
+    
+    # Check platform
+    if sys.platform not in SYSTEM_REQUIREMENTS["supported_platforms"]:
+        print(f"Warning: Platform {sys.platform} may not be fully supported")
+
+def get_model_config(model=None):
+    """Get a model's registry entry, the default model's when none is given"""
+    model = model or DEFAULT_MODEL
+    if model not in MODEL_REGISTRY:
+        raise ValueError(f"Unknown model {model!r}, expected one of: {', '.join(MODEL_REGISTRY)}")
+    return MODEL_REGISTRY[model]
+
+def get_model_path(model=None):
+    """Get the model path, creating directories if needed"""
+    model_path = get_model_config(model)["path"]
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    return model_path
+
+def get_draft_model_config(model=None):
+    """Get the DRAFT_MODELS entry of a model, None when it has no draft"""
+    draft = get_model_config(model).get("draft")
+    return DRAFT_MODELS[draft] if draft else None
+
+def get_draft_model_path(model=None):
+    """Get the draft model path, creating directories if needed; None when the model has no draft"""
+    draft_config = get_draft_model_config(model)
+    if draft_config is None:
+        return None
+    draft_path = draft_config["path"]
+    draft_path.parent.mkdir(parents=True, exist_ok=True)
+    return draft_path
+
+def get_llama_cpp_path():
+    """Get the llama.cpp executable path"""
+    if os.environ.get("LLAMA_CLI_PATH"):
+        return Path(os.environ["LLAMA_CLI_PATH"])
+    if os.name == 'nt':  # Windows
+        return LLAMA_CPP_DIR / "llama-cli.exe"
+    else:  # Unix-like
+        return LLAMA_CPP_DIR / "llama-cli"
+
+def get_llama_bench_path():
+    """Get the llama-bench executable path"""
+    if os.environ.get("LLAMA_BENCH_PATH"):
+        return Path(os.environ["LLAMA_BENCH_PATH"])
+    if os.name == 'nt':  # Windows
+        return LLAMA_CPP_DIR / "llama-bench.exe"
+    else:  # Unix-like
+        return LLAMA_CPP_DIR / "llama-bench"
+
+def get_host_profile_path():
+    """Get the tuning profile path for this machine"""
+    return PROFILES_DIR / f"{socket.gethostname()}.json"
+
+def load_host_profile(model=None):
+    """Load this machine's tuned inference parameters for a model, if `python tune.py --model` has been run for it"""
+    profile_path = get_host_profile_path()
+    if not profile_path.exists():
+        return {}
+    with open(profile_path, encoding="utf-8") as f:
+        inference = json.load(f).get("inference", {})
+    model = model or DEFAULT_MODEL
+    if inference and not all(isinstance(value, dict) for value in inference.values()):
+        # Profiles from before per-model tuning hold the default model's parameters only
+        return inference if model == DEFAULT_MODEL else {}
+    return inference.get(model, {})
+
+def load_model_overrides():
+    """Load this machine's quantization choices, if `python download.py` has picked one"""
+    profile_path = get_host_profile_path()
+    if not profile_path.exists():
+        return {}
+    with open(profile_path, encoding="utf-8") as f:
+        return json.load(f).get("models", {})
+
+def apply_model_overrides():
+    """Point MODEL_REGISTRY entries at the variants chosen for this machine"""
+    for model, override in load_model_overrides().items():
+        if model in MODEL_REGISTRY:
+            MODEL_REGISTRY[model]["file_pattern"] = override["file_pattern"]
+            MODEL_REGISTRY[model]["path"] = MODELS_DIR / override["path"]
+
+def get_llama_server_path():
+    """Get the llama-server executable path"""
+    if os.environ.get("LLAMA_SERVER_PATH"):
+        return Path(os.environ["LLAMA_SERVER_PATH"])
+    if os.name == 'nt':  # Windows
+        return LLAMA_CPP_DIR / "llama-server.exe"
+    else:  # Unix-like
+        return LLAMA_CPP_DIR / "llama-server" 
+
+apply_model_overrides()
@@ -0,0 +1,141 @@
+"""
+Token-budgeted context window for long conversations
+
+Fits the system prompt, as many previous turns as possible and the new
+message into ctx_size while reserving room for generation. When the
+conversation outgrows the budget, old turns are compacted first and then
+dropped, down to a low-water mark. The window only ever moves forward, so
+the prompt prefix stays stable between slides and llama.cpp's prompt
+cache keeps hitting.
+"""
+
+import logging
+from typing import Optional, Dict, Any, List, Sequence
+
+from config import CONTEXT_CONFIG
+from utils import (
+    format_turn,
+    format_prompt,
+    get_chat_format,
+    estimate_tokens,
+    resolve_inference_config
+)
+
+logger = logging.getLogger(__name__)
+
+def compact_message(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    Shorten a message to roughly max_tokens tokens, keeping its beginning.
+
+    Args:
+        text: Message text
+        max_tokens: Token limit
+        model: MODEL_REGISTRY key whose tokenizer counts, the default model when None
+
+    Returns:
+        The message, cut at a word boundary with a marker if it was too long
+    """
+    if estimate_tokens(text, model, add_bos=False) <= max_tokens:
+        return text
+    # Binary search on characters; token counts grow monotonically with length
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid], model, add_bos=False) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + " [...]"
+
+def fit_conversation(history: Sequence[Sequence[str]], user_input: str,
+                     system_prompt: Optional[str] = None,
+                     custom_config: Optional[Dict[str, Any]] = None,
+                     window: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Build a prompt that fits the context window.
+
+    Args:
+        history: Previous turns as (user_message, assistant_message, ...) tuples
+        user_input: The new user message
+        system_prompt: Optional system prompt
+        custom_config: Optional custom configuration parameters, including the model
+        window: Window returned for the previous turn of this conversation
+
+    Returns:
+        Dictionary with the prompt, its token count, the max_tokens to
+        generate, the number of turns dropped and compacted, and the
+        window to pass in on the next turn
+    """
+    config = resolve_inference_config(custom_config)
+    model = config["model"]
+    chat_format = get_chat_format(model)
+    window = dict(window or {"first_turn": 0, "compact_until": 0})
+    budget = config["ctx_size"] - CONTEXT_CONFIG["safety_margin"]
+    min_generation = CONTEXT_CONFIG["min_generation_tokens"]
+
+    system_text = format_turn("system", system_prompt, chat_format) if system_prompt else ""
+    # The prompt starts here, so this count carries the BOS token even without a system prompt
+    system_tokens = estimate_tokens(system_text, model)
+
+    # The new message always goes in; shorten it only if it alone overflows
+    new_turn = format_prompt(user_input, chat_format=chat_format)
+    new_tokens = estimate_tokens(new_turn, model, add_bos=False)
+    if system_tokens + new_tokens + min_generation > budget:
+        user_input = compact_message(user_input, budget - system_tokens - min_generation - 32, model)
+        new_turn = format_prompt(user_input, chat_format=chat_format)
+        new_tokens = estimate_tokens(new_turn, model, add_bos=False)
+        logger.warning("New message shortened to fit the context window")
+    fixed_tokens = system_tokens + new_tokens
+
+    # Reserve the generation budget, shrinking it only down to the minimum
+    reserve = max(min(config["max_tokens"], budget - fixed_tokens), min_generation)
+    prompt_budget = budget - reserve
+
+    turns: List[Sequence[str]] = [turn for turn in history if not turn[1].startswith("Error:")]
+    window["first_turn"] = min(window["first_turn"], len(turns))
+    window["compact_until"] = max(window["compact_until"], window["first_turn"])
+
+    rendered: Dict[tuple, tuple] = {}
+
+    def render(index: int) -> tuple:
+        compacted = index < window["compact_until"]
+        if (index, compacted) not in rendered:
+            user_msg, assistant_msg = turns[index][0], turns[index][1]
+            if compacted:
+                user_msg = compact_message(user_msg, CONTEXT_CONFIG["compact_tokens"], model)
+                assistant_msg = compact_message(assistant_msg, CONTEXT_CONFIG["compact_tokens"], model)
+            text = format_turn("user", user_msg, chat_format) + format_turn("assistant", assistant_msg, chat_format)
+            rendered[(index, compacted)] = (text, estimate_tokens(text, model, add_bos=False))
+        return rendered[(index, compacted)]
+
+    def history_tokens() -> int:
+        return sum(render(i)[1] for i in range(window["first_turn"], len(turns)))
+
+    total = fixed_tokens + history_tokens()
+    if total > prompt_budget:
+        # Slide well below the limit so the next few turns reuse this prefix
+        target = fixed_tokens + (prompt_budget - fixed_tokens) * CONTEXT_CONFIG["low_water"]
+        window["compact_until"] = max(window["compact_until"], len(turns) - CONTEXT_CONFIG["keep_recent_turns"])
+        total = fixed_tokens + history_tokens()
+        while total > target and window["first_turn"] < len(turns):
+            window["first_turn"] += 1
+            window["compact_until"] = max(window["compact_until"], window["first_turn"])
+            total = fixed_tokens + history_tokens()
+        logger.info(f"Context window moved to turn {window['first_turn']} ({total} prompt tokens)")
+
+    prompt = system_text
+    for i in range(window["first_turn"], len(turns)):
+        prompt += render(i)[0]
+    prompt += new_turn
+
+    return {
+        "prompt": prompt,
+        "prompt_tokens": total,
+        "max_tokens": max(min(config["max_tokens"], budget - total), min_generation),
+        "dropped_turns": window["first_turn"],
+        "compacted_turns": max(0, window["compact_until"] - window["first_turn"]),
+        "window": window
+    }
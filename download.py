@@ -1,105 +1,712 @@
-"""
-Model download script for Llama 4 Chat Interface
-"""
-
-import os
-import sys
-from pathlib import Path
-from huggingface_hub import snapshot_download
-import logging
-
-from config import MODEL_CONFIG, setup_environment, get_model_path
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-def download_model():
-    """Download the Llama 4 model from Hugging Face Hub"""
-    
-    # Setup environment
-    setup_environment()
-    
-    logger.info("🚀 Starting model download...")
-    logger.info(f"Model: {MODEL_CONFIG['name']}")
-    logger.info(f"Repository: {MODEL_CONFIG['repo_id']}")
-    logger.info(f"File pattern: {MODEL_CONFIG['file_pattern']}")
-    
-    try:
-        # Create models directory
-        model_dir = Path(MODEL_CONFIG['path']).parent
-        model_dir.mkdir(parents=True, exist_ok=True)
-        logger.info(f"📁 Created directory: {model_dir}")
-        
-        # Download the model
-        logger.info("📥 Downloading model files...")
-        snapshot_download(
-            repo_id=MODEL_CONFIG['repo_id'],
-            local_dir=str(model_dir),
-            allow_patterns=[MODEL_CONFIG['file_pattern']],
-            resume_download=True,
-            local_dir_use_symlinks=False
-        )
-        
-        # Verify download
-        model_path = get_model_path()
-        if model_path.exists():
-            size_gb = model_path.stat().st_size / (1024**3)
-            logger.info(f"✅ Model downloaded successfully!")
-            logger.info(f"📊 Model size: {size_gb:.2f} GB")
-            logger.info(f"📍 Location: {model_path}")
-        else:
-            logger.error("❌ Model file not found after download")
-            return False
-            
-    except Exception as e:
-        logger.error(f"❌ Download failed: {e}")
-        return False
-    
-    return True
-
-def check_disk_space():
-    """Check if there's enough disk space for the model"""
-    import shutil
-    
-    # Model is approximately 2.5GB
-    required_space_gb = 3.0
-    model_dir = Path(MODEL_CONFIG['path']).parent
-    
-    try:
-        total, used, free = shutil.disk_usage(str(model_dir))
-        free_gb = free / (1024**3)
-        
-        logger.info(f"💾 Available disk space: {free_gb:.2f} GB")
-        
-        if free_gb < required_space_gb:
-            logger.warning(f"⚠️ Low disk space: {free_gb:.2f} GB available, {required_space_gb} GB recommended")
-            return False
-        return True
-    except Exception as e:
-        logger.warning(f"⚠️ Could not check disk space: {e}")
-        return True
-
-def main():
-    """Main download function"""
-    print("🦙 Llama 4 Model Downloader")
-    print("=" * 40)
-    
-    # Check disk space
-    if not check_disk_space():
-        response = input("Continue anyway? (y/N): ")
-        if response.lower() != 'y':
-            print("Download cancelled.")
-            return
-    
-    # Download model
-    if download_model():
-        print("\n🎉 Model download completed successfully!")
-        print("You can now run the chat interface with: streamlit run app.py")
-    else:
-        print("\n❌ Model download failed!")
-        print("Please check your internet connection and try again.")
-        sys.exit(1)
-
-if __name__ == "__main__":
-    main()
+"""
+Model download script for Llama 4 Chat Interface
+
+Files are fetched with several parallel HTTP range requests. Progress is
+kept in a .part file plus a small state file, so an interrupted download
+resumes where it stopped, and the result is checked against the SHA256
+published in the repository metadata before it replaces the model file.
+
+    python download.py                          # download the configured model and its draft
+    python download.py --model llama-3.2-3b --no-draft
+    python download.py --connections 4 --limit-rate 20
+    python download.py --url http://127.0.0.1:8000/model.gguf --sha256 <hex>
+
+Unless this host already has one chosen, the quantization variant is the
+largest GGUF in the repository whose estimated footprint fits the RAM
+minus a headroom (QUANT_CONFIG). The choice is written to the host
+profile, which config.py applies on top of MODEL_REGISTRY.
+
+    python download.py --list-quants
+    python download.py --quant auto --headroom-gb 12
+    python download.py --quant Q4_K_M
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import quote
+import logging
+
+from config import (
+    MODEL_CONFIG, MODEL_REGISTRY, DEFAULT_MODEL, DOWNLOAD_CONFIG, QUANT_CONFIG, SYSTEM_REQUIREMENTS,
+    MODELS_DIR, PROFILES_DIR, setup_environment, get_model_config, get_draft_model_config,
+    get_host_profile_path, load_model_overrides, apply_model_overrides
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024**2
+GIB = 1024**3
+
+# Quantization label at the end of a GGUF file name, before any split suffix
+QUANT_PATTERN = re.compile(r"-((?:UD-)?(?:I?Q\d+(?:_[A-Z0-9]+)*|BF16|F16|F32))(?:-\d{5}-of-\d{5})?\.gguf$", re.IGNORECASE)
+SPLIT_PATTERN = re.compile(r"-\d{5}-of-(\d{5})\.gguf$")
+
+class DownloadError(RuntimeError):
+    """Raised when a file cannot be downloaded or fails verification"""
+
+class RangeNotSupportedError(DownloadError):
+    """Raised when the server answers a range request with the whole file"""
+
+def get_auth_headers() -> Dict[str, str]:
+    """Authorization header for gated repositories, if a token is configured"""
+    token = os.environ.get("HF_TOKEN")
+    if not token:
+        try:
+            from huggingface_hub import get_token
+            token = get_token()
+        except ImportError:
+            token = None
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def list_model_files(repo_id: str, file_pattern: str, revision: str = "main") -> List[Dict[str, Any]]:
+    """
+    Look up the repository files matching a pattern.
+    
+    Args:
+        repo_id: Hugging Face repository
+        file_pattern: fnmatch pattern for the files to fetch
+        revision: Branch, tag or commit
+    
+    Returns:
+        List of dictionaries with filename, size, sha256 and url
+    """
+    from huggingface_hub import HfApi
+    
+    info = HfApi(endpoint=DOWNLOAD_CONFIG["endpoint"]).model_info(repo_id, revision=revision, files_metadata=True)
+    files = []
+    for sibling in info.siblings:
+        if not fnmatch(sibling.rfilename, file_pattern):
+            continue
+        lfs = sibling.lfs
+        # Older huggingface_hub versions return the LFS info as a plain dict
+        sha256 = lfs.get("sha256") if isinstance(lfs, dict) else getattr(lfs, "sha256", None)
+        files.append({
+            "filename": sibling.rfilename,
+            "size": sibling.size,
+            "sha256": sha256,
+            "url": f"{DOWNLOAD_CONFIG['endpoint']}/{repo_id}/resolve/{revision}/{quote(sibling.rfilename)}"
+        })
+    return files
+
+def probe_url(url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bool]:
+    """
+    Find a file's size and whether the server honours range requests.
+    
+    Args:
+        url: File URL
+        headers: Extra request headers
+    
+    Returns:
+        (size in bytes, range support)
+    """
+    request = urllib.request.Request(url, method="HEAD", headers=headers or {})
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_CONFIG["timeout"]) as response:
+        size = int(response.headers.get("X-Linked-Size") or response.headers.get("Content-Length") or 0)
+        accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    if not size:
+        raise DownloadError(f"Server did not report a size for {url}")
+    return size, accepts_ranges
+
+def sha256_file(path: Path) -> str:
+    """SHA256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(8 * READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class RateLimiter:
+    """Token bucket shared by all connections of a download"""
+
+    def __init__(self, bytes_per_second: Optional[float]):
+        self.rate = bytes_per_second
+        self.allowance = bytes_per_second or 0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n: int) -> None:
+        """Wait until n more bytes may be transferred"""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= n
+            delay = -self.allowance / self.rate if self.allowance < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+class RangeDownloader:
+    """
+    Parallel, resumable download of one file.
+    
+    The file is split into chunk_size pieces fetched by up to `connections`
+    threads into a preallocated .part file. Finished chunks are recorded in
+    a .part.json state file, so a restarted download only fetches what is
+    missing.
+    
+    Usage:
+        RangeDownloader(url, dest, size, sha256).run()
+    """
+
+    def __init__(self, url: str, dest: Path, size: int, sha256: Optional[str] = None,
+                 connections: Optional[int] = None, chunk_size: Optional[int] = None,
+                 max_bytes_per_second: Optional[float] = None,
+                 headers: Optional[Dict[str, str]] = None, accepts_ranges: bool = True):
+        self.url = url
+        self.dest = Path(dest)
+        self.size = size
+        self.sha256 = sha256.lower() if sha256 else None
+        self.headers = headers or {}
+        self.chunk_size = chunk_size or DOWNLOAD_CONFIG["chunk_size"]
+        self.connections = connections or DOWNLOAD_CONFIG["connections"]
+        self.accepts_ranges = accepts_ranges
+        if not accepts_ranges:
+            self.chunk_size = size
+            self.connections = 1
+        self.limiter = RateLimiter(max_bytes_per_second)
+        self.part_path = self.dest.with_name(self.dest.name + ".part")
+        self.state_path = self.dest.with_name(self.dest.name + ".part.json")
+        self.chunk_count = (size + self.chunk_size - 1) // self.chunk_size
+        self.completed: set = set()
+        self.downloaded = 0
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    def _load_state(self) -> None:
+        """Pick up finished chunks from an earlier attempt at the same file"""
+        if not (self.part_path.exists() and self.state_path.exists()):
+            return
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if (state.get("url"), state.get("size"), state.get("sha256"), state.get("chunk_size")) != \
+                (self.url, self.size, self.sha256, self.chunk_size):
+            logger.info("Partial download is for a different file; starting over")
+            return
+        self.completed = set(state["completed"])
+        logger.info(f"Resuming: {len(self.completed)}/{self.chunk_count} chunks already downloaded")
+
+    def _save_state(self) -> None:
+        """Write the state file atomically; call with self.lock held"""
+        state = {
+            "url": self.url,
+            "size": self.size,
+            "sha256": self.sha256,
+            "chunk_size": self.chunk_size,
+            "completed": sorted(self.completed)
+        }
+        temp_path = self.state_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(temp_path, self.state_path)
+
+    def _fetch_chunk(self, index: int) -> None:
+        """Download one chunk into place, retrying from the last byte received"""
+        start = index * self.chunk_size
+        end = min(self.size, start + self.chunk_size) - 1
+        position = start
+        for attempt in range(DOWNLOAD_CONFIG["retries"] + 1):
+            if not self.accepts_ranges and position != start:
+                # Without range support a retry has to start from scratch
+                with self.lock:
+                    self.downloaded -= position - start
+                position = start
+            try:
+                headers = dict(self.headers, Range=f"bytes={position}-{end}")
+                request = urllib.request.Request(self.url, headers=headers)
+                with urllib.request.urlopen(request, timeout=DOWNLOAD_CONFIG["timeout"]) as response, \
+                        open(self.part_path, "r+b") as f:
+                    if response.status != 206 and (position, end) != (0, self.size - 1):
+                        raise RangeNotSupportedError(f"{self.url} ignored the range request")
+                    f.seek(position)
+                    while position <= end:
+                        block = response.read(min(READ_BLOCK_SIZE, end - position + 1))
+                        if not block:
+                            break
+                        self.limiter.consume(len(block))
+                        f.write(block)
+                        position += len(block)
+                        with self.lock:
+                            self.downloaded += len(block)
+                if position <= end:
+                    raise DownloadError(f"connection closed at byte {position - start} of {end - start + 1}")
+                with self.lock:
+                    self.completed.add(index)
+                    self._save_state()
+                return
+            except RangeNotSupportedError:
+                raise
+            except urllib.error.HTTPError as e:
+                # Client errors such as 401/403/404 will not fix themselves
+                if 400 <= e.code < 500 and e.code != 429:
+                    raise DownloadError(f"HTTP {e.code} fetching chunk {index}: {e.reason}") from e
+                error = e
+            except (DownloadError, OSError) as e:
+                error = e
+            if attempt < DOWNLOAD_CONFIG["retries"]:
+                delay = min(30, 2 ** attempt)
+                logger.warning(f"Chunk {index} failed ({error}); retrying in {delay}s")
+                time.sleep(delay)
+        raise DownloadError(f"Chunk {index} failed after {DOWNLOAD_CONFIG['retries'] + 1} attempts: {error}")
+
+    def _report_progress(self, resumed_bytes: int, start_time: float) -> None:
+        """Log progress and throughput until the download finishes"""
+        last_bytes, last_time = self.downloaded, start_time
+        while not self.finished.wait(DOWNLOAD_CONFIG["report_interval"]):
+            now = time.time()
+            done = resumed_bytes + self.downloaded
+            rate = (self.downloaded - last_bytes) / max(now - last_time, 1e-6)
+            eta = (self.size - done) / rate if rate > 0 else float("inf")
+            logger.info(
+                f"📥 {done / self.size:6.1%}  {done / 1024**3:.2f}/{self.size / 1024**3:.2f} GB  "
+                f"{rate / 1024**2:.1f} MB/s  ETA {eta:.0f}s"
+            )
+            last_bytes, last_time = self.downloaded, now
+
+    def verify(self, path: Path) -> None:
+        """
+        Check a file against the expected size and SHA256.
+        
+        Args:
+            path: File to check
+        
+        Raises:
+            DownloadError: On a size or checksum mismatch
+        """
+        if path.stat().st_size != self.size:
+            raise DownloadError(f"{path} is {path.stat().st_size} bytes, expected {self.size}")
+        if self.sha256:
+            logger.info("🔐 Verifying SHA256...")
+            actual = sha256_file(path)
+            if actual != self.sha256:
+                raise DownloadError(f"SHA256 mismatch for {self.dest.name}: expected {self.sha256}, got {actual}")
+        else:
+            logger.warning(f"⚠️ No SHA256 published for {self.dest.name}; only the size was checked")
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Download, verify and move the file into place.
+        
+        Returns:
+            Dictionary with bytes downloaded, seconds and average throughput
+        
+        Raises:
+            DownloadError: If a chunk keeps failing or verification fails
+        """
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        self._load_state()
+        if not self.completed or not self.part_path.exists():
+            self.completed = set()
+            with open(self.part_path, "wb") as f:
+                f.truncate(self.size)
+        
+        pending = [i for i in range(self.chunk_count) if i not in self.completed]
+        resumed_bytes = self.size - sum(
+            min(self.size, (i + 1) * self.chunk_size) - i * self.chunk_size for i in pending
+        )
+        start_time = time.time()
+        reporter = threading.Thread(target=self._report_progress, args=(resumed_bytes, start_time), daemon=True)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                list(executor.map(self._fetch_chunk, pending))
+        finally:
+            self.finished.set()
+        seconds = time.time() - start_time
+        
+        try:
+            self.verify(self.part_path)
+        except DownloadError:
+            # A corrupt file cannot be resumed into a good one
+            self.part_path.unlink(missing_ok=True)
+            self.state_path.unlink(missing_ok=True)
+            raise
+        os.replace(self.part_path, self.dest)
+        self.state_path.unlink(missing_ok=True)
+        
+        throughput = self.downloaded / seconds if seconds > 0 else 0.0
+        logger.info(f"✅ {self.dest.name}: {self.downloaded / 1024**3:.2f} GB in {seconds:.1f}s ({throughput / 1024**2:.1f} MB/s)")
+        return {"bytes": self.downloaded, "seconds": seconds, "bytes_per_second": throughput}
+
+def download_file(url: str, dest: Path, sha256: Optional[str] = None, size: Optional[int] = None,
+                  connections: Optional[int] = None, max_bytes_per_second: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Download one file unless a verified copy is already in place.
+    
+    Args:
+        url: File URL
+        dest: Destination path
+        sha256: Expected SHA256 hex digest
+        size: Expected size; asked from the server when omitted
+        connections: Parallel connections
+        max_bytes_per_second: Bandwidth cap
+    
+    Returns:
+        RangeDownloader.run() result, with bytes 0 when nothing was fetched
+    """
+    headers = get_auth_headers()
+    probed_size, accepts_ranges = probe_url(url, headers)
+    downloader = RangeDownloader(
+        url, dest, size or probed_size, sha256,
+        connections=connections,
+        max_bytes_per_second=max_bytes_per_second or DOWNLOAD_CONFIG["max_bytes_per_second"],
+        headers=headers,
+        accepts_ranges=accepts_ranges
+    )
+    if dest.exists():
+        try:
+            downloader.verify(dest)
+            logger.info(f"✅ {dest.name} is already downloaded and verified")
+            return {"bytes": 0, "seconds": 0.0, "bytes_per_second": 0.0}
+        except DownloadError as e:
+            logger.warning(f"⚠️ Existing file is invalid, downloading again: {e}")
+    return downloader.run()
+
+def list_quant_variants(repo_id: str, revision: str = "main") -> List[Dict[str, Any]]:
+    """
+    Group a repository's GGUF files into quantization variants.
+    
+    Args:
+        repo_id: Hugging Face repository
+        revision: Branch, tag or commit
+    
+    Returns:
+        List of dictionaries with quant, file_pattern, filename (the file
+        llama.cpp loads, the first part of a split model) and total size,
+        smallest first
+    """
+    variants: Dict[str, Dict[str, Any]] = {}
+    for remote in list_model_files(repo_id, "*.gguf", revision):
+        name = remote['filename']
+        match = QUANT_PATTERN.search(Path(name).name)
+        if not match or "mmproj" in name.lower():
+            continue
+        # Every part of a split model matches one pattern, and nothing else does
+        pattern = SPLIT_PATTERN.sub(r"-?????-of-\1.gguf", name)
+        variant = variants.setdefault(pattern, {
+            "quant": match.group(1),
+            "file_pattern": pattern,
+            "filename": name,
+            "size": 0
+        })
+        variant['filename'] = min(variant['filename'], name)
+        variant['size'] += remote['size'] or 0
+    return sorted(variants.values(), key=lambda variant: variant['size'])
+
+def estimate_overhead_bytes(model: Optional[str], draft_bytes: int = 0) -> int:
+    """
+    Estimate the RAM a loaded model needs beyond its weights.
+    
+    Args:
+        model: MODEL_REGISTRY key
+        draft_bytes: Size of the draft model's weights
+    
+    Returns:
+        KV cache for the model's ctx_size plus the draft weights when
+        speculative decoding loads them, in bytes
+    """
+    from gguf import get_model_info
+    from utils import resolve_inference_config
+    
+    config = resolve_inference_config({"model": model})
+    # The KV cache does not depend on the quantization, so any variant on disk tells its size
+    model_dir = Path(get_model_config(model)['path']).parent
+    kv_bytes_per_token = None
+    for local_path in sorted(model_dir.rglob("*.gguf")) if model_dir.exists() else []:
+        kv_bytes_per_token = get_model_info(local_path).get("kv_bytes_per_token")
+        if kv_bytes_per_token:
+            break
+    if kv_bytes_per_token:
+        kv_bytes = kv_bytes_per_token * config['ctx_size']
+    else:
+        kv_bytes = int(QUANT_CONFIG['kv_fallback_gb'] * GIB)
+    return kv_bytes + (draft_bytes if config['speculative'] else 0)
+
+def select_quant_variant(variants: List[Dict[str, Any]], budget_bytes: int, overhead_bytes: int,
+                         max_weights_bytes: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Pick the largest variant whose footprint fits the RAM budget.
+    
+    Args:
+        variants: list_quant_variants() result
+        budget_bytes: RAM the loaded model may use
+        overhead_bytes: estimate_overhead_bytes() result
+        max_weights_bytes: Largest weights allowed, for speed
+    
+    Returns:
+        (variant, whether it fits); the smallest variant when none fits
+    """
+    fitting = [
+        variant for variant in variants
+        if variant['size'] + overhead_bytes <= budget_bytes
+        and (max_weights_bytes is None or variant['size'] <= max_weights_bytes)
+    ]
+    if fitting:
+        return max(fitting, key=lambda variant: variant['size']), True
+    return (variants[0] if variants else None), False
+
+def choose_quant_variant(model: Optional[str] = None, quant: str = "auto", headroom_gb: Optional[float] = None,
+                         max_weights_gb: Optional[float] = None, draft: bool = True,
+                         list_only: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    List a model's quantization variants against this host's RAM and pick one.
+    
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+        quant: "auto" for the largest variant that fits, or a quantization label
+        headroom_gb: RAM left free, QUANT_CONFIG ram_headroom_gb when None
+        max_weights_gb: Largest weights allowed, QUANT_CONFIG max_weights_gb when None
+        draft: Count the draft model's weights for speculative decoding
+        list_only: Print the variants without choosing
+    
+    Returns:
+        The chosen variant, None when listing or when nothing matches
+    """
+    import psutil
+    
+    model_config = get_model_config(model)
+    headroom_gb = QUANT_CONFIG['ram_headroom_gb'] if headroom_gb is None else headroom_gb
+    max_weights_gb = QUANT_CONFIG['max_weights_gb'] if max_weights_gb is None else max_weights_gb
+    variants = list_quant_variants(model_config['repo_id'], DOWNLOAD_CONFIG['revision'])
+    if not variants:
+        logger.error(f"❌ No GGUF variants found in {model_config['repo_id']}")
+        return None
+    
+    draft_config = get_draft_model_config(model) if draft else None
+    draft_bytes = sum(
+        remote['size'] or 0
+        for remote in list_model_files(draft_config['repo_id'], draft_config['file_pattern'], DOWNLOAD_CONFIG['revision'])
+    ) if draft_config else 0
+    overhead_bytes = estimate_overhead_bytes(model, draft_bytes)
+    ram_bytes = psutil.virtual_memory().total
+    if ram_bytes < SYSTEM_REQUIREMENTS['min_ram_gb'] * GIB:
+        logger.warning(f"⚠️ {ram_bytes / GIB:.1f} GB RAM is below the {SYSTEM_REQUIREMENTS['min_ram_gb']} GB minimum")
+    budget_bytes = int(ram_bytes - headroom_gb * GIB)
+    max_weights_bytes = int(max_weights_gb * GIB) if max_weights_gb else None
+    
+    if quant == "auto":
+        chosen, fits = select_quant_variant(variants, budget_bytes, overhead_bytes, max_weights_bytes)
+    else:
+        chosen = next((variant for variant in variants if variant['quant'].upper() == quant.upper()), None)
+        fits = chosen is not None and chosen['size'] + overhead_bytes <= budget_bytes
+        if chosen is None:
+            logger.error(f"❌ No {quant} variant in {model_config['repo_id']}; see --list-quants")
+    
+    print(f"\n{model_config['name']}: {ram_bytes / GIB:.1f} GB RAM, {headroom_gb:g} GB headroom, "
+          f"{overhead_bytes / GIB:.1f} GB for the KV cache and draft")
+    print(f"   {'Quant':<16}{'Weights':>10}{'Needs':>10}")
+    for variant in variants:
+        needs = variant['size'] + overhead_bytes
+        marker = "👉" if variant is chosen and not list_only else "  "
+        status = "fits" if needs <= budget_bytes else "too large"
+        if max_weights_bytes is not None and variant['size'] > max_weights_bytes:
+            status = "over speed cap"
+        print(f"{marker} {variant['quant']:<16}{variant['size'] / GIB:>8.1f}GB{needs / GIB:>8.1f}GB  {status}")
+    if list_only:
+        return None
+    if chosen is not None and not fits:
+        logger.warning(f"⚠️ {chosen['quant']} needs more than the {budget_bytes / GIB:.1f} GB budget; expect swapping")
+    return chosen
+
+def save_quant_choice(model: Optional[str], variant: Dict[str, Any]) -> Path:
+    """
+    Record a model's quantization variant in this host's profile and apply it.
+    
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+        variant: choose_quant_variant() result
+    
+    Returns:
+        Profile path written
+    """
+    model = model or DEFAULT_MODEL
+    model_dir = Path(get_model_config(model)['path']).parent
+    profile_path = get_host_profile_path()
+    profile = json.loads(profile_path.read_text(encoding="utf-8")) if profile_path.exists() else {}
+    profile.setdefault("models", {})[model] = {
+        "quant": variant['quant'],
+        "file_pattern": variant['file_pattern'],
+        # Split models are stored flat, where llama.cpp looks for the other parts
+        "path": (model_dir / Path(variant['filename']).name).relative_to(MODELS_DIR).as_posix(),
+        "size": variant['size'],
+        "selected": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    profile_path.write_text(json.dumps(profile, indent=2), encoding="utf-8")
+    apply_model_overrides()
+    logger.info(f"📝 Saved {variant['quant']} for {model} to {profile_path}")
+    return profile_path
+
+def download_model(connections: Optional[int] = None, max_bytes_per_second: Optional[float] = None,
+                   model: Optional[str] = None, draft: bool = False):
+    """Download a MODEL_REGISTRY model (the default Llama 4 model), or with draft its draft model, from Hugging Face Hub"""
+    model_config = get_draft_model_config(model) if draft else get_model_config(model)
+    if model_config is None:
+        logger.info(f"{get_model_config(model)['name']} has no draft model")
+        return True
+    
+    # Setup environment
+    setup_environment()
+    
+    logger.info("🚀 Starting model download...")
+    logger.info(f"Model: {model_config['name']}")
+    logger.info(f"Repository: {model_config['repo_id']}")
+    logger.info(f"File pattern: {model_config['file_pattern']}")
+    
+    try:
+        # Create models directory
+        model_dir = Path(model_config['path']).parent
+        model_dir.mkdir(parents=True, exist_ok=True)
+        logger.info(f"📁 Created directory: {model_dir}")
+        
+        # Find the files and their checksums
+        files = list_model_files(model_config['repo_id'], model_config['file_pattern'], DOWNLOAD_CONFIG['revision'])
+        if not files:
+            logger.error(f"❌ No files in {model_config['repo_id']} match {model_config['file_pattern']}")
+            return False
+        
+        # Download the model
+        logger.info("📥 Downloading model files...")
+        for remote in files:
+            logger.info(f"📄 {remote['filename']} ({remote['size'] / 1024**3:.2f} GB)")
+            download_file(
+                remote['url'],
+                model_dir / Path(remote['filename']).name,
+                sha256=remote['sha256'],
+                size=remote['size'],
+                connections=connections,
+                max_bytes_per_second=max_bytes_per_second
+            )
+        
+        # Verify download
+        model_path = Path(model_config['path'])
+        if model_path.exists():
+            size_gb = model_path.stat().st_size / (1024**3)
+            logger.info(f"✅ Model downloaded successfully!")
+            logger.info(f"📊 Model size: {size_gb:.2f} GB")
+            logger.info(f"📍 Location: {model_path}")
+        else:
+            logger.error("❌ Model file not found after download")
+            return False
+    
+    except Exception as e:
+        logger.error(f"❌ Download failed: {e}")
+        return False
+    
+    return True
+
+def check_disk_space(required_space_gb: float = 3.0, model: Optional[str] = None):
+    """Check if there's enough disk space for the model"""
+    import shutil
+    
+    model_dir = Path(get_model_config(model)['path']).parent
+    
+    try:
+        total, used, free = shutil.disk_usage(str(model_dir))
+        free_gb = free / (1024**3)
+        
+        logger.info(f"💾 Available disk space: {free_gb:.2f} GB")
+        
+        if free_gb < required_space_gb:
+            logger.warning(f"⚠️ Low disk space: {free_gb:.2f} GB available, {required_space_gb} GB recommended")
+            return False
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Could not check disk space: {e}")
+        return True
+
+def main():
+    """Main download function"""
+    parser = argparse.ArgumentParser(description="Download the Llama 4 model")
+    parser.add_argument("--model", choices=list(MODEL_REGISTRY), default=DEFAULT_MODEL,
+                        help=f"Model to download (default {DEFAULT_MODEL})")
+    parser.add_argument("--connections", type=int, default=None,
+                        help=f"Parallel connections (default {DOWNLOAD_CONFIG['connections']})")
+    parser.add_argument("--limit-rate", type=float, default=None, help="Bandwidth cap in MB/s")
+    parser.add_argument("--no-draft", action="store_true",
+                        help="Skip the draft model used for speculative decoding")
+    parser.add_argument("--quant", default=None,
+                        help="Quantization variant, or 'auto' for the largest that fits in RAM "
+                             "(default: this host's saved choice, else auto)")
+    parser.add_argument("--list-quants", action="store_true", help="List the quantization variants and exit")
+    parser.add_argument("--headroom-gb", type=float, default=None,
+                        help=f"RAM to leave free when choosing a variant (default {QUANT_CONFIG['ram_headroom_gb']})")
+    parser.add_argument("--max-weights-gb", type=float, default=None,
+                        help="Largest weights to choose, trading quality for speed")
+    parser.add_argument("--url", default=None, help="Download this URL instead of the configured model")
+    parser.add_argument("--sha256", default=None, help="Expected SHA256 for --url")
+    parser.add_argument("--output", type=Path, default=None, help="Destination for --url")
+    args = parser.parse_args()
+    max_bytes_per_second = args.limit_rate * 1024**2 if args.limit_rate else None
+    
+    print("🦙 Llama 4 Model Downloader")
+    print("=" * 40)
+    
+    if args.url:
+        output = args.output or Path(MODEL_CONFIG['path']).parent / Path(args.url).name
+        try:
+            download_file(args.url, output, sha256=args.sha256, connections=args.connections,
+                          max_bytes_per_second=max_bytes_per_second)
+        except (DownloadError, urllib.error.URLError, OSError) as e:
+            print(f"\n❌ Download failed: {e}")
+            sys.exit(1)
+        print(f"\n🎉 Downloaded {output}")
+        return
+    
+    # Pick the quantization variant for this host
+    if args.list_quants or args.quant or args.model not in load_model_overrides():
+        try:
+            variant = choose_quant_variant(args.model, args.quant or "auto", args.headroom_gb, args.max_weights_gb,
+                                           draft=not args.no_draft, list_only=args.list_quants)
+        except ImportError:
+            print("\n❌ huggingface_hub is required to list variants: pip install huggingface_hub")
+            sys.exit(1)
+        except (urllib.error.URLError, OSError) as e:
+            print(f"\n❌ Could not list the variants: {e}")
+            sys.exit(1)
+        if args.list_quants:
+            return
+        if variant is None:
+            sys.exit(1)
+        save_quant_choice(args.model, variant)
+    saved_size = load_model_overrides().get(args.model, {}).get("size")
+    required_space_gb = saved_size / GIB * 1.1 if saved_size else 3.0
+    
+    # Check disk space
+    if not check_disk_space(required_space_gb, args.model):
+        response = input("Continue anyway? (y/N): ")
+        if response.lower() != 'y':
+            print("Download cancelled.")
+            return
+    
+    # Download model
+    downloaded = download_model(args.connections, max_bytes_per_second, args.model)
+    if downloaded and not args.no_draft and get_draft_model_config(args.model):
+        logger.info("📥 Downloading the draft model for speculative decoding...")
+        downloaded = download_model(args.connections, max_bytes_per_second, args.model, draft=True)
+    if downloaded:
+        print("\n🎉 Model download completed successfully!")
+        print("You can now run the chat interface with: streamlit run app.py")
+    else:
+        print("\n❌ Model download failed!")
+        print("Please check your internet connection and try again.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+GGUF file reader for the Llama 4 Chat Interface
+
+Parses the key/value metadata and tensor table at the start of a GGUF
+model file through a read-only memory map, so only the pages actually
+read are loaded - a few MB of a multi-GB file.
+"""
+
+import mmap
+import struct
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Union
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types
+GGUF_UINT8 = 0
+GGUF_INT8 = 1
+GGUF_UINT16 = 2
+GGUF_INT16 = 3
+GGUF_UINT32 = 4
+GGUF_INT32 = 5
+GGUF_FLOAT32 = 6
+GGUF_BOOL = 7
+GGUF_STRING = 8
+GGUF_ARRAY = 9
+GGUF_UINT64 = 10
+GGUF_INT64 = 11
+GGUF_FLOAT64 = 12
+
+_SCALAR_FORMATS = {
+    GGUF_UINT8: "<B",
+    GGUF_INT8: "<b",
+    GGUF_UINT16: "<H",
+    GGUF_INT16: "<h",
+    GGUF_UINT32: "<I",
+    GGUF_INT32: "<i",
+    GGUF_FLOAT32: "<f",
+    GGUF_BOOL: "<?",
+    GGUF_UINT64: "<Q",
+    GGUF_INT64: "<q",
+    GGUF_FLOAT64: "<d"
+}
+
+# ggml tensor types: id -> (name, elements per block, bytes per block)
+GGML_TYPES = {
+    0: ("F32", 1, 4),
+    1: ("F16", 1, 2),
+    2: ("Q4_0", 32, 18),
+    3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22),
+    7: ("Q5_1", 32, 24),
+    8: ("Q8_0", 32, 34),
+    9: ("Q8_1", 32, 36),
+    10: ("Q2_K", 256, 84),
+    11: ("Q3_K", 256, 110),
+    12: ("Q4_K", 256, 144),
+    13: ("Q5_K", 256, 176),
+    14: ("Q6_K", 256, 210),
+    15: ("Q8_K", 256, 292),
+    16: ("IQ2_XXS", 256, 66),
+    17: ("IQ2_XS", 256, 74),
+    18: ("IQ3_XXS", 256, 98),
+    19: ("IQ1_S", 256, 50),
+    20: ("IQ4_NL", 32, 18),
+    21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82),
+    23: ("IQ4_XS", 256, 136),
+    24: ("I8", 1, 1),
+    25: ("I16", 1, 2),
+    26: ("I32", 1, 4),
+    27: ("I64", 1, 8),
+    28: ("F64", 1, 8),
+    29: ("IQ1_M", 256, 56),
+    30: ("BF16", 1, 2),
+    34: ("TQ1_0", 256, 54),
+    35: ("TQ2_0", 256, 66)
+}
+
+# general.file_type values (llama_ftype) -> quantization name
+GGUF_FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16", 36: "TQ1_0", 37: "TQ2_0"
+}
+
+GGUF_DEFAULT_ALIGNMENT = 32
+
+class GGUFError(ValueError):
+    """Raised when a file is not a readable GGUF model"""
+
+class GGUFReader:
+    """
+    Sequential reader over a memory-mapped GGUF file.
+
+    Usage:
+        with GGUFReader(path) as reader:
+            metadata = reader.read_metadata()
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise GGUFError(f"{self.path} is empty")
+        self.offset = 0
+        self.version = 0
+        self.tensor_count = 0
+        self.kv_count = 0
+
+    def __enter__(self) -> "GGUFReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    @property
+    def size(self) -> int:
+        return len(self._map)
+
+    def _unpack(self, fmt: str) -> Any:
+        size = struct.calcsize(fmt)
+        if self.offset + size > len(self._map):
+            raise GGUFError(f"{self.path} is truncated at offset {self.offset}")
+        value = struct.unpack_from(fmt, self._map, self.offset)[0]
+        self.offset += size
+        return value
+
+    def _read_string(self) -> str:
+        length = self._unpack("<Q")
+        end = self.offset + length
+        if end > len(self._map):
+            raise GGUFError(f"{self.path} is truncated at offset {self.offset}")
+        value = self._map[self.offset:end].decode("utf-8", errors="replace")
+        self.offset = end
+        return value
+
+    def _skip_value(self, value_type: int) -> None:
+        if value_type == GGUF_STRING:
+            length = self._unpack("<Q")
+            self.offset += length
+        elif value_type == GGUF_ARRAY:
+            item_type = self._unpack("<I")
+            count = self._unpack("<Q")
+            if item_type in _SCALAR_FORMATS:
+                self.offset += count * struct.calcsize(_SCALAR_FORMATS[item_type])
+            else:
+                for _ in range(count):
+                    self._skip_value(item_type)
+                    if self.offset > len(self._map):
+                        raise GGUFError(f"{self.path} is truncated")
+        elif value_type in _SCALAR_FORMATS:
+            self.offset += struct.calcsize(_SCALAR_FORMATS[value_type])
+        else:
+            raise GGUFError(f"Unknown GGUF value type {value_type} at offset {self.offset}")
+        if self.offset > len(self._map):
+            raise GGUFError(f"{self.path} is truncated")
+
+    def _read_value(self, value_type: int) -> Any:
+        if value_type == GGUF_STRING:
+            return self._read_string()
+        if value_type == GGUF_ARRAY:
+            item_type = self._unpack("<I")
+            count = self._unpack("<Q")
+            if item_type in _SCALAR_FORMATS:
+                fmt = _SCALAR_FORMATS[item_type]
+                item_size = struct.calcsize(fmt)
+                end = self.offset + count * item_size
+                if end > len(self._map):
+                    raise GGUFError(f"{self.path} is truncated at offset {self.offset}")
+                values = list(struct.unpack_from(f"<{count}{fmt[1]}", self._map, self.offset))
+                self.offset = end
+                return values
+            return [self._read_value(item_type) for _ in range(count)]
+        if value_type in _SCALAR_FORMATS:
+            return self._unpack(_SCALAR_FORMATS[value_type])
+        raise GGUFError(f"Unknown GGUF value type {value_type} at offset {self.offset}")
+
+    def read_header(self) -> None:
+        """Read and check the magic, version and item counts"""
+        self.offset = 0
+        if self._map[:4] != GGUF_MAGIC:
+            raise GGUFError(f"{self.path} is not a GGUF file")
+        self.offset = 4
+        self.version = self._unpack("<I")
+        if self.version not in (2, 3):
+            raise GGUFError(f"Unsupported GGUF version {self.version}")
+        self.tensor_count = self._unpack("<Q")
+        self.kv_count = self._unpack("<Q")
+
+    def read_metadata(self, keys: Optional[List[str]] = None, max_array_length: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Read the key/value metadata section.
+
+        Args:
+            keys: Only decode these keys (others are skipped); all when None
+            max_array_length: Skip arrays longer than this instead of decoding them
+
+        Returns:
+            Dictionary of metadata values
+        """
+        self.read_header()
+        metadata: Dict[str, Any] = {}
+        for _ in range(self.kv_count):
+            key = self._read_string()
+            value_type = self._unpack("<I")
+            if keys is not None and key not in keys:
+                self._skip_value(value_type)
+                continue
+            if value_type == GGUF_ARRAY and max_array_length is not None:
+                start = self.offset
+                self._unpack("<I")
+                count = self._unpack("<Q")
+                self.offset = start
+                if count > max_array_length:
+                    self._skip_value(value_type)
+                    continue
+            metadata[key] = self._read_value(value_type)
+        return metadata
+
+    def read_tensor_infos(self) -> List[Dict[str, Any]]:
+        """
+        Read the tensor table that follows the metadata.
+
+        Must be called right after read_metadata.
+
+        Returns:
+            List of dictionaries with name, shape, type and offset
+        """
+        tensors = []
+        for _ in range(self.tensor_count):
+            name = self._read_string()
+            n_dims = self._unpack("<I")
+            shape = [self._unpack("<Q") for _ in range(n_dims)]
+            tensor_type = self._unpack("<I")
+            offset = self._unpack("<Q")
+            tensors.append({"name": name, "shape": shape, "type": tensor_type, "offset": offset})
+        return tensors
+
+def tensor_nbytes(shape: List[int], tensor_type: int) -> Optional[int]:
+    """
+    Size of a tensor's data in bytes.
+
+    Args:
+        shape: Tensor dimensions
+        tensor_type: ggml type id
+
+    Returns:
+        Byte size, or None for an unknown type
+    """
+    if tensor_type not in GGML_TYPES:
+        return None
+    _, block_size, type_size = GGML_TYPES[tensor_type]
+    elements = 1
+    for dim in shape:
+        elements *= dim
+    return elements // block_size * type_size
+
+def inspect_gguf(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Read a GGUF file's header and check that its tensor data is complete.
+
+    Only the metadata and tensor table are read; large arrays such as the
+    vocabulary are skipped.
+
+    Args:
+        path: GGUF model file
+
+    Returns:
+        Dictionary with architecture, name, context_length, quant_type,
+        tensor_count, kv_bytes_per_token, file_size and tensor_data_end
+
+    Raises:
+        GGUFError: If the file is not GGUF, is truncated or is inconsistent
+    """
+    with GGUFReader(path) as reader:
+        metadata = reader.read_metadata(max_array_length=64)
+        tensors = reader.read_tensor_infos()
+        alignment = metadata.get("general.alignment", GGUF_DEFAULT_ALIGNMENT)
+        data_offset = (reader.offset + alignment - 1) // alignment * alignment
+        file_size = reader.size
+
+    tensor_data_end = data_offset
+    for tensor in tensors:
+        nbytes = tensor_nbytes(tensor["shape"], tensor["type"])
+        if nbytes is None:
+            continue
+        tensor_data_end = max(tensor_data_end, data_offset + tensor["offset"] + nbytes)
+    if tensor_data_end > file_size:
+        raise GGUFError(
+            f"{path} is truncated: tensor data needs {tensor_data_end} bytes, file has {file_size}"
+        )
+
+    architecture = metadata.get("general.architecture", "unknown")
+    file_type = metadata.get("general.file_type")
+
+    # f16 K and V caches: 2 tensors x layers x KV heads x head dim x 2 bytes
+    block_count = metadata.get(f"{architecture}.block_count")
+    head_count = metadata.get(f"{architecture}.attention.head_count")
+    head_count_kv = metadata.get(f"{architecture}.attention.head_count_kv", head_count)
+    embedding_length = metadata.get(f"{architecture}.embedding_length")
+    head_dim = metadata.get(f"{architecture}.attention.key_length")
+    if head_dim is None and embedding_length and head_count:
+        head_dim = embedding_length // head_count
+    if isinstance(head_count_kv, list):
+        head_count_kv = max(head_count_kv)
+    kv_bytes_per_token = 2 * block_count * head_count_kv * head_dim * 2 if block_count and head_count_kv and head_dim else None
+
+    return {
+        "architecture": architecture,
+        "name": metadata.get("general.name"),
+        "context_length": metadata.get(f"{architecture}.context_length"),
+        "quant_type": GGUF_FILE_TYPES.get(file_type, str(file_type)) if file_type is not None else None,
+        "tensor_count": len(tensors),
+        "version": reader.version,
+        "kv_bytes_per_token": kv_bytes_per_token,
+        "file_size": file_size,
+        "tensor_data_end": tensor_data_end
+    }
+
+@lru_cache(maxsize=16)
+def _cached_model_info(path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    try:
+        info = inspect_gguf(path)
+        info["valid"] = True
+    except (GGUFError, OSError) as e:
+        info = {"valid": False, "error": str(e), "file_size": size}
+    return info
+
+def get_model_info(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Inspect a GGUF model, caching the result by (path, mtime, size).
+
+    Cheap enough to call on every Streamlit rerun: after the first call it
+    costs a single stat().
+
+    Args:
+        path: GGUF model file
+
+    Returns:
+        inspect_gguf fields plus "valid", or "valid": False with an "error"
+    """
+    try:
+        stat = Path(path).stat()
+    except OSError as e:
+        return {"valid": False, "error": str(e), "file_size": None}
+    return dict(_cached_model_info(str(path), stat.st_mtime_ns, stat.st_size))
+
+def read_gguf_metadata(path: Union[str, Path], keys: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Read GGUF key/value metadata.
+
+    Args:
+        path: GGUF model file
+        keys: Only decode these keys; all when None
+
+    Returns:
+        Dictionary of metadata values
+    """
+    with GGUFReader(path) as reader:
+        return reader.read_metadata(keys)
@@ -0,0 +1,144 @@
+"""
+Persistent chat history for the Llama 4 Chat Interface
+
+Conversations are stored in SQLite as append-only turns, numbered from 0
+within their conversation. The UI reads them a page at a time, so a long
+conversation costs one small query per rendered page rather than a full
+reload, and nothing is lost when the app restarts.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import HISTORY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# (user_message, assistant_message, response_time), the shape fit_conversation expects
+Turn = Tuple[str, str, str]
+
+class ChatHistoryStore:
+    """
+    Append-only SQLite store of conversations and their turns.
+
+    Turns are never updated or deleted; clearing a chat starts a new
+    conversation and leaves the old one in place.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, title TEXT NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, turns INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "user_message TEXT NOT NULL, assistant_message TEXT NOT NULL, "
+            "response_time TEXT NOT NULL, model TEXT, created_at REAL NOT NULL, "
+            "PRIMARY KEY (conversation_id, seq))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)")
+        self._db.commit()
+
+    def append_turn(self, conversation_id: str, user_message: str, assistant_message: str,
+                    response_time: str, model: Optional[str] = None) -> int:
+        """
+        Add a completed turn, creating the conversation on its first turn.
+
+        Args:
+            conversation_id: Conversation (chat session) identifier
+            user_message: The user's message
+            assistant_message: The model's reply
+            response_time: Formatted response time shown under the reply
+            model: MODEL_REGISTRY key that answered
+
+        Returns:
+            Sequence number of the new turn
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, user_message[:HISTORY_CONFIG["title_chars"]], now, now)
+            )
+            seq = self._db.execute("SELECT turns FROM conversations WHERE id = ?", (conversation_id,)).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO turns (conversation_id, seq, user_message, assistant_message, response_time, model, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, seq, user_message, assistant_message, response_time, model, now)
+            )
+            self._db.execute(
+                "UPDATE conversations SET turns = turns + 1, updated_at = ? WHERE id = ?",
+                (now, conversation_id)
+            )
+            self._db.commit()
+            return seq
+
+    def count_turns(self, conversation_id: str) -> int:
+        """Number of turns in a conversation, 0 if it does not exist"""
+        with self._lock:
+            row = self._db.execute("SELECT turns FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_turns(self, conversation_id: str, start: int = 0, end: Optional[int] = None) -> List[Turn]:
+        """
+        Read a range of turns in order.
+
+        Args:
+            conversation_id: Conversation identifier
+            start: First sequence number
+            end: Sequence number after the last one, None for all remaining turns
+
+        Returns:
+            Turns as (user_message, assistant_message, response_time) tuples
+        """
+        end = end if end is not None else 1 << 62
+        with self._lock:
+            return self._db.execute(
+                "SELECT user_message, assistant_message, response_time FROM turns "
+                "WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, start, end)
+            ).fetchall()
+
+    def list_conversations(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Most recently updated conversations.
+
+        Args:
+            limit: Maximum number of conversations
+
+        Returns:
+            Dictionaries with id, title, turns and updated_at
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, title, turns, updated_at FROM conversations ORDER BY updated_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [{"id": row[0], "title": row[1], "turns": row[2], "updated_at": row[3]} for row in rows]
+
+_store: Optional[ChatHistoryStore] = None
+_store_lock = threading.Lock()
+
+def get_history_store() -> ChatHistoryStore:
+    """
+    Get the process-wide chat history store.
+
+    Returns:
+        The shared store
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatHistoryStore(HISTORY_CONFIG["db_path"])
+        return _store
@@ -0,0 +1,444 @@
+"""
+Concurrent-user load test for the Llama 4 Chat Interface
+
+Replays conversations through the same path a chat turn takes in app.py
+(sanitize_input, fit_conversation, stream_llama_inference with a session
+per user) and reports, for each concurrency level, throughput, latency
+percentiles, error/timeout/rejection rates and CPU/RSS over time:
+
+    python loadtest.py --stub --concurrency 1,2,4,8           # fake llama-cli, any machine
+    python loadtest.py --input conversations.jsonl --rate 0.5 --concurrency 8
+    python loadtest.py --from-history 20 --concurrency 2,4
+
+Conversations are synthetic (seeded, so every run sends the same
+messages), read from JSONL ({"id": "c1", "system_prompt": "...", "turns":
+["Salom!", "..."]}, or a batch.py {"prompt": ...} line as a one-turn
+conversation) or taken from the stored chat history. With --rate they
+arrive as a Poisson process; without it they all start at once. At most
+--concurrency conversations are in flight, each sending its turns in order.
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from config import RESPONSE_CACHE_CONFIG, SEMANTIC_CACHE_CONFIG, MODEL_REGISTRY, DEFAULT_MODEL, setup_environment
+from bench import percentile, use_stub_backend
+from backends import get_backend
+from context_window import fit_conversation
+from scheduler import get_scheduler
+from utils import (
+    sanitize_input,
+    stream_llama_inference,
+    clear_session_cache,
+    InferenceError,
+    InferenceBusyError,
+    InferenceTimeoutError
+)
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_TOPICS = [
+    "Python generators", "the industrial revolution", "photosynthesis", "Samarkand",
+    "binary search", "climate change", "the Silk Road", "neural networks",
+    "healthy breakfast ideas", "REST APIs", "black holes", "learning a new language"
+]
+SYNTHETIC_OPENERS = [
+    "Explain {topic} in simple terms.",
+    "What are the most important facts about {topic}?",
+    "{topic} haqida qisqacha gapirib bering.",
+    "Write a short paragraph about {topic}."
+]
+SYNTHETIC_FOLLOW_UPS = [
+    "Can you give an example?",
+    "Summarize that in one sentence.",
+    "Why does that matter?",
+    "Tell me more about the last point.",
+    "Rahmat! Yana bitta misol keltira olasizmi?"
+]
+
+def synthetic_conversations(count: int, max_turns: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    Generate reproducible conversations.
+
+    Args:
+        count: Number of conversations
+        max_turns: Most user turns per conversation
+        seed: Random seed; the same seed gives the same conversations
+
+    Returns:
+        Conversations with id and turns
+    """
+    rng = random.Random(seed)
+    conversations = []
+    for index in range(count):
+        topic = rng.choice(SYNTHETIC_TOPICS)
+        turns = [rng.choice(SYNTHETIC_OPENERS).format(topic=topic)]
+        turns += [rng.choice(SYNTHETIC_FOLLOW_UPS) for _ in range(rng.randint(0, max_turns - 1))]
+        conversations.append({"id": f"synthetic-{index}", "turns": turns})
+    return conversations
+
+def read_conversations(input_path: Path) -> List[Dict[str, Any]]:
+    """
+    Read recorded conversations from a JSONL file.
+
+    Args:
+        input_path: One conversation object (or batch.py prompt object) per line
+
+    Returns:
+        Conversations with id, turns and optional system_prompt
+    """
+    conversations = []
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            turns = record.get("turns") or ([record["prompt"]] if "prompt" in record else [])
+            if not turns:
+                raise ValueError(f"Line {line_number}: expected \"turns\" or \"prompt\"")
+            conversations.append({
+                "id": str(record.get("id", line_number)),
+                "turns": turns,
+                "system_prompt": record.get("system_prompt")
+            })
+    return conversations
+
+def history_conversations(limit: int) -> List[Dict[str, Any]]:
+    """
+    Take the user messages of the most recent stored chat conversations.
+
+    Args:
+        limit: Number of conversations
+
+    Returns:
+        Conversations with id and turns
+    """
+    from history_store import get_history_store
+    store = get_history_store()
+    return [
+        {"id": conversation["id"], "turns": [turn[0] for turn in store.get_turns(conversation["id"])]}
+        for conversation in store.list_conversations(limit)
+    ]
+
+class ResourceSampler:
+    """
+    Samples CPU and RSS of this process and its llama.cpp children in a
+    background thread.
+
+    CPU time of llama-cli processes that already exited is included through
+    the children times of this process, so short requests are not missed.
+    RSS is summed over the processes; mmapped model pages they share are
+    counted once per process.
+    """
+
+    def __init__(self, interval: float):
+        import psutil
+        self.interval = interval
+        self.samples: List[Dict[str, Any]] = []
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="loadtest-sampler")
+
+    def _cpu_seconds(self, children) -> float:
+        times = self._process.cpu_times()
+        total = times.user + times.system + times.children_user + times.children_system
+        for child in children:
+            try:
+                child_times = child.cpu_times()
+                total += child_times.user + child_times.system
+            except Exception:
+                pass  # Exited since it was listed
+        return total
+
+    def _rss_bytes(self, children) -> int:
+        total = self._process.memory_info().rss
+        for child in children:
+            try:
+                total += child.memory_info().rss
+            except Exception:
+                pass
+        return total
+
+    def _run(self) -> None:
+        start = time.time()
+        last_time, last_cpu = start, self._cpu_seconds(self._process.children(recursive=True))
+        while not self._stop.wait(self.interval):
+            children = self._process.children(recursive=True)
+            now, cpu = time.time(), self._cpu_seconds(children)
+            status = get_scheduler().status()
+            self.samples.append({
+                "t": round(now - start, 3),
+                "cpu_percent": round(max(0.0, cpu - last_cpu) * 100 / (now - last_time), 1),
+                "rss_bytes": self._rss_bytes(children),
+                "processes": 1 + len(children),
+                "running": status["running"],
+                "queued": status["queued"]
+            })
+            last_time, last_cpu = now, cpu
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> List[Dict[str, Any]]:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+def run_turn(history: List[tuple], message: str, session_id: str, system_prompt: Optional[str],
+             config: Dict[str, Any], window: Optional[Dict[str, int]], timeout: float,
+             issued_at: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Send one user message the way app.py does and time it.
+
+    Args:
+        history: Previous (user, assistant, response_time) turns, extended in place on success
+        message: Raw user message
+        session_id: Chat session of the virtual user
+        system_prompt: Optional system prompt
+        config: Inference configuration overrides
+        window: Context window from the previous turn
+        timeout: Seconds before the turn is cancelled and counted as a timeout
+        issued_at: When the turn was due to be sent; latency and TTFT are
+            measured from it, so time spent waiting for a free virtual user counts
+
+    Returns:
+        Turn measurements, including the window for the next turn
+    """
+    started_at = time.time()
+    issued_at = issued_at or started_at
+    sanitized_input = sanitize_input(message)
+    context = fit_conversation(history, sanitized_input, system_prompt=system_prompt,
+                               custom_config=config, window=window)
+    request_config = dict(config, max_tokens=context["max_tokens"])
+
+    stats: Dict[str, Any] = {}
+    cancel_event = threading.Event()
+    deadline = threading.Timer(timeout, cancel_event.set)
+    deadline.start()
+    response = ""
+    first_chunk_at = None
+    try:
+        for chunk in stream_llama_inference(context["prompt"], request_config, session_id, stats=stats,
+                                            question=sanitized_input, cancel_event=cancel_event):
+            first_chunk_at = first_chunk_at or time.time()
+            response += chunk
+        outcome = "timeout" if cancel_event.is_set() else "ok"
+    except InferenceBusyError:
+        outcome = "rejected"
+    except InferenceTimeoutError:
+        outcome = "timeout"
+    except InferenceError:
+        outcome = "error"
+    finally:
+        deadline.cancel()
+    finished_at = time.time()
+
+    if outcome == "ok":
+        history.append((sanitized_input, response.strip(), f"{finished_at - issued_at:.2f}s"))
+    return {
+        "outcome": outcome,
+        "issued_at": issued_at,
+        "latency_seconds": finished_at - issued_at,
+        "ttft_seconds": first_chunk_at - issued_at if first_chunk_at else None,
+        "start_delay_seconds": started_at - issued_at,
+        "queue_seconds": stats.get("queue_seconds"),
+        "prompt_tokens": context["prompt_tokens"],
+        "generated_tokens": stats.get("predicted_n", 0),
+        "window": context["window"]
+    }
+
+def run_conversation(conversation: Dict[str, Any], config: Dict[str, Any], think_time: float,
+                     timeout: float, scheduled_at: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Play one conversation as a virtual user, turn after turn.
+
+    Stops at the first failed turn, like a user whose request errored.
+    With scheduled_at, the first turn is timed from the conversation's
+    arrival rather than from when a pool thread picked it up.
+
+    Returns:
+        Measurements of each turn sent
+    """
+    session_id = f"loadtest-{uuid.uuid4().hex}"
+    history: List[tuple] = []
+    window = None
+    samples = []
+    try:
+        for index, message in enumerate(conversation["turns"]):
+            if index and think_time:
+                time.sleep(think_time)
+            sample = run_turn(history, message, session_id, conversation.get("system_prompt"),
+                              config, window, timeout, scheduled_at if index == 0 else None)
+            window = sample.pop("window")
+            sample.update(conversation=conversation["id"], turn=index)
+            samples.append(sample)
+            if sample["outcome"] != "ok":
+                break
+    finally:
+        clear_session_cache(session_id)
+    return samples
+
+def summarize(samples: List[Dict[str, Any]], resources: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    """
+    Aggregate the turns and resource samples of one load level.
+
+    Args:
+        samples: Turn measurements
+        resources: ResourceSampler samples
+        duration: Wall time of the level in seconds
+
+    Returns:
+        Summary metrics
+    """
+    ok = [s for s in samples if s["outcome"] == "ok"]
+    latencies = [s["latency_seconds"] for s in ok]
+    ttfts = [s["ttft_seconds"] for s in ok if s["ttft_seconds"] is not None]
+    counts = {outcome: sum(s["outcome"] == outcome for s in samples) for outcome in ("ok", "error", "timeout", "rejected")}
+    total = len(samples)
+    cpu = [r["cpu_percent"] for r in resources]
+    rss = [r["rss_bytes"] for r in resources]
+    return {
+        "turns": total,
+        **counts,
+        "error_rate": counts["error"] / total if total else 0.0,
+        "timeout_rate": counts["timeout"] / total if total else 0.0,
+        "rejected_rate": counts["rejected"] / total if total else 0.0,
+        "duration_seconds": round(duration, 3),
+        "throughput_turns_per_second": len(ok) / duration if duration else None,
+        "generated_tokens_per_second": sum(s["generated_tokens"] for s in ok) / duration if duration else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "start_delay_p95": percentile([s["start_delay_seconds"] for s in samples], 95),
+        "cpu_percent_mean": sum(cpu) / len(cpu) if cpu else None,
+        "cpu_percent_max": max(cpu) if cpu else None,
+        "rss_bytes_max": max(rss) if rss else None
+    }
+
+def run_level(conversations: List[Dict[str, Any]], concurrency: int, rate: Optional[float],
+              config: Dict[str, Any], think_time: float, timeout: float, seed: int,
+              sample_interval: float) -> Dict[str, Any]:
+    """
+    Run every conversation at one concurrency level.
+
+    Args:
+        conversations: Conversations to replay
+        concurrency: Most conversations in flight at once
+        rate: Conversation arrivals per second (Poisson), None to start all at once.
+            Latency is measured from each arrival, including the wait for a free user
+        config: Inference configuration overrides
+        think_time: Seconds a user waits between turns
+        timeout: Seconds per turn before it counts as a timeout
+        seed: Seed of the arrival times
+        sample_interval: Seconds between resource samples
+
+    Returns:
+        Level result with summary, resource series and turn samples
+    """
+    rng = random.Random(seed)
+    sampler = ResourceSampler(sample_interval)
+    sampler.start()
+    start = time.time()
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadtest-user") as executor:
+        arrival = 0.0
+        for conversation in conversations:
+            scheduled_at = None
+            if rate:
+                # Open model: arrivals keep their schedule when every user is busy
+                arrival += rng.expovariate(rate)
+                scheduled_at = start + arrival
+                time.sleep(max(0.0, scheduled_at - time.time()))
+            futures.append(executor.submit(run_conversation, conversation, config, think_time, timeout, scheduled_at))
+    duration = time.time() - start
+    resources = sampler.stop()
+
+    samples = [sample for future in futures for sample in future.result()]
+    for sample in samples:
+        sample["issued_at"] = round(sample["issued_at"] - start, 3)
+    summary = summarize(samples, resources, duration)
+    logger.info(
+        f"concurrency {concurrency}: {summary['ok']}/{summary['turns']} ok, "
+        f"p95 {summary['latency_p95'] or 0:.2f}s, {summary['throughput_turns_per_second'] or 0:.2f} turns/s"
+    )
+    return {
+        "concurrency": concurrency,
+        "rate": rate,
+        "summary": summary,
+        "resources": resources,
+        "samples": samples
+    }
+
+def main():
+    """Main load test function"""
+    parser = argparse.ArgumentParser(description="Load-test the chat inference path with concurrent users")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--input", type=Path, default=None, help="JSONL conversations to replay")
+    source.add_argument("--from-history", type=int, default=None, metavar="N",
+                        help="Replay the N most recent stored chat conversations")
+    parser.add_argument("--conversations", type=int, default=20, help="Synthetic conversations per level")
+    parser.add_argument("--max-turns", type=int, default=3, help="Most turns per synthetic conversation")
+    parser.add_argument("--concurrency", default="1,2,4",
+                        help="Comma-separated concurrent users per level, e.g. 1,2,4,8")
+    parser.add_argument("--rate", type=float, default=None, help="Conversation arrivals per second")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds between a user's turns")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds per turn before it times out")
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--model", choices=list(MODEL_REGISTRY), default=DEFAULT_MODEL)
+    parser.add_argument("--seed", type=int, default=42, help="Seed of synthetic conversations and arrivals")
+    parser.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between CPU/RSS samples")
+    parser.add_argument("--output", type=Path, default=None, help="Write results JSON here")
+    parser.add_argument("--stub", action="store_true", help="Use the fake llama-cli instead of a real model")
+    args = parser.parse_args()
+
+    setup_environment()
+    # Replayed messages must reach the model, not the response caches
+    RESPONSE_CACHE_CONFIG["enabled"] = False
+    SEMANTIC_CACHE_CONFIG["enabled"] = False
+    if args.stub:
+        use_stub_backend()
+
+    if args.input:
+        conversations = read_conversations(args.input)
+    elif args.from_history:
+        conversations = history_conversations(args.from_history)
+    else:
+        conversations = synthetic_conversations(args.conversations, args.max_turns, args.seed)
+    if not conversations:
+        logger.error("No conversations to replay")
+        sys.exit(1)
+
+    config = {"model": args.model, "max_tokens": args.max_tokens}
+    get_backend().start(args.model)
+    levels = [
+        run_level(conversations, int(level), args.rate, config, args.think_time, args.timeout,
+                  args.seed, args.sample_interval)
+        for level in args.concurrency.split(",")
+    ]
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": get_backend().name,
+        "model": args.model,
+        "max_concurrent": get_scheduler().max_concurrent,
+        "conversations": len(conversations),
+        "levels": levels
+    }
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(json.dumps([dict(level["summary"], concurrency=level["concurrency"]) for level in levels], indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Prometheus metrics for the Llama 4 Chat Interface
+
+Counters and histograms are recorded around every inference request and
+served in the Prometheus text format from a small HTTP thread:
+
+    curl http://127.0.0.1:9101/metrics
+
+The exposition format is written directly so no client library is needed.
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Callable, List, Sequence, Tuple
+
+from config import METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """Base class holding a metric's name, help text and label names"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts, then sum and count
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state):
+                    labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} unavailable: {e}")
+            return []
+        return [] if value is None else [f"{self.name} {value}"]
+
+_process_handle = None
+
+def _process():
+    # Reuse one handle so cpu_percent measures the interval between scrapes
+    global _process_handle
+    if _process_handle is None:
+        import psutil
+        _process_handle = psutil.Process()
+    return _process_handle
+
+def _scheduler_status(field: str) -> Callable[[], float]:
+    def read():
+        from scheduler import get_scheduler
+        return get_scheduler().status()[field]
+    return read
+
+REQUESTS = Counter("llama_requests_total", "Inference requests by backend and outcome", ["backend", "outcome"])
+REQUEST_SECONDS = Histogram("llama_request_seconds", "Wall time of inference requests", LATENCY_BUCKETS, ["backend"])
+QUEUE_WAIT_SECONDS = Histogram("llama_queue_wait_seconds", "Time spent waiting for a scheduler slot", LATENCY_BUCKETS)
+FIRST_TOKEN_SECONDS = Histogram("llama_time_to_first_token_seconds", "Time from admission to the first token", LATENCY_BUCKETS, ["backend"])
+MODEL_LOAD_SECONDS = Histogram("llama_model_load_seconds", "Model load time", LATENCY_BUCKETS + (600,), ["backend"])
+PROMPT_TOKENS_PER_SECOND = Histogram("llama_prompt_eval_tokens_per_second", "Prompt evaluation speed", THROUGHPUT_BUCKETS, ["backend"])
+GENERATION_TOKENS_PER_SECOND = Histogram("llama_generation_tokens_per_second", "Generation speed", THROUGHPUT_BUCKETS, ["backend"])
+INPUT_TOKENS = Counter("llama_input_tokens_total", "Prompt tokens evaluated", ["backend"])
+OUTPUT_TOKENS = Counter("llama_output_tokens_total", "Tokens generated", ["backend"])
+DRAFT_TOKENS = Counter("llama_draft_tokens_total", "Speculative decoding tokens drafted, by whether the model accepted them", ["backend", "result"])
+
+REGISTRY: List[Metric] = [
+    REQUESTS,
+    REQUEST_SECONDS,
+    QUEUE_WAIT_SECONDS,
+    FIRST_TOKEN_SECONDS,
+    MODEL_LOAD_SECONDS,
+    PROMPT_TOKENS_PER_SECOND,
+    GENERATION_TOKENS_PER_SECOND,
+    INPUT_TOKENS,
+    OUTPUT_TOKENS,
+    DRAFT_TOKENS,
+    Gauge("process_resident_memory_bytes", "Resident memory of this process", lambda: _process().memory_info().rss),
+    Gauge("process_cpu_percent", "CPU use of this process since the last scrape", lambda: _process().cpu_percent(None)),
+    Gauge("llama_scheduler_running", "Requests holding a scheduler slot", _scheduler_status("running")),
+    Gauge("llama_scheduler_queued", "Requests waiting for a scheduler slot", _scheduler_status("queued"))
+]
+
+def record_request(stats: Dict[str, Any], backend: str, outcome: str) -> None:
+    """
+    Record one finished inference request.
+
+    Args:
+        stats: Stats dictionary filled by stream_llama_inference
+        backend: "server", "cli" or "cache"
+        outcome: "ok", "error", "timeout" or "rejected"
+    """
+    REQUESTS.inc(backend=backend, outcome=outcome)
+    if "queue_seconds" in stats:
+        QUEUE_WAIT_SECONDS.observe(stats["queue_seconds"])
+    if outcome != "ok":
+        return
+    if "total_seconds" in stats:
+        REQUEST_SECONDS.observe(stats["total_seconds"], backend=backend)
+    if "ttft_seconds" in stats:
+        FIRST_TOKEN_SECONDS.observe(stats["ttft_seconds"], backend=backend)
+    if stats.get("load_ms"):
+        MODEL_LOAD_SECONDS.observe(stats["load_ms"] / 1000, backend=backend)
+    if stats.get("prompt_per_second"):
+        PROMPT_TOKENS_PER_SECOND.observe(stats["prompt_per_second"], backend=backend)
+    if stats.get("predicted_per_second"):
+        GENERATION_TOKENS_PER_SECOND.observe(stats["predicted_per_second"], backend=backend)
+    INPUT_TOKENS.inc(stats.get("prompt_n", 0), backend=backend)
+    OUTPUT_TOKENS.inc(stats.get("predicted_n", 0), backend=backend)
+    if stats.get("draft_n"):
+        DRAFT_TOKENS.inc(stats["draft_n_accepted"], backend=backend, result="accepted")
+        DRAFT_TOKENS.inc(stats["draft_n"] - stats["draft_n_accepted"], backend=backend, result="rejected")
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_metrics_server() -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics on METRICS_CONFIG host and port, once per process.
+
+    Returns:
+        The running server, or None when metrics are disabled or the port
+        is taken (e.g. by another Streamlit process)
+    """
+    global _server
+    if not METRICS_CONFIG["enabled"]:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((METRICS_CONFIG["host"], METRICS_CONFIG["port"]), MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Metrics endpoint not started: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+            logger.info(f"Serving metrics on http://{METRICS_CONFIG['host']}:{METRICS_CONFIG['port']}/metrics")
+        return _server
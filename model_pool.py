@@ -0,0 +1,204 @@
+"""
+RAM-budgeted pool of loaded models
+
+Backends that keep a model loaded (llama-server workers, the in-process
+binding) hold one instance per MODEL_REGISTRY entry in a ModelPool.
+Switching back to a model that is still loaded costs nothing. Loading a
+new one first evicts the least recently used idle models until the new
+one fits the RAM budget. Each model's footprint is estimated from its
+file size plus the KV cache for its context.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Iterator, List
+
+from config import MODEL_POOL_CONFIG, get_model_path, get_draft_model_path
+
+logger = logging.getLogger(__name__)
+
+GIB = 1024**3
+
+def estimate_model_bytes(model: str) -> int:
+    """
+    Estimate the RAM a loaded model needs.
+
+    Args:
+        model: MODEL_REGISTRY key
+
+    Returns:
+        Weights (the GGUF file size, plus the draft's when speculative
+        decoding will load it) and the KV cache for the model's ctx_size, in bytes
+    """
+    from gguf import get_model_info
+    from utils import resolve_inference_config
+
+    config = resolve_inference_config({"model": model})
+    model_info = get_model_info(get_model_path(model))
+    weights = model_info.get("file_size") or 0
+    draft_path = get_draft_model_path(model)
+    if config["speculative"] and draft_path is not None and draft_path.exists():
+        weights += draft_path.stat().st_size
+    kv_bytes_per_token = model_info.get("kv_bytes_per_token") or 0
+    return weights + kv_bytes_per_token * config["ctx_size"]
+
+class ModelPool:
+    """
+    Loaded model instances, least recently used first.
+
+    Usage:
+        pool = ModelPool("llama-server", load=start_worker, unload=stop_worker)
+        with pool.use("scout-17b") as worker:
+            ... run a request ...
+
+    Models serving a request are never evicted. When every loaded model is
+    busy, the new one is loaded over budget rather than failing the request.
+    """
+
+    def __init__(self, name: str, load: Callable[[str], Any], unload: Callable[[Any], None],
+                 ram_budget_bytes: Optional[int] = None):
+        self.name = name
+        self._load = load
+        self._unload = unload
+        self._ram_budget_bytes = ram_budget_bytes
+        self._loaded: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # Bytes set aside for models being loaded, so concurrent loads see each other
+        self._reserved: Dict[str, int] = {}
+        self._in_use: Dict[str, int] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def ram_budget(self) -> int:
+        """
+        RAM the pool may fill, in bytes.
+
+        Without a configured budget this is the available memory plus what
+        the pool already holds, minus the headroom.
+        """
+        if self._ram_budget_bytes is not None:
+            return self._ram_budget_bytes
+        if MODEL_POOL_CONFIG["ram_budget_gb"] is not None:
+            return int(MODEL_POOL_CONFIG["ram_budget_gb"] * GIB)
+        import psutil
+        available = psutil.virtual_memory().available + sum(self._sizes.values())
+        return int(available - MODEL_POOL_CONFIG["ram_headroom_gb"] * GIB)
+
+    def acquire(self, model: str) -> Any:
+        """
+        Get a model's instance, loading it if needed, and mark it in use.
+
+        Args:
+            model: MODEL_REGISTRY key
+
+        Returns:
+            The loaded instance; pass the model to release() when done
+        """
+        with self._lock:
+            if model in self._loaded:
+                return self._take(model)
+            load_lock = self._load_locks.setdefault(model, threading.Lock())
+
+        # Loading takes long, so only requests for the same model wait on it
+        with load_lock:
+            with self._lock:
+                if model in self._loaded:
+                    return self._take(model)
+            size = estimate_model_bytes(model)
+            self._make_room(model, size)
+            logger.info(f"Loading {model} into the {self.name} pool ({size / GIB:.1f} GB)")
+            try:
+                instance = self._load(model)
+            except BaseException:
+                with self._lock:
+                    self._reserved.pop(model, None)
+                raise
+            with self._lock:
+                self._reserved.pop(model, None)
+                self._loaded[model] = instance
+                self._sizes[model] = size
+                return self._take(model)
+
+    def _take(self, model: str) -> Any:
+        self._loaded.move_to_end(model)
+        self._in_use[model] = self._in_use.get(model, 0) + 1
+        return self._loaded[model]
+
+    def release(self, model: str) -> None:
+        """Mark one use of a model as finished"""
+        with self._lock:
+            self._in_use[model] = max(0, self._in_use.get(model, 0) - 1)
+
+    @contextmanager
+    def use(self, model: str) -> Iterator[Any]:
+        """Hold a model's instance for the duration of a request"""
+        instance = self.acquire(model)
+        try:
+            yield instance
+        finally:
+            self.release(model)
+
+    def _make_room(self, model: str, size: int) -> None:
+        """
+        Evict idle models, least recently used first, until size more bytes
+        fit, and reserve them for the model.
+
+        The budget check and the reservation happen under one hold of the
+        pool lock, so two models loading at once cannot both claim the
+        same free bytes. acquire() turns the reservation into the loaded
+        size, or drops it when the load fails.
+        """
+        while True:
+            with self._lock:
+                budget = self.ram_budget()
+                used = sum(self._sizes.values()) + sum(self._reserved.values())
+                if used + size <= budget:
+                    self._reserved[model] = size
+                    return
+                idle = [name for name in self._loaded if name != model and not self._in_use.get(name)]
+                if not idle:
+                    logger.warning(
+                        f"Loading {model} exceeds the RAM budget ({(used + size) / GIB:.1f} of "
+                        f"{budget / GIB:.1f} GB); every loaded model is busy"
+                    )
+                    self._reserved[model] = size
+                    return
+                victim = idle[0]
+                instance = self._loaded.pop(victim)
+                self._sizes.pop(victim)
+            logger.info(f"Evicting {victim} from the {self.name} pool to make room for {model}")
+            self._unload(instance)
+
+    def evict(self, model: str) -> None:
+        """Unload a model now, e.g. to force a fresh load"""
+        with self._lock:
+            instance = self._loaded.pop(model, None)
+            self._sizes.pop(model, None)
+        if instance is not None:
+            self._unload(instance)
+
+    def clear(self) -> None:
+        """Unload every model"""
+        for model in self.loaded():
+            self.evict(model)
+
+    def loaded(self) -> List[str]:
+        """Loaded models, least recently used first"""
+        with self._lock:
+            return list(self._loaded)
+
+    def get(self, model: str) -> Optional[Any]:
+        """A model's instance if it is loaded, without touching the LRU order"""
+        with self._lock:
+            return self._loaded.get(model)
+
+    def status(self) -> Dict[str, Any]:
+        """Summary for the sidebar"""
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "in_use": {name: count for name, count in self._in_use.items() if count},
+                "used_gb": sum(self._sizes.values()) / GIB
+            }
@@ -0,0 +1,147 @@
+"""
+Shared KV snapshots of common prompt prefixes
+
+Every chat turn starts with the same system prompt. Its evaluated KV
+state is computed once per model and saved as a read-only prompt-cache
+file, named after a hash of the model identity and the prefix text.
+Requests whose prompt starts with a known prefix load the snapshot, so
+llama.cpp only evaluates the user-specific suffix:
+
+- llama-cli: new sessions start from a copy of the snapshot; requests
+  without a session read it with --prompt-cache-ro
+- llama-server: new sessions restore the snapshot into the slot
+
+Nothing is shared until a system prompt is configured, either
+UI_CONFIG["system_prompt"] or PREFIX_CACHE_CONFIG["system_prompts"].
+"""
+
+import hashlib
+import json
+import logging
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, List
+
+from config import PREFIX_CACHE_CONFIG, PROMPT_CACHE_DIR, UI_CONFIG, DEFAULT_MODEL, get_model_path
+from response_cache import model_identity
+
+logger = logging.getLogger(__name__)
+
+_build_lock = threading.Lock()
+
+def shared_system_prompts() -> List[str]:
+    """System prompts whose evaluated state is worth sharing"""
+    prompts = [UI_CONFIG["system_prompt"]] + PREFIX_CACHE_CONFIG["system_prompts"]
+    return [prompt for prompt in dict.fromkeys(prompts) if prompt]
+
+def shared_prefixes(model: Optional[str] = None) -> List[str]:
+    """Formatted prompt prefixes for the shared system prompts, longest first"""
+    from utils import format_turn, get_chat_format
+    chat_format = get_chat_format(model)
+    prefixes = (format_turn("system", prompt, chat_format) for prompt in shared_system_prompts())
+    return sorted(prefixes, key=len, reverse=True)
+
+def get_prefix_cache_path(prefix: str, backend: str, model: Optional[str] = None) -> Path:
+    """
+    Get the snapshot file for a prompt prefix on the current model.
+
+    Snapshots live next to the session caches because llama-server only
+    restores slots from its --slot-save-path. The dots in the name keep
+    them apart from session files.
+
+    Args:
+        prefix: Formatted prompt prefix
+        backend: "cli" or "slot", as for session caches
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        Path of the snapshot file
+    """
+    key_data = {"model": model_identity(get_model_path(model)), "prefix": prefix}
+    digest = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+    return PROMPT_CACHE_DIR / f"prefix.{digest}.{backend}.bin"
+
+def find_prefix_snapshot(prompt: str, backend: str, model: Optional[str] = None) -> Optional[Path]:
+    """
+    Find a precomputed snapshot for the start of a prompt.
+
+    Args:
+        prompt: Full formatted prompt
+        backend: "cli" or "slot"
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        Path of the longest matching snapshot, or None
+    """
+    if not PREFIX_CACHE_CONFIG["enabled"]:
+        return None
+    for prefix in shared_prefixes(model):
+        if prompt.startswith(prefix):
+            path = get_prefix_cache_path(prefix, backend, model)
+            if path.exists():
+                return path
+    return None
+
+def _build_cli_snapshot(prefix: str, path: Path, model: str) -> None:
+    """Evaluate a prefix with llama-cli and keep its prompt cache"""
+    from backends import build_cli_command
+    from utils import resolve_inference_config
+
+    with tempfile.NamedTemporaryFile(delete=False, mode="w", suffix=".txt", encoding="utf-8") as tmp_prompt:
+        tmp_prompt.write(prefix)
+        tmp_prompt_path = tmp_prompt.name
+    # Written under a temporary name so a failed run never leaves a bad snapshot
+    partial_path = path.with_suffix(".tmp")
+    try:
+        config = dict(resolve_inference_config({"model": model}), max_tokens=1)
+        cmd = build_cli_command(config, tmp_prompt_path) + ["--prompt-cache", str(partial_path)]
+        result = subprocess.run(cmd, capture_output=True, stdin=subprocess.DEVNULL, timeout=600)
+        if result.returncode != 0 or not partial_path.exists():
+            raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip() or "no prompt cache written")
+        os.replace(partial_path, path)
+    finally:
+        os.unlink(tmp_prompt_path)
+        partial_path.unlink(missing_ok=True)
+
+def build_prefix_snapshots(backend: str, model: Optional[str] = None) -> List[Path]:
+    """
+    Precompute snapshots for every shared prefix that lacks one.
+
+    Safe to call on every startup; existing snapshots are kept.
+
+    Args:
+        backend: "cli" or "slot"
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        Paths of the available snapshots
+    """
+    if not PREFIX_CACHE_CONFIG["enabled"]:
+        return []
+    model = model or DEFAULT_MODEL
+    available = []
+    with _build_lock:
+        PROMPT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for prefix in shared_prefixes(model):
+            path = get_prefix_cache_path(prefix, backend, model)
+            if not path.exists():
+                logger.info(f"Precomputing shared prompt prefix ({len(prefix)} chars) into {path.name}")
+                try:
+                    if backend == "slot":
+                        from worker import use_worker
+                        # Held so the pool cannot evict the worker mid-save
+                        with use_worker(model) as worker:
+                            worker.save_prefix(prefix, path.name)
+                    else:
+                        _build_cli_snapshot(prefix, path, model)
+                except Exception as e:
+                    logger.warning(f"Could not precompute prompt prefix: {e}")
+                    continue
+                # Shared by every session; nothing may write to it
+                path.chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            available.append(path)
+    return available
@@ -0,0 +1,246 @@
+"""
+Model page-cache residency for the Llama 4 Chat Interface
+
+llama.cpp mmaps the GGUF, so a request after a restart or after memory
+pressure pays for page faults across the whole file. At startup the model
+is read through a shared read-only mapping with readahead, which leaves it
+in the page cache for every llama.cpp process mapping the same file.
+Optionally the mapping is pinned with mlock, when RAM allows, so the
+pages cannot be evicted while this process runs. mincore reports how much
+of the model is resident.
+
+Uses libc through ctypes (Linux and macOS). Elsewhere the warm-up falls
+back to reading the file and residency is unknown.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from config import RESIDENCY_CONFIG, get_model_path
+
+logger = logging.getLogger(__name__)
+
+GIB = 1024**3
+PROT_READ = 0x1
+MAP_SHARED = 0x01
+MADV_SEQUENTIAL = 2
+MADV_WILLNEED = 3
+MAP_FAILED = ctypes.c_void_p(-1).value
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    if os.name == "nt":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.madvise.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.munlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+    return libc
+
+_libc = _load_libc()
+
+class MappedModel:
+    """
+    Shared read-only mapping of a model file.
+
+    The mapping shares the page cache with llama.cpp's own mapping of the
+    file, so pages faulted in or locked here are the pages it reads.
+    """
+
+    def __init__(self, path: Path):
+        if _libc is None:
+            raise OSError("mmap through libc is not available on this platform")
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        self.locked = False
+        if not self.size:
+            raise OSError(f"{self.path} is empty")
+        self._fd = os.open(str(self.path), os.O_RDONLY)
+        self.address = _libc.mmap(None, self.size, PROT_READ, MAP_SHARED, self._fd, 0)
+        if self.address in (None, MAP_FAILED):
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"mmap of {self.path} failed: {os.strerror(errno)}")
+
+    def prewarm(self, chunk_bytes: int) -> float:
+        """
+        Fault the whole file in, chunk by chunk, with readahead hints.
+
+        Args:
+            chunk_bytes: Bytes touched per step
+
+        Returns:
+            Seconds taken
+        """
+        start = time.time()
+        _libc.madvise(self.address, self.size, MADV_SEQUENTIAL)
+        for offset in range(0, self.size, chunk_bytes):
+            length = min(chunk_bytes, self.size - offset)
+            _libc.madvise(self.address + offset, length, MADV_WILLNEED)
+            # Copying the chunk touches every page of it
+            ctypes.string_at(self.address + offset, length)
+        return time.time() - start
+
+    def lock(self) -> bool:
+        """
+        Pin the mapping in RAM.
+
+        Returns:
+            True if locked; False when the memlock limit or permissions refuse it
+        """
+        if _libc.mlock(self.address, self.size) != 0:
+            errno = ctypes.get_errno()
+            logger.warning(
+                f"Could not mlock {self.path.name}: {os.strerror(errno)}; raise the memlock "
+                f"limit (ulimit -l) or grant CAP_IPC_LOCK to pin the model"
+            )
+            return False
+        self.locked = True
+        return True
+
+    def resident_bytes(self) -> int:
+        """Bytes of the file currently in the page cache, from mincore"""
+        pages = (self.size + PAGE_SIZE - 1) // PAGE_SIZE
+        vector = (ctypes.c_ubyte * pages)()
+        if _libc.mincore(self.address, self.size, vector) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"mincore of {self.path} failed: {os.strerror(errno)}")
+        resident_pages = pages - bytes(vector).count(0)
+        return min(resident_pages * PAGE_SIZE, self.size)
+
+    def close(self) -> None:
+        """Unmap (and so unlock) the file"""
+        if self.address not in (None, MAP_FAILED):
+            _libc.munmap(self.address, self.size)
+            self.address = None
+            os.close(self._fd)
+        self.locked = False
+
+def _read_file(path: Path, chunk_bytes: int) -> float:
+    """Warm the OS file cache by reading the file where mmap is unavailable"""
+    start = time.time()
+    buffer = bytearray(chunk_bytes)
+    with open(path, "rb", buffering=0) as f:
+        while f.readinto(buffer):
+            pass
+    return time.time() - start
+
+# Models pinned with mlock stay mapped for the life of the process
+_locked: Dict[str, MappedModel] = {}
+_warmups: Dict[str, threading.Thread] = {}
+_lock = threading.Lock()
+
+def warm_model(model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read a model into the page cache and pin it when configured and RAM allows.
+
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        Residency after the warm-up (see model_residency), with warmup_seconds
+    """
+    model_path = get_model_path(model)
+    chunk_bytes = RESIDENCY_CONFIG["chunk_bytes"]
+    if _libc is None:
+        seconds = _read_file(model_path, chunk_bytes)
+        logger.info(f"Read {model_path.name} into the file cache in {seconds:.1f} seconds")
+        return {"warmup_seconds": seconds}
+
+    mapping = MappedModel(model_path)
+    try:
+        seconds = mapping.prewarm(chunk_bytes)
+        logger.info(f"Prewarmed {model_path.name} ({mapping.size / GIB:.1f} GB) in {seconds:.1f} seconds")
+        if RESIDENCY_CONFIG["mlock"] and model_path.name not in _locked:
+            import psutil
+            # Pinned pages stop counting as reclaimable, so leave the headroom free after pinning
+            available = psutil.virtual_memory().available
+            if mapping.size + RESIDENCY_CONFIG["ram_headroom_gb"] * GIB > available:
+                logger.warning(
+                    f"Not pinning {model_path.name}: {mapping.size / GIB:.1f} GB plus headroom exceeds "
+                    f"the {available / GIB:.1f} GB available"
+                )
+            elif mapping.lock():
+                logger.info(f"Pinned {model_path.name} in RAM with mlock")
+                with _lock:
+                    _locked[model_path.name] = mapping
+        return dict(model_residency(model) or {}, warmup_seconds=seconds)
+    finally:
+        if not mapping.locked:
+            mapping.close()
+
+def _warm_in_background(model: str) -> None:
+    try:
+        warm_model(model)
+    except Exception as e:
+        logger.warning(f"Model warm-up failed for {model}: {e}")
+
+def start_model_warmup(model: Optional[str] = None) -> bool:
+    """
+    Warm a model in a background thread, once per process and model.
+
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        True while the warm-up is still running
+    """
+    if not RESIDENCY_CONFIG["prewarm"]:
+        return False
+    key = model or ""
+    with _lock:
+        thread = _warmups.get(key)
+        if thread is None:
+            thread = threading.Thread(target=_warm_in_background, args=(model,), daemon=True,
+                                      name=f"warmup-{model or 'default'}")
+            _warmups[key] = thread
+            thread.start()
+    return thread.is_alive()
+
+def model_residency(model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Report how much of a model is in the page cache.
+
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        Dictionary with size_bytes, resident_bytes, resident_fraction and
+        locked, or None when the file is missing or mincore is unavailable
+    """
+    model_path = get_model_path(model)
+    if _libc is None or not model_path.exists():
+        return None
+    try:
+        mapping = _locked.get(model_path.name)
+        if mapping is not None:
+            resident = mapping.resident_bytes()
+            size = mapping.size
+        else:
+            mapping = MappedModel(model_path)
+            try:
+                resident, size = mapping.resident_bytes(), mapping.size
+            finally:
+                mapping.close()
+    except OSError as e:
+        logger.debug(f"Residency of {model_path.name} unknown: {e}")
+        return None
+    return {
+        "size_bytes": size,
+        "resident_bytes": resident,
+        "resident_fraction": resident / size if size else 0.0,
+        "locked": model_path.name in _locked
+    }
@@ -0,0 +1,217 @@
+"""
+Deterministic response cache for the Llama 4 Chat Interface
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from config import RESPONSE_CACHE_CONFIG, get_model_path, get_draft_model_config
+
+logger = logging.getLogger(__name__)
+
+# Parameters that change the generated text for a fixed prompt and model
+CACHE_KEY_PARAMS = (
+    "seed", "temperature", "top_p", "min_p", "repeat_penalty", "max_tokens", "stop",
+    "speculative", "draft_max", "draft_min", "draft_p_min", "draft_gpu_layers"
+)
+
+def model_identity(model_path: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Identify the model file cheaply by name, size and modification time.
+
+    Args:
+        model_path: Model file, defaults to the configured model
+
+    Returns:
+        Dictionary identifying the model file
+    """
+    model_path = Path(model_path) if model_path else get_model_path()
+    try:
+        stat = model_path.stat()
+        return {"name": model_path.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    except OSError:
+        return {"name": model_path.name, "size": None, "mtime_ns": None}
+
+def generation_identity(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Identify everything besides the prompt that shapes a generation: the
+    backend, the model and draft files, and the CACHE_KEY_PARAMS.
+
+    Args:
+        config: Resolved inference configuration
+
+    Returns:
+        JSON-serializable dictionary for hashing into cache keys
+    """
+    from backends import get_backend
+    draft_config = get_draft_model_config(config.get("model")) if config.get("speculative") else None
+    return {
+        "backend": get_backend().name,
+        "model": model_identity(get_model_path(config.get("model"))),
+        "draft": model_identity(draft_config["path"]) if draft_config else None,
+        "config": {name: config.get(name) for name in CACHE_KEY_PARAMS}
+    }
+
+class ResponseCache:
+    """
+    Two-tier cache of completed responses: an in-memory LRU in front of an
+    on-disk SQLite store.
+
+    Only deterministic generations are cached, i.e. those with a fixed seed.
+    """
+
+    def __init__(self, db_path: Path, memory_entries: int, disk_entries: int, ttl_seconds: float):
+        self.db_path = Path(db_path)
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._db.commit()
+
+    def make_key(self, prompt: str, config: Dict[str, Any]) -> Optional[str]:
+        """
+        Hash the prompt and the generation identity into a cache key.
+
+        Args:
+            prompt: The formatted prompt
+            config: Resolved inference configuration
+
+        Returns:
+            Hex digest, or None when the generation is not deterministic
+        """
+        seed = config.get("seed")
+        if seed is None or seed < 0:
+            return None
+        key_data = dict(generation_identity(config), prompt=prompt)
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response, promoting disk hits into memory.
+
+        Args:
+            key: Cache key from make_key
+
+        Returns:
+            Cached response, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = self._db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, response, created_at)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Store a response in both tiers, evicting the least recently used entries.
+
+        Args:
+            key: Cache key from make_key
+            response: Completed model response
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)",
+                (self.disk_entries,)
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached response and reset the counters"""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            disk_size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_size
+            }
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Get the process-wide response cache.
+
+    Returns:
+        The shared cache, or None if caching is disabled
+    """
+    global _cache
+    if not RESPONSE_CACHE_CONFIG["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                RESPONSE_CACHE_CONFIG["db_path"],
+                RESPONSE_CACHE_CONFIG["memory_entries"],
+                RESPONSE_CACHE_CONFIG["disk_entries"],
+                RESPONSE_CACHE_CONFIG["ttl_seconds"]
+            )
+        return _cache
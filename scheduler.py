@@ -0,0 +1,296 @@
+"""
+Process-wide inference scheduler for the Llama 4 Chat Interface
+
+Limits how many inference requests run at once, queues the rest with
+round-robin fairness between chat sessions and rejects new work quickly
+when the queue is full or the expected wait is too long.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Iterator, List
+
+from config import SCHEDULER_CONFIG
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS_SESSION = ""
+
+class QueueFullError(RuntimeError):
+    """Raised when a request is rejected because the scheduler is overloaded"""
+
+class RequestCancelledError(RuntimeError):
+    """Raised when a request is cancelled while it waits in the queue"""
+
+class Ticket:
+    """A request's place in the scheduler"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.enqueued_at = time.time()
+        self.admitted_at: Optional[float] = None
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+def default_concurrency() -> int:
+    """
+    Work out how many requests can run at once on this machine.
+
+    Backends that bound it themselves win: llama-server runs one request
+    per slot, the in-process model one at a time. Every llama-cli process needs
+    its own threads and KV cache (the weights are shared through mmap), so
+    the limit is whichever of cores or RAM runs out first.
+
+    Returns:
+        Maximum number of concurrent inference requests
+    """
+    from backends import get_backend
+    from utils import get_system_info, resolve_inference_config
+    from gguf import get_model_info
+    from config import get_model_path
+
+    backend_limit = get_backend().max_concurrency()
+    if backend_limit is not None:
+        return backend_limit
+
+    config = resolve_inference_config()
+    system_info = get_system_info()
+    by_cores = max(1, system_info["physical_cores"] // max(1, config["threads"]))
+
+    kv_bytes_per_token = get_model_info(get_model_path()).get("kv_bytes_per_token")
+    if not kv_bytes_per_token:
+        return by_cores
+    free_bytes = (system_info["memory_available_gb"] - SCHEDULER_CONFIG["ram_headroom_gb"]) * 1024**3
+    by_memory = max(1, int(free_bytes // (kv_bytes_per_token * config["ctx_size"])))
+    return min(by_cores, by_memory)
+
+class InferenceScheduler:
+    """
+    Bounded admission queue with per-session fairness.
+
+    Waiting requests are grouped by session and admitted round-robin, so a
+    session that queues several requests cannot starve the others.
+
+    Usage:
+        with scheduler.slot(session_id, on_wait=show_position):
+            ... run inference ...
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_queued_per_session: int,
+                 max_wait_seconds: float, default_service_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queued_per_session = max_queued_per_session
+        self.max_wait_seconds = max_wait_seconds
+        self.service_seconds = default_service_seconds
+        self.running = 0
+        self.rejected = 0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._condition = threading.Condition()
+
+    def _waiting_order(self) -> List[Ticket]:
+        """Waiting tickets in the order they will be admitted"""
+        queues = [list(q) for q in self._queues.values()]
+        order = []
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            order.extend(q[depth] for q in queues if depth < len(q))
+            depth += 1
+        return order
+
+    def queued(self) -> int:
+        """Number of waiting requests"""
+        return sum(len(q) for q in self._queues.values())
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        1-based queue position of a waiting ticket, 0 once admitted.
+
+        Args:
+            ticket: Ticket from submit
+
+        Returns:
+            Queue position
+        """
+        with self._condition:
+            if ticket.admitted:
+                return 0
+            return self._waiting_order().index(ticket) + 1
+
+    def estimated_wait(self, position: int) -> float:
+        """
+        Expected seconds until a request at this position starts.
+
+        Args:
+            position: Queue position
+
+        Returns:
+            Estimated wait in seconds
+        """
+        if position <= 0:
+            return 0.0
+        rounds = (position + self.max_concurrent - 1) // self.max_concurrent
+        return rounds * self.service_seconds
+
+    def submit(self, session_id: Optional[str] = None) -> Ticket:
+        """
+        Queue a request, or reject it straight away when overloaded.
+
+        Args:
+            session_id: Chat session the request belongs to
+
+        Returns:
+            Ticket to wait on
+
+        Raises:
+            QueueFullError: If the queue, the session's share of it or the
+                expected wait is over its limit
+        """
+        session_key = session_id or ANONYMOUS_SESSION
+        ticket = Ticket(session_key)
+        with self._condition:
+            queued = self.queued()
+            if self.running >= self.max_concurrent:
+                if queued >= self.max_queue:
+                    self.rejected += 1
+                    raise QueueFullError(f"Server is busy: {queued} requests already waiting")
+                session_queue = self._queues.get(session_key, ())
+                if session_id and len(session_queue) >= self.max_queued_per_session:
+                    self.rejected += 1
+                    raise QueueFullError("You already have a request waiting")
+                expected = self.estimated_wait(queued + 1)
+                if expected > self.max_wait_seconds:
+                    self.rejected += 1
+                    raise QueueFullError(f"Server is busy: expected wait is {expected:.0f} seconds")
+            self._queues.setdefault(session_key, deque()).append(ticket)
+            self._admit()
+        return ticket
+
+    def _admit(self) -> None:
+        """Move waiting tickets into running slots, one session at a time"""
+        while self.running < self.max_concurrent and self._queues:
+            session_key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            # Rotate the session to the back so other sessions go next
+            del self._queues[session_key]
+            if queue:
+                self._queues[session_key] = queue
+            ticket.admitted_at = time.time()
+            self.running += 1
+            self._condition.notify_all()
+
+    def wait(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the ticket is admitted.
+
+        Args:
+            ticket: Ticket from submit
+            timeout: Seconds to wait, forever when None
+
+        Returns:
+            True if admitted, False on timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: ticket.admitted, timeout)
+
+    def cancel(self, ticket: Ticket) -> None:
+        """Withdraw a ticket that has not been admitted"""
+        with self._condition:
+            queue = self._queues.get(ticket.session_id)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.session_id]
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Free a running ticket's slot and admit the next request.
+
+        Args:
+            ticket: Admitted ticket
+        """
+        with self._condition:
+            self.running -= 1
+            # Smooth the service time used for wait estimates
+            elapsed = time.time() - ticket.admitted_at
+            self.service_seconds = 0.8 * self.service_seconds + 0.2 * elapsed
+            self._admit()
+
+    @contextmanager
+    def slot(self, session_id: Optional[str] = None,
+             on_wait: Optional[Callable[[int, float], None]] = None,
+             cancel_event: Optional[threading.Event] = None) -> Iterator[Ticket]:
+        """
+        Hold a running slot for the duration of the block.
+
+        Args:
+            session_id: Chat session the request belongs to
+            on_wait: Called with (queue position, estimated wait) while queued
+            cancel_event: Withdraws the request from the queue when set
+
+        Yields:
+            The admitted ticket
+
+        Raises:
+            RequestCancelledError: If cancel_event is set before admission
+        """
+        ticket = self.submit(session_id)
+        try:
+            while not self.wait(ticket, timeout=SCHEDULER_CONFIG["progress_interval"]):
+                if cancel_event is not None and cancel_event.is_set():
+                    # A client that gave up must not keep its place or its thread
+                    raise RequestCancelledError("Request was cancelled while queued")
+                if on_wait:
+                    position = self.position(ticket)
+                    on_wait(position, self.estimated_wait(position))
+        except BaseException:
+            self.cancel(ticket)
+            if ticket.admitted:
+                self.release(ticket)
+            raise
+        if ticket.enqueued_at < ticket.admitted_at - 0.01:
+            logger.info(f"Request waited {ticket.admitted_at - ticket.enqueued_at:.2f} seconds in queue")
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def status(self) -> Dict[str, Any]:
+        """Queue summary for the sidebar"""
+        with self._condition:
+            return {
+                "running": self.running,
+                "queued": self.queued(),
+                "max_concurrent": self.max_concurrent,
+                "rejected": self.rejected,
+                "service_seconds": round(self.service_seconds, 1)
+            }
+
+_scheduler: Optional[InferenceScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> InferenceScheduler:
+    """
+    Get the process-wide scheduler, sizing it on first use.
+
+    Returns:
+        The shared scheduler
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            max_concurrent = SCHEDULER_CONFIG["max_concurrent"] or default_concurrency()
+            logger.info(f"Inference scheduler allows {max_concurrent} concurrent requests")
+            _scheduler = InferenceScheduler(
+                max_concurrent,
+                SCHEDULER_CONFIG["max_queue"],
+                SCHEDULER_CONFIG["max_queued_per_session"],
+                SCHEDULER_CONFIG["max_wait_seconds"],
+                SCHEDULER_CONFIG["default_service_seconds"]
+            )
+        return _scheduler
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Hugging Face file CDN used to exercise download.py offline.
+
+Serves the files of a directory with HTTP range support. --drop-after
+cuts every response short after that many bytes, simulating flaky
+connections so retries and resume can be checked.
+
+    python scripts/fake_file_server.py llama_models --port 8000
+    python download.py --url http://127.0.0.1:8000/model.gguf --sha256 <hex>
+"""
+
+import argparse
+import re
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake range-capable file server")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-ranges", action="store_true", help="Ignore Range headers")
+    parser.add_argument("--drop-after", type=int, default=0,
+                        help="Close every response after this many bytes (0 = never)")
+    return parser.parse_args()
+
+class Handler(BaseHTTPRequestHandler):
+    directory = Path(".")
+    ranges = True
+    drop_after = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _resolve(self):
+        path = (self.directory / self.path.lstrip("/")).resolve()
+        if self.directory.resolve() not in path.parents or not path.is_file():
+            self.send_error(404)
+            return None
+        return path
+
+    def _send_headers(self, path):
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        if self.ranges and match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        return start, end
+
+    def do_HEAD(self):
+        path = self._resolve()
+        if path:
+            self._send_headers(path)
+
+    def do_GET(self):
+        path = self._resolve()
+        if not path:
+            return
+        start, end = self._send_headers(path)
+        remaining = end - start + 1
+        if self.drop_after:
+            remaining = min(remaining, self.drop_after)
+        with open(path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                block = f.read(min(65536, remaining))
+                if not block:
+                    break
+                try:
+                    self.wfile.write(block)
+                except ConnectionError:
+                    break
+                remaining -= len(block)
+        self.close_connection = True
+
+def main():
+    args = parse_args()
+    Handler.directory = args.directory
+    Handler.ranges = not args.no_ranges
+    Handler.drop_after = args.drop_after
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for llama-cli used to exercise the inference path without a model.
+
+Reads the prompt from --file, streams an echo of the last user message to
+stdout and prints llama.cpp-style timing lines to stderr. --prompt-cache
+files hold the prompt text; a prompt that extends a cached one only
+"evaluates" the new suffix.
+
+    LLAMA_CLI_PATH=scripts/fake_llama_cli.py python batch.py prompts.jsonl
+
+Environment:
+    FAKE_LLAMA_LOAD_DELAY   seconds spent "loading the model" (default 0)
+    FAKE_LLAMA_TOKEN_DELAY  seconds per generated token (default 0.005)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from fake_llama_server import fake_reply
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake llama-cli")
+    parser.add_argument("--file", required=True)
+    parser.add_argument("-n", "--n-predict", type=int, default=-1)
+    parser.add_argument("--prompt-cache", default=None)
+    parser.add_argument("--prompt-cache-ro", action="store_true")
+    args, _ = parser.parse_known_args()
+    return args
+
+def main():
+    args = parse_args()
+    load_delay = float(os.environ.get("FAKE_LLAMA_LOAD_DELAY", "0"))
+    token_delay = float(os.environ.get("FAKE_LLAMA_TOKEN_DELAY", "0.005"))
+
+    start = time.time()
+    time.sleep(load_delay)
+    load_ms = (time.time() - start) * 1000
+
+    with open(args.file, encoding="utf-8") as f:
+        prompt = f.read()
+    cached = ""
+    if args.prompt_cache and os.path.exists(args.prompt_cache):
+        with open(args.prompt_cache, encoding="utf-8") as f:
+            cached = f.read()
+        if not prompt.startswith(cached):
+            cached = ""
+    if args.prompt_cache and not args.prompt_cache_ro:
+        with open(args.prompt_cache, "w", encoding="utf-8") as f:
+            f.write(prompt)
+    prompt_tokens = max(1, (len(prompt) - len(cached)) // 4)
+    prompt_start = time.time()
+    time.sleep(prompt_tokens * token_delay / 10)
+    prompt_ms = (time.time() - prompt_start) * 1000
+
+    words = fake_reply(prompt, args.n_predict if args.n_predict > 0 else 1 << 30).split(" ")
+    eval_start = time.time()
+    for i, word in enumerate(words):
+        sys.stdout.write(word if i == 0 else " " + word)
+        sys.stdout.flush()
+        time.sleep(token_delay)
+    eval_ms = (time.time() - eval_start) * 1000
+    total_ms = (time.time() - start) * 1000
+
+    runs = len(words)
+    sys.stderr.write(f"llama_perf_sampler_print:    sampling time = {runs * 0.05:10.2f} ms / {runs:5d} runs\n")
+    sys.stderr.write(f"llama_perf_context_print:        load time = {load_ms:10.2f} ms\n")
+    sys.stderr.write(
+        f"llama_perf_context_print: prompt eval time = {prompt_ms:10.2f} ms / {prompt_tokens:5d} tokens "
+        f"({prompt_ms / prompt_tokens:8.2f} ms per token, {prompt_tokens * 1000 / max(prompt_ms, 1e-6):8.2f} tokens per second)\n"
+    )
+    sys.stderr.write(
+        f"llama_perf_context_print:        eval time = {eval_ms:10.2f} ms / {runs:5d} runs   "
+        f"({eval_ms / runs:8.2f} ms per token, {runs * 1000 / max(eval_ms, 1e-6):8.2f} tokens per second)\n"
+    )
+    sys.stderr.write(f"llama_perf_context_print:       total time = {total_ms:10.2f} ms / {prompt_tokens + runs:5d} tokens\n")
+
+if __name__ == "__main__":
+    main()
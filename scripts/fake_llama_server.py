@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Stand-in for llama-server used to exercise the worker lifecycle without a model.
+
+Accepts the same flags the worker passes, answers /health (503 while
+"loading") and /completion with a deterministic echo of the prompt.
+
+    LLAMA_SERVER_PATH=scripts/fake_llama_server.py streamlit run app.py
+"""
+
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake llama-server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--slot-save-path", default=None)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--model-draft", default=None)
+    parser.add_argument("--load-delay", type=float, default=0.5,
+                        help="Seconds to report 503 on /health, simulating model load")
+    args, _ = parser.parse_known_args()
+    return args
+
+def fake_reply(prompt, n_predict):
+    """Deterministic reply derived from the last user message"""
+    # Llama 3 prompts use different header tokens
+    prompt = prompt.replace("<|start_header_id|>", "<|header_start|>").replace("<|end_header_id|>", "<|header_end|>")
+    prompt = prompt.replace("<|eot_id|>", "<|eot|>")
+    text = prompt.rsplit("<|header_end|>", 2)[-2] if "<|header_end|>" in prompt else prompt
+    text = text.replace("<|eot|>", "").replace("<|header_start|>assistant", "").strip()
+    words = f"Echo: {text}".split()
+    return " ".join(words[:max(1, n_predict)])
+
+class Handler(BaseHTTPRequestHandler):
+    ready_at = 0.0
+    slot_save_path = None
+    model_draft = None
+    slot_prompt = ""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, content, speculative=False):
+        """Send the reply word by word as server-sent events; drafting makes it twice as fast"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = content.split(" ")
+        start = time.time()
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            self.wfile.write(f"data: {json.dumps({'content': piece, 'stop': False})}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(0.005 if speculative else 0.01)
+        predicted_ms = (time.time() - start) * 1000
+        timings = {
+            "prompt_n": 1, "prompt_ms": 0.1, "prompt_per_second": 10000.0,
+            "predicted_n": len(words), "predicted_ms": predicted_ms,
+            "predicted_per_second": len(words) * 1000 / predicted_ms
+        }
+        if speculative:
+            timings["draft_n"] = len(words) + len(words) // 2
+            timings["draft_n_accepted"] = len(words) - len(words) // 5
+        self.wfile.write(f"data: {json.dumps({'content': '', 'stop': True, 'timings': timings})}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def handle_slot_action(self, payload):
+        """Save or restore the single slot's prompt to a file, like llama-server's KV snapshots"""
+        if not self.slot_save_path:
+            self.send_json(501, {"error": {"message": "slot save path not set"}})
+            return
+        path = os.path.join(self.slot_save_path, os.path.basename(payload.get("filename", "")))
+        if self.path.endswith("action=save"):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(Handler.slot_prompt)
+            self.send_json(200, {"filename": payload.get("filename")})
+        elif self.path.endswith("action=restore") and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                Handler.slot_prompt = f.read()
+            self.send_json(200, {"filename": payload.get("filename")})
+        else:
+            self.send_json(400, {"error": {"message": "bad slot action"}})
+
+    def do_GET(self):
+        if self.path == "/health":
+            if time.time() < self.ready_at:
+                self.send_json(503, {"error": {"message": "Loading model"}})
+            else:
+                self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.startswith("/slots/"):
+            self.handle_slot_action(payload)
+        elif self.path == "/completion":
+            Handler.slot_prompt = payload.get("prompt", "")
+            content = fake_reply(payload.get("prompt", ""), payload.get("n_predict", 64))
+            if payload.get("stream"):
+                self.send_stream(content, bool(self.model_draft and payload.get("speculative.n_max", 16)))
+            else:
+                self.send_json(200, {"content": content, "stop": True})
+        else:
+            self.send_json(404, {"error": {"message": "Not found"}})
+
+def main():
+    args = parse_args()
+    Handler.ready_at = time.time() + args.load_delay
+    Handler.slot_save_path = args.slot_save_path
+    Handler.model_draft = args.model_draft
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Semantic response cache for the Llama 4 Chat Interface
+
+Answers paraphrases of questions that were already answered in the same
+context ("What's the capital of France?" after "what is France's
+capital"). Questions are embedded on the CPU as hashed word and character
+n-gram vectors, so no embedding model is needed. The vectors live in a
+memory-mapped NumPy matrix next to a SQLite table of the responses, and a
+lookup is one matrix product against every live entry of the context.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from config import SEMANTIC_CACHE_CONFIG
+from response_cache import generation_identity
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+# Function words carry little of a question's meaning; without them "what is
+# the capital of France" and "capital of Germany" share only "capital"
+STOP_WORDS = frozenset(
+    "a an the is are was were be been am do does did i me my you your it its this that these those "
+    "of to in on for with at by from about as and or but if so can could would should will please "
+    "what whats what's how which who tell give show explain s".split()
+)
+
+_ANCHOR_TOKEN_RE = re.compile(r"\w+(?:[.,]\d+)*|[.?!:]")
+
+def anchors(text: str) -> str:
+    """
+    The numbers and named entities of a question, in order.
+
+    The embedding is a bag of n-grams, so "convert 100 USD to EUR" and
+    "convert 100 EUR to USD" embed almost alike. An entry is only served
+    to a question with the same anchors. Named entities are capitalised
+    words that do not start a sentence, and words with inner capitals
+    (USD, iPhone).
+
+    Args:
+        text: The user's message
+
+    Returns:
+        Lowercased anchors joined by spaces, empty when there are none
+    """
+    found = []
+    sentence_start = True
+    for token in _ANCHOR_TOKEN_RE.findall(text):
+        if token in ".?!:":
+            sentence_start = True
+            continue
+        if any(char.isdigit() for char in token):
+            found.append(token.replace(",", ""))
+        elif any(char.isupper() for char in token[1:]) or \
+                (token[0].isupper() and not sentence_start and token.lower() not in STOP_WORDS):
+            found.append(token)
+        sentence_start = False
+    return " ".join(found).lower()
+
+def _features(text: str, ngram: int) -> List[str]:
+    """Content words, word pairs and character n-grams of the lowercased text"""
+    words = [word for word in _WORD_RE.findall(text.lower()) if word not in STOP_WORDS]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features.extend(padded[i:i + ngram] for i in range(max(1, len(padded) - ngram + 1)))
+    return features
+
+def embed(texts: Sequence[str], dim: int, ngram: int = 3) -> np.ndarray:
+    """
+    Embed texts as L2-normalised hashed n-gram vectors.
+
+    Each feature is hashed with a stable hash into one of dim buckets with a
+    random sign, so the vectors stay comparable across restarts.
+
+    Args:
+        texts: Texts to embed
+        dim: Vector dimension
+        ngram: Character n-gram length
+
+    Returns:
+        float32 matrix with one unit-length row per text
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+             for feature in _features(text, ngram)],
+            dtype=np.uint64
+        )
+        if not len(hashes):
+            continue
+        signs = np.where(hashes >> np.uint64(63), 1.0, -1.0).astype(np.float32)
+        np.add.at(vectors[row], (hashes % np.uint64(dim)).astype(np.intp), signs)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class SemanticCache:
+    """
+    Fixed-capacity cache of responses keyed by question embedding.
+
+    Entries only match questions asked in the same context: the same model
+    and the same prompt apart from the question itself. When the cache is
+    full the least recently used entry is replaced.
+
+    Several processes (the app and the API) may share the directory. The
+    SQLite table is the only record of which rows are in use, and every
+    lookup and insert holds SQLite's exclusive lock while it reads or
+    writes the vectors, so no process sees a row half replaced.
+    """
+
+    def __init__(self, directory: Path, capacity: int, dim: int, threshold: float,
+                 ttl_seconds: float, ngram: int = 3):
+        self.directory = Path(directory)
+        self.capacity = capacity
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.ngram = ngram
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.directory / "entries.sqlite3"), timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        with self._transaction():
+            columns = {column[1] for column in self._db.execute("PRAGMA table_info(entries)")}
+            if columns and "anchors" not in columns:
+                # Entries stored without anchors cannot be checked against a question
+                self._db.execute("DROP TABLE entries")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "row INTEGER PRIMARY KEY, scope INTEGER NOT NULL, anchors TEXT NOT NULL, question TEXT NOT NULL, "
+                "response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            # The matrix is rebuilt empty when its shape no longer matches the config
+            vectors_path = self.directory / "vectors.f32"
+            fresh = not vectors_path.exists() or vectors_path.stat().st_size != capacity * dim * 4
+            if fresh:
+                self._db.execute("DELETE FROM entries")
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="w+" if fresh else "r+",
+                                      shape=(capacity, dim))
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Hold SQLite's exclusive lock, shared with the other processes using the directory"""
+        self._db.execute("BEGIN EXCLUSIVE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def make_scope(self, prompt: str, question: str, config: Dict[str, Any]) -> Optional[int]:
+        """
+        Hash everything but the question, with the generation identity, into the context an entry belongs to.
+
+        Args:
+            prompt: The formatted prompt
+            question: The user's message, as it appears in the prompt
+            config: Resolved inference configuration
+
+        Returns:
+            Scope identifier, or None when the generation is not deterministic
+            or the question is not part of the prompt
+        """
+        seed = config.get("seed")
+        question = question.strip()
+        if seed is None or seed < 0 or not question:
+            return None
+        before, found, after = prompt.rpartition(question)
+        if not found:
+            return None
+        key_data = dict(generation_identity(config), context=[before, after])
+        digest = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "little", signed=True)
+
+    def get_many(self, questions: Sequence[str], scope: int) -> List[Optional[Tuple[str, float]]]:
+        """
+        Look up several questions with one similarity product.
+
+        Args:
+            questions: Questions to look up
+            scope: Scope from make_scope
+
+        Returns:
+            (response, cosine similarity) of the closest entry with the same
+            anchors for each question, or None where nothing reaches the threshold
+        """
+        queries = embed(questions, self.dim, self.ngram)
+        keys = [anchors(question) for question in questions]
+        now = time.time()
+        results: List[Optional[Tuple[str, float]]] = [None] * len(questions)
+        with self._lock, self._transaction():
+            for key in set(keys):
+                indices = [index for index, question_key in enumerate(keys) if question_key == key]
+                rows = [row for (row,) in self._db.execute(
+                    "SELECT row FROM entries WHERE scope = ? AND anchors = ? AND created_at >= ? ORDER BY row",
+                    (scope, key, now - self.ttl_seconds)
+                )]
+                if not rows:
+                    continue
+                similarities = self._vectors[rows] @ queries[indices].T
+                for column, best in enumerate(similarities.argmax(axis=0)):
+                    similarity = float(similarities[best, column])
+                    if similarity < self.threshold:
+                        continue
+                    row = rows[best]
+                    response = self._db.execute("SELECT response FROM entries WHERE row = ?", (row,)).fetchone()[0]
+                    self._db.execute("UPDATE entries SET accessed_at = ? WHERE row = ?", (now, row))
+                    results[indices[column]] = (response, similarity)
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(questions) - found
+        return results
+
+    def get(self, question: str, scope: int) -> Optional[Tuple[str, float]]:
+        """
+        Look up the closest answered paraphrase of a question.
+
+        Args:
+            question: The user's message
+            scope: Scope from make_scope
+
+        Returns:
+            (response, cosine similarity), or None on a miss
+        """
+        return self.get_many([question], scope)[0]
+
+    def put(self, question: str, scope: int, response: str) -> None:
+        """
+        Store a response, replacing an expired or the least recently used entry when full.
+
+        Args:
+            question: The user's message
+            scope: Scope from make_scope
+            response: Completed model response
+        """
+        vector = embed([question], self.dim, self.ngram)[0]
+        now = time.time()
+        with self._lock, self._transaction():
+            # Re-read the occupied rows: another process may have filled some since the last call
+            used = np.zeros(self.capacity, dtype=bool)
+            used[[row for (row,) in self._db.execute("SELECT row FROM entries WHERE row < ?", (self.capacity,))]] = True
+            free = np.flatnonzero(~used)
+            if len(free):
+                row = int(free[0])
+            else:
+                row = self._db.execute(
+                    "SELECT row FROM entries ORDER BY created_at >= ?, accessed_at LIMIT 1",
+                    (now - self.ttl_seconds,)
+                ).fetchone()[0]
+            self._vectors[row] = vector
+            self._vectors.flush()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (row, scope, anchors, question, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (row, scope, anchors(question), question, response, now, now)
+            )
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters"""
+        with self._lock, self._transaction():
+            self._db.execute("DELETE FROM entries")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and the number of entries"""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries,
+                "capacity": self.capacity
+            }
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """
+    Get the process-wide semantic cache.
+
+    Returns:
+        The shared cache, or None if semantic caching is disabled
+    """
+    global _cache
+    if not SEMANTIC_CACHE_CONFIG["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache(
+                SEMANTIC_CACHE_CONFIG["dir"],
+                SEMANTIC_CACHE_CONFIG["capacity"],
+                SEMANTIC_CACHE_CONFIG["dim"],
+                SEMANTIC_CACHE_CONFIG["threshold"],
+                SEMANTIC_CACHE_CONFIG["ttl_seconds"],
+                SEMANTIC_CACHE_CONFIG["ngram"]
+            )
+        return _cache
@@ -0,0 +1,40 @@
+"""
+Shared fixtures: the fake inference backend, with caches, metrics and
+model files kept out of the working tree.
+"""
+
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import config
+import scheduler
+
+@pytest.fixture
+def fake_backend(tmp_path, monkeypatch):
+    """Route inference to the fake echo backend with a fresh scheduler"""
+    monkeypatch.setitem(config.BACKEND_CONFIG, "backend", "fake")
+    monkeypatch.setitem(config.BACKEND_CONFIG, "fake_token_delay", 0.0)
+    monkeypatch.setitem(config.RESPONSE_CACHE_CONFIG, "enabled", False)
+    monkeypatch.setitem(config.SEMANTIC_CACHE_CONFIG, "enabled", False)
+    monkeypatch.setitem(config.METRICS_CONFIG, "enabled", False)
+    monkeypatch.setitem(config.TRACING_CONFIG, "sample_rate", 0.0)
+    monkeypatch.setitem(config.RESIDENCY_CONFIG, "prewarm", False)
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "max_concurrent", 2)
+    monkeypatch.setattr(config, "PROFILES_DIR", tmp_path / "profiles")
+    for key, entry in config.MODEL_REGISTRY.items():
+        monkeypatch.setitem(entry, "path", tmp_path / "models" / key / entry["path"].name)
+    monkeypatch.setattr(scheduler, "_scheduler", None)
+    return tmp_path
+
+@pytest.fixture
+def free_port():
+    """A TCP port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
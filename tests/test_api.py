@@ -0,0 +1,192 @@
+"""OpenAI-compatible API over the fake backend: framing, errors and admission"""
+
+import asyncio
+import json
+
+import pytest
+
+import api
+import config
+import scheduler
+
+@pytest.fixture
+def api_backend(fake_backend, monkeypatch):
+    monkeypatch.setattr(api, "_executor", None)
+    return fake_backend
+
+async def open_server():
+    server = await asyncio.start_server(api.handle_connection, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+async def send_request(port, method, path, payload=None):
+    """Send one request and open the response; returns (status, headers, reader, writer)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, reader, writer
+
+async def request(port, method, path, payload=None):
+    """One complete request; returns (status, headers, body bytes)"""
+    status, headers, reader, writer = await send_request(port, method, path, payload)
+    body = await reader.read()
+    writer.close()
+    return status, headers, body
+
+def events(body):
+    """Split a server-sent event body into its data payloads"""
+    assert body.endswith(b"\n\n")
+    payloads = []
+    for event in body.decode("utf-8").split("\n\n")[:-1]:
+        assert event.startswith("data: ")
+        data = event[len("data: "):]
+        payloads.append(data if data == "[DONE]" else json.loads(data))
+    return payloads
+
+def run(coroutine_function):
+    async def main():
+        server, port = await open_server()
+        async with server:
+            return await coroutine_function(port)
+    return asyncio.run(main())
+
+CHAT = {"messages": [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hello there"}]}
+
+def test_chat_completion_json(api_backend):
+    status, headers, body = run(lambda port: request(port, "POST", "/v1/chat/completions", CHAT))
+
+    result = json.loads(body)
+    assert status == 200 and headers["content-type"] == "application/json"
+    assert result["object"] == "chat.completion"
+    assert result["model"] == config.DEFAULT_MODEL
+    assert result["choices"][0]["message"] == {"role": "assistant", "content": "Echo: hello there"}
+    assert result["choices"][0]["finish_reason"] == "stop"
+    assert result["usage"]["completion_tokens"] == 3
+    assert result["usage"]["total_tokens"] == result["usage"]["prompt_tokens"] + 3
+
+def test_chat_completion_stream_framing(api_backend):
+    status, headers, body = run(
+        lambda port: request(port, "POST", "/v1/chat/completions", dict(CHAT, stream=True))
+    )
+
+    payloads = events(body)
+    assert status == 200 and headers["content-type"] == "text/event-stream"
+    assert payloads[-1] == "[DONE]"
+    chunks = payloads[:-1]
+    assert all(chunk["object"] == "chat.completion.chunk" for chunk in chunks)
+    assert len({chunk["id"] for chunk in chunks}) == 1
+    assert chunks[0]["choices"][0]["delta"]["role"] == "assistant"
+    assert all("role" not in chunk["choices"][0]["delta"] for chunk in chunks[1:])
+    assert "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks) == "Echo: hello there"
+    assert all(chunk["choices"][0]["finish_reason"] is None for chunk in chunks[:-1])
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[-1]["usage"]["completion_tokens"] == 3
+    assert all("usage" not in chunk for chunk in chunks[:-1])
+
+def test_completion_stream_framing(api_backend):
+    status, _, body = run(
+        lambda port: request(port, "POST", "/v1/completions", {"prompt": "one two", "stream": True})
+    )
+
+    payloads = events(body)
+    assert status == 200 and payloads[-1] == "[DONE]"
+    assert "".join(chunk["choices"][0]["text"] for chunk in payloads[:-1]) == "Echo: one two"
+    assert payloads[-2]["choices"][0]["finish_reason"] == "stop"
+
+def test_unknown_model_is_404(api_backend):
+    status, _, body = run(
+        lambda port: request(port, "POST", "/v1/chat/completions", dict(CHAT, model="no-such-model"))
+    )
+
+    assert status == 404
+    assert json.loads(body)["error"]["type"] == "model_not_found"
+
+@pytest.mark.parametrize("messages", [
+    [],
+    [{"role": "assistant", "content": "hi"}],
+    [{"role": "user", "content": "a"}, {"role": "user", "content": "b"}],
+    [{"role": "user", "content": 3}],
+    [{"role": "tool", "content": "x"}]
+])
+def test_bad_messages_are_400(api_backend, messages):
+    status, _, body = run(lambda port: request(port, "POST", "/v1/chat/completions", {"messages": messages}))
+
+    assert status == 400
+    assert json.loads(body)["error"]["type"] == "invalid_request_error"
+
+@pytest.mark.parametrize("field, value", [
+    ("max_tokens", "abc"),
+    ("max_tokens", 1.5),
+    ("max_tokens", -1),
+    ("max_tokens", True),
+    ("seed", "x"),
+    ("temperature", "hot"),
+    ("top_p", [0.9]),
+    ("stop", 5),
+    ("stop", ["ok", 5]),
+    ("stop", {"a": "b"})
+])
+def test_bad_sampling_fields_are_400(api_backend, field, value):
+    status, _, body = run(lambda port: request(port, "POST", "/v1/chat/completions", dict(CHAT, **{field: value})))
+
+    assert status == 400
+    assert repr(field) in json.loads(body)["error"]["message"]
+
+def test_sampling_fields_are_accepted(api_backend):
+    payload = dict(CHAT, max_tokens=0, seed=7, temperature=0, top_p=0.5, stop=["\n\n"])
+    status, _, body = run(lambda port: request(port, "POST", "/v1/chat/completions", payload))
+
+    assert status == 200
+    assert json.loads(body)["object"] == "chat.completion"
+
+def test_unknown_endpoint_and_method(api_backend):
+    assert run(lambda port: request(port, "GET", "/v1/nothing"))[0] == 404
+    assert run(lambda port: request(port, "GET", "/v1/chat/completions"))[0] == 405
+
+def test_stream_rejected_by_scheduler_is_429(api_backend, monkeypatch):
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "max_concurrent", 1)
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "max_queue", 0)
+    monkeypatch.setitem(config.BACKEND_CONFIG, "fake_token_delay", 0.05)
+    busy = {"messages": [{"role": "user", "content": " ".join(["word"] * 40)}], "stream": True}
+
+    async def overload(port):
+        status, _, reader, writer = await send_request(port, "POST", "/v1/chat/completions", busy)
+        assert status == 200
+        await reader.readuntil(b"\n\n")
+        rejected = await request(port, "POST", "/v1/chat/completions", dict(CHAT, stream=True))
+        await reader.read()
+        writer.close()
+        return rejected
+
+    status, headers, body = run(overload)
+
+    assert status == 429 and headers["content-type"] == "application/json"
+    assert json.loads(body)["error"]["type"] == "server_busy"
+
+def test_timed_out_queued_request_leaves_the_queue(api_backend, monkeypatch):
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "max_concurrent", 1)
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "progress_interval", 0.05)
+    monkeypatch.setitem(config.API_CONFIG, "request_timeout", 0.3)
+
+    async def queue_behind_busy_slot(port):
+        with scheduler.get_scheduler().slot("busy"):
+            status = (await request(port, "POST", "/v1/chat/completions", CHAT))[0]
+            # The queued step notices the cancel at its next progress check
+            for _ in range(40):
+                if not scheduler.get_scheduler().queued():
+                    break
+                await asyncio.sleep(0.05)
+            return status, scheduler.get_scheduler().queued()
+
+    assert run(queue_behind_busy_slot) == (504, 0)
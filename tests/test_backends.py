@@ -0,0 +1,39 @@
+"""llama-cli backend against scripts/fake_llama_cli.py"""
+
+from pathlib import Path
+
+import pytest
+
+import utils
+from backends import CliBackend
+from config import DEFAULT_MODEL
+from utils import resolve_inference_config, format_prompt, get_session_cache_path
+
+FAKE_CLI = Path(__file__).resolve().parent.parent / "scripts" / "fake_llama_cli.py"
+
+@pytest.fixture
+def cli(fake_backend, monkeypatch):
+    monkeypatch.setenv("LLAMA_CLI_PATH", str(FAKE_CLI))
+    monkeypatch.setattr(utils, "PROMPT_CACHE_DIR", fake_backend / "prompt_cache")
+    return CliBackend()
+
+def prompt_and_config(message):
+    return format_prompt(message), resolve_inference_config({"model": DEFAULT_MODEL})
+
+def test_session_cache_kept_after_a_clean_exit(cli):
+    prompt, config = prompt_and_config("hello there")
+
+    assert "".join(cli.stream(prompt, config, session_id="s1")) == "Echo: hello there"
+    assert get_session_cache_path("s1", "cli", DEFAULT_MODEL).read_text(encoding="utf-8") == prompt
+
+def test_session_cache_dropped_when_llama_cli_is_killed(cli, monkeypatch):
+    monkeypatch.setenv("FAKE_LLAMA_TOKEN_DELAY", "0.05")
+    prompt, config = prompt_and_config(" ".join(["word"] * 40))
+
+    stream = cli.stream(prompt, config, session_id="s1")
+    next(stream)
+    assert get_session_cache_path("s1", "cli", DEFAULT_MODEL).exists()
+    # Abandoning the stream kills llama-cli, maybe in the middle of a cache write
+    stream.close()
+
+    assert not get_session_cache_path("s1", "cli", DEFAULT_MODEL).exists()
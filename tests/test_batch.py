@@ -0,0 +1,72 @@
+"""Batch inference: results, resume and error handling"""
+
+import json
+
+import pytest
+
+from batch import read_prompts, load_completed_ids, run_batch
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_read_prompts_defaults_id_to_line_number(tmp_path):
+    input_path = tmp_path / "prompts.jsonl"
+    input_path.write_text('{"prompt": "a"}\n\n{"id": "x", "prompt": "b"}\n', encoding="utf-8")
+    assert [record["id"] for record in read_prompts(input_path)] == ["1", "x"]
+
+def test_read_prompts_requires_prompt(tmp_path):
+    input_path = tmp_path / "prompts.jsonl"
+    input_path.write_text('{"id": "x"}\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="missing 'prompt'"):
+        list(read_prompts(input_path))
+
+def test_run_batch_writes_one_result_per_prompt(fake_backend):
+    input_path = fake_backend / "prompts.jsonl"
+    output_path = fake_backend / "results.jsonl"
+    write_jsonl(input_path, [{"id": f"q{i}", "prompt": f"question {i}"} for i in range(5)])
+
+    stats = run_batch(input_path, output_path, concurrency=2)
+
+    results = {result["id"]: result for result in read_jsonl(output_path)}
+    assert stats["processed"] == 5 and stats["errors"] == 0
+    assert sorted(results) == [f"q{i}" for i in range(5)]
+    assert results["q3"]["response"] == "Echo: question 3"
+    assert results["q3"]["tokens"] == 3
+
+def test_run_batch_resumes_after_interruption(fake_backend):
+    input_path = fake_backend / "prompts.jsonl"
+    output_path = fake_backend / "results.jsonl"
+    write_jsonl(input_path, [{"id": f"q{i}", "prompt": f"question {i}"} for i in range(4)])
+    # Two finished prompts, one failed and a line torn by the interruption
+    output_path.write_text(
+        '{"id": "q0", "response": "done", "tokens": 1}\n'
+        '{"id": "q1", "response": "done", "tokens": 1}\n'
+        '{"id": "q2", "error": "boom", "tokens": 0}\n'
+        '{"id": "q3", "resp',
+        encoding="utf-8"
+    )
+    assert load_completed_ids(output_path) == {"q0", "q1"}
+
+    stats = run_batch(input_path, output_path, concurrency=2)
+
+    assert stats["skipped"] == 2 and stats["processed"] == 2
+    assert load_completed_ids(output_path) == {"q0", "q1", "q2", "q3"}
+
+def test_bad_records_fail_alone(fake_backend):
+    input_path = fake_backend / "prompts.jsonl"
+    output_path = fake_backend / "results.jsonl"
+    write_jsonl(input_path, [
+        {"id": "unknown-model", "prompt": "hi", "config": {"model": "no-such-model"}},
+        {"id": "not-a-string", "prompt": ["hi"]},
+        {"id": "ok", "prompt": "hello"}
+    ])
+
+    stats = run_batch(input_path, output_path, concurrency=2)
+
+    results = {result["id"]: result for result in read_jsonl(output_path)}
+    assert stats["processed"] == 3 and stats["errors"] == 2
+    assert "error" in results["unknown-model"] and "error" in results["not-a-string"]
+    assert results["ok"]["response"] == "Echo: hello"
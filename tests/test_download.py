@@ -0,0 +1,123 @@
+"""Parallel, resumable downloads against scripts/fake_file_server.py"""
+
+import hashlib
+import json
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import download
+from download import DownloadError, RangeDownloader, download_file
+
+CHUNK_SIZE = 64 * 1024
+FILE_SIZE = 5 * CHUNK_SIZE + 1234
+FAKE_SERVER = Path(__file__).resolve().parent.parent / "scripts" / "fake_file_server.py"
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setitem(download.DOWNLOAD_CONFIG, "chunk_size", CHUNK_SIZE)
+    monkeypatch.setitem(download.DOWNLOAD_CONFIG, "connections", 4)
+    monkeypatch.setitem(download.DOWNLOAD_CONFIG, "retries", 8)
+    monkeypatch.setitem(download.DOWNLOAD_CONFIG, "timeout", 10)
+    monkeypatch.setattr(download.time, "sleep", lambda seconds: None)
+
+@pytest.fixture
+def served_file(tmp_path):
+    """A file a little over five chunks long in its own directory, and its SHA256"""
+    directory = tmp_path / "served"
+    directory.mkdir()
+    data = bytes(range(256)) * (FILE_SIZE // 256) + b"x" * (FILE_SIZE % 256)
+    (directory / "model.gguf").write_bytes(data)
+    return directory, hashlib.sha256(data).hexdigest()
+
+@pytest.fixture
+def start_server(free_port):
+    """Start the fake file server on a free port; returns the file URL"""
+    processes = []
+
+    def start(directory, *args):
+        process = subprocess.Popen(
+            [sys.executable, str(FAKE_SERVER), str(directory),
+             "--port", str(free_port), *args]
+        )
+        processes.append(process)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", free_port), timeout=0.2).close()
+                return f"http://127.0.0.1:{free_port}/model.gguf"
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("fake file server did not start")
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+def test_parallel_download_verifies_sha(tmp_path, served_file, start_server):
+    directory, sha256 = served_file
+    url = start_server(directory)
+    dest = tmp_path / "out" / "model.gguf"
+
+    stats = download_file(url, dest, sha256=sha256)
+
+    assert dest.read_bytes() == (directory / "model.gguf").read_bytes()
+    assert stats["bytes"] == FILE_SIZE
+    assert not dest.with_name("model.gguf.part").exists()
+    assert not dest.with_name("model.gguf.part.json").exists()
+    assert download_file(url, dest, sha256=sha256)["bytes"] == 0
+
+def test_sha_mismatch_discards_partial_file(tmp_path, served_file, start_server):
+    directory, _ = served_file
+    url = start_server(directory)
+    dest = tmp_path / "model.gguf"
+
+    with pytest.raises(DownloadError, match="SHA256 mismatch"):
+        download_file(url, dest, sha256="0" * 64)
+
+    assert not dest.exists()
+    assert not dest.with_name("model.gguf.part").exists()
+    assert not dest.with_name("model.gguf.part.json").exists()
+
+def test_resume_fetches_only_missing_chunks(tmp_path, served_file, start_server):
+    directory, sha256 = served_file
+    url = start_server(directory)
+    data = (directory / "model.gguf").read_bytes()
+    dest = tmp_path / "model.gguf"
+    # An earlier attempt finished chunks 0 and 2 before stopping
+    part = bytearray(FILE_SIZE)
+    for index in (0, 2):
+        part[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE] = data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+    dest.with_name("model.gguf.part").write_bytes(bytes(part))
+    dest.with_name("model.gguf.part.json").write_text(json.dumps({
+        "url": url, "size": FILE_SIZE, "sha256": sha256, "chunk_size": CHUNK_SIZE, "completed": [0, 2]
+    }), encoding="utf-8")
+
+    stats = RangeDownloader(url, dest, FILE_SIZE, sha256).run()
+
+    assert dest.read_bytes() == data
+    assert stats["bytes"] == FILE_SIZE - 2 * CHUNK_SIZE
+
+def test_dropped_connections_are_retried(tmp_path, served_file, start_server):
+    directory, sha256 = served_file
+    url = start_server(directory, "--drop-after", str(CHUNK_SIZE // 3))
+    dest = tmp_path / "model.gguf"
+
+    download_file(url, dest, sha256=sha256)
+
+    assert dest.read_bytes() == (directory / "model.gguf").read_bytes()
+
+def test_server_without_ranges_downloads_in_one_piece(tmp_path, served_file, start_server):
+    directory, sha256 = served_file
+    url = start_server(directory, "--no-ranges")
+    dest = tmp_path / "model.gguf"
+
+    stats = download_file(url, dest, sha256=sha256)
+
+    assert dest.read_bytes() == (directory / "model.gguf").read_bytes()
+    assert stats["bytes"] == FILE_SIZE
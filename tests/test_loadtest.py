@@ -0,0 +1,92 @@
+"""Load test aggregation and levels run against the fake backend"""
+
+import pytest
+
+import config
+from bench import percentile
+from loadtest import synthetic_conversations, summarize, run_level
+
+def sample(outcome, latency=1.0, ttft=0.5, tokens=10, start_delay=0.0):
+    return {
+        "outcome": outcome,
+        "latency_seconds": latency,
+        "ttft_seconds": ttft if outcome == "ok" else None,
+        "start_delay_seconds": start_delay,
+        "generated_tokens": tokens
+    }
+
+def test_percentile_interpolates():
+    assert percentile([], 50) is None
+    assert percentile([7], 95) == 7
+    assert percentile([4, 1, 3, 2], 0) == 1
+    assert percentile([4, 1, 3, 2], 100) == 4
+    assert percentile([4, 1, 3, 2], 50) == pytest.approx(2.5)
+    assert percentile(list(range(101)), 95) == pytest.approx(95)
+
+def test_summarize_counts_and_rates():
+    samples = [
+        sample("ok", latency=1.0, tokens=10),
+        sample("ok", latency=3.0, tokens=30, start_delay=2.0),
+        sample("error"),
+        sample("timeout"),
+        sample("rejected")
+    ]
+    resources = [{"cpu_percent": 50.0, "rss_bytes": 100}, {"cpu_percent": 150.0, "rss_bytes": 300}]
+
+    summary = summarize(samples, resources, duration=4.0)
+
+    assert summary["turns"] == 5
+    assert (summary["ok"], summary["error"], summary["timeout"], summary["rejected"]) == (2, 1, 1, 1)
+    assert summary["error_rate"] == summary["timeout_rate"] == summary["rejected_rate"] == pytest.approx(0.2)
+    assert summary["throughput_turns_per_second"] == pytest.approx(0.5)
+    assert summary["generated_tokens_per_second"] == pytest.approx(10.0)
+    assert summary["latency_p50"] == pytest.approx(2.0)
+    assert summary["start_delay_p95"] == pytest.approx(1.6)
+    assert summary["cpu_percent_mean"] == pytest.approx(100.0)
+    assert summary["rss_bytes_max"] == 300
+
+def test_summarize_without_samples():
+    summary = summarize([], [], duration=0.0)
+    assert summary["turns"] == 0 and summary["error_rate"] == 0.0
+    assert summary["latency_p95"] is None and summary["cpu_percent_mean"] is None
+
+def test_synthetic_conversations_are_reproducible():
+    assert synthetic_conversations(5, 3, seed=1) == synthetic_conversations(5, 3, seed=1)
+    assert all(1 <= len(c["turns"]) <= 3 for c in synthetic_conversations(20, 3, seed=2))
+
+def test_run_level_replays_every_turn(fake_backend):
+    conversations = synthetic_conversations(4, 3, seed=0)
+
+    level = run_level(conversations, concurrency=2, rate=None, config={}, think_time=0.0,
+                      timeout=30.0, seed=0, sample_interval=0.05)
+
+    summary = level["summary"]
+    assert summary["turns"] == sum(len(c["turns"]) for c in conversations)
+    assert summary["ok"] == summary["turns"]
+    assert summary["generated_tokens_per_second"] > 0
+    assert {s["conversation"] for s in level["samples"]} == {c["id"] for c in conversations}
+
+def test_run_level_counts_rejections(fake_backend, monkeypatch):
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "max_concurrent", 1)
+    monkeypatch.setitem(config.SCHEDULER_CONFIG, "max_queue", 0)
+    monkeypatch.setitem(config.BACKEND_CONFIG, "fake_token_delay", 0.02)
+    conversations = [{"id": f"c{i}", "turns": [" ".join(["word"] * 20)]} for i in range(3)]
+
+    summary = run_level(conversations, concurrency=3, rate=None, config={}, think_time=0.0,
+                        timeout=30.0, seed=0, sample_interval=0.05)["summary"]
+
+    assert summary["ok"] >= 1 and summary["rejected"] >= 1
+    assert summary["ok"] + summary["rejected"] == 3
+
+def test_run_level_rate_counts_wait_for_a_free_user(fake_backend, monkeypatch):
+    monkeypatch.setitem(config.BACKEND_CONFIG, "fake_token_delay", 0.02)
+    conversations = [{"id": f"c{i}", "turns": [" ".join(["word"] * 10)]} for i in range(4)]
+
+    samples = run_level(conversations, concurrency=1, rate=1000.0, config={}, think_time=0.0,
+                        timeout=30.0, seed=0, sample_interval=0.05)["samples"]
+
+    # One user serves arrivals that come in faster than a turn takes, so
+    # later turns wait, and the wait is part of their latency
+    last = max(samples, key=lambda s: s["start_delay_seconds"])
+    assert last["start_delay_seconds"] > 0.3
+    assert last["latency_seconds"] >= last["start_delay_seconds"]
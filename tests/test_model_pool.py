@@ -0,0 +1,48 @@
+"""RAM-budgeted model pool: eviction and concurrent loads"""
+
+import threading
+
+import pytest
+
+import model_pool
+from model_pool import ModelPool
+
+GIB = model_pool.GIB
+
+@pytest.fixture(autouse=True)
+def six_gb_models(monkeypatch):
+    monkeypatch.setattr(model_pool, "estimate_model_bytes", lambda model: 6 * GIB)
+
+def test_idle_model_is_evicted_to_make_room():
+    unloaded = []
+    pool = ModelPool("test", load=lambda model: model, unload=unloaded.append, ram_budget_bytes=12 * GIB)
+    with pool.use("a"), pool.use("b"):
+        pass
+    with pool.use("c"):
+        pass
+    assert unloaded == ["a"]
+    assert pool.loaded() == ["b", "c"]
+
+def test_concurrent_loads_share_the_budget():
+    started = threading.Barrier(2)
+    unloaded = []
+
+    def slow_load(model):
+        if model != "idle":
+            # Both loads are in flight before either finishes
+            started.wait(timeout=5)
+        return model
+
+    pool = ModelPool("test", load=slow_load, unload=unloaded.append, ram_budget_bytes=12 * GIB)
+    with pool.use("idle"):
+        pass
+
+    threads = [threading.Thread(target=pool.acquire, args=(model,)) for model in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert unloaded == ["idle"]
+    assert sorted(pool.loaded()) == ["a", "b"]
+    assert pool.status()["used_gb"] == 12
@@ -0,0 +1,31 @@
+"""Response cache keys cover everything that shapes the generated text"""
+
+import pytest
+
+import config
+from response_cache import ResponseCache
+from utils import resolve_inference_config
+
+@pytest.fixture
+def cache(fake_backend, tmp_path):
+    return ResponseCache(tmp_path / "responses.db", memory_entries=8, disk_entries=8, ttl_seconds=60)
+
+def test_key_needs_a_fixed_seed(cache):
+    assert cache.make_key("prompt", resolve_inference_config({"seed": -1})) is None
+    assert cache.make_key("prompt", resolve_inference_config({"seed": 1}))
+
+@pytest.mark.parametrize("change", [
+    {"temperature": 0.1},
+    {"speculative": False},
+    {"draft_max": 4},
+    {"draft_p_min": 0.5}
+])
+def test_key_covers_sampling_and_draft_settings(cache, change):
+    base = resolve_inference_config()
+    assert cache.make_key("prompt", base) != cache.make_key("prompt", dict(base, **change))
+
+def test_key_covers_the_backend(cache, monkeypatch):
+    fake_key = cache.make_key("prompt", resolve_inference_config())
+    monkeypatch.setitem(config.BACKEND_CONFIG, "backend", "cli")
+
+    assert cache.make_key("prompt", resolve_inference_config()) != fake_key
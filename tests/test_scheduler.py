@@ -0,0 +1,43 @@
+"""Scheduler admission, rejection and cancellation of queued requests"""
+
+import threading
+import time
+
+import pytest
+
+from scheduler import InferenceScheduler, QueueFullError, RequestCancelledError
+
+@pytest.fixture
+def scheduler():
+    return InferenceScheduler(max_concurrent=1, max_queue=1, max_queued_per_session=1,
+                              max_wait_seconds=600, default_service_seconds=1)
+
+def test_full_queue_rejects(scheduler):
+    with scheduler.slot("a"):
+        scheduler.submit("b")
+        with pytest.raises(QueueFullError):
+            scheduler.submit("c")
+
+def test_cancelled_request_leaves_the_queue(scheduler):
+    cancel_event = threading.Event()
+    errors = []
+
+    def queued_request():
+        try:
+            with scheduler.slot("b", cancel_event=cancel_event):
+                pass
+        except RequestCancelledError as e:
+            errors.append(e)
+
+    with scheduler.slot("a"):
+        waiter = threading.Thread(target=queued_request)
+        waiter.start()
+        while not scheduler.queued():
+            time.sleep(0.01)
+        cancel_event.set()
+        waiter.join(timeout=5)
+        assert not waiter.is_alive()
+        assert len(errors) == 1
+        assert scheduler.queued() == 0
+        assert scheduler.running == 1
+    assert scheduler.running == 0
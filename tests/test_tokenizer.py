@@ -0,0 +1,37 @@
+"""GGUF tokenizer: BOS handling and load caching"""
+
+import tokenizer
+from tokenizer import GGUFTokenizer, get_tokenizer
+
+TOKENS = ["<unk>", "<s>", "</s>", "▁", "h", "i", "▁h", "▁hi"]
+TOKEN_TYPES = [2, 3, 3, 1, 1, 1, 1, 1]
+
+def make_tokenizer(add_bos):
+    return GGUFTokenizer("llama", TOKENS, [0.0] * len(TOKENS), token_types=TOKEN_TYPES,
+                         add_bos=add_bos, bos_id=1)
+
+def test_prompt_counts_include_bos():
+    assert make_tokenizer(True).encode("hi") == [1, 7]
+    assert make_tokenizer(True).count("hi") == 2
+    assert make_tokenizer(True).count("hi", add_bos=False) == 1
+    assert make_tokenizer(False).count("hi") == 1
+
+def test_failed_load_is_cached(tmp_path, monkeypatch):
+    model_path = tmp_path / "broken.gguf"
+    model_path.write_bytes(b"not a gguf file")
+    calls = []
+
+    def failing_metadata(path, keys):
+        calls.append(path)
+        raise tokenizer.GGUFError("bad magic")
+
+    monkeypatch.setattr(tokenizer, "read_gguf_metadata", failing_metadata)
+    tokenizer._load_tokenizer.cache_clear()
+
+    assert get_tokenizer(model_path) is None
+    assert get_tokenizer(model_path) is None
+    assert len(calls) == 1
+
+    model_path.write_bytes(b"a different, still broken file")
+    assert get_tokenizer(model_path) is None
+    assert len(calls) == 2
@@ -0,0 +1,271 @@
+"""
+Token counting from the vocabulary embedded in the GGUF model
+
+llama.cpp models carry their tokenizer in the GGUF metadata
+(tokenizer.ggml.*). This module rebuilds it in Python so prompt and
+history lengths can be measured in real tokens without running llama.cpp.
+Both byte-level BPE vocabularies ("gpt2", used by Llama 3/4) and
+SentencePiece vocabularies ("llama") are supported.
+"""
+
+import logging
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple
+
+from gguf import read_gguf_metadata, GGUFError
+
+try:
+    # Supports \p{L}/\p{N}, matching llama.cpp's pre-tokenizers exactly
+    import regex as _regex
+except ImportError:
+    _regex = None
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_KEYS = [
+    "tokenizer.ggml.model",
+    "tokenizer.ggml.pre",
+    "tokenizer.ggml.tokens",
+    "tokenizer.ggml.scores",
+    "tokenizer.ggml.token_type",
+    "tokenizer.ggml.merges",
+    "tokenizer.ggml.add_bos_token",
+    "tokenizer.ggml.bos_token_id",
+    "tokenizer.ggml.add_space_prefix"
+]
+
+# tokenizer.ggml.token_type values for tokens matched verbatim in text
+TOKEN_TYPE_CONTROL = 3
+TOKEN_TYPE_USER_DEFINED = 4
+
+# Pre-tokenizer split patterns by tokenizer.ggml.pre, as in llama.cpp's llama-vocab.cpp
+_LLAMA3_PATTERN = (
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}"
+    r"| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+)
+_LLAMA4_PATTERN = (
+    r"[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?"
+    r"|[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?"
+    r"|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n/]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+)
+_GPT2_PATTERN = r"'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)"
+PRETOKENIZE_PATTERNS = {
+    "llama3": _LLAMA3_PATTERN,
+    "llama-v3": _LLAMA3_PATTERN,
+    "llama-bpe": _LLAMA3_PATTERN,
+    "llama4": _LLAMA4_PATTERN,
+    "gpt-4o": _LLAMA4_PATTERN,
+    "gpt-2": _GPT2_PATTERN
+}
+# Approximation for the standard re module: letters are word characters
+# that are neither digits nor underscore
+_PRETOKENIZE_PATTERN_RE = (
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\w]?[^\W\d_]+|_+|\d{1,3}"
+    r"| ?[^\s\w]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"
+)
+
+def _bytes_to_unicode() -> Dict[int, str]:
+    """GPT-2's reversible mapping from bytes to printable unicode characters"""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    chars = printable[:]
+    extra = 0
+    for b in range(256):
+        if b not in printable:
+            printable.append(b)
+            chars.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, (chr(c) for c in chars)))
+
+_BYTE_ENCODER = _bytes_to_unicode()
+
+class GGUFTokenizer:
+    """
+    Tokenizer rebuilt from a GGUF vocabulary.
+
+    Usage:
+        tokenizer = GGUFTokenizer.from_gguf(path)
+        n = tokenizer.count(text)
+    """
+
+    def __init__(self, model: str, tokens: List[str], scores: Optional[List[float]] = None,
+                 merges: Optional[List[str]] = None, token_types: Optional[List[int]] = None,
+                 add_bos: bool = False, pre: Optional[str] = None, add_space_prefix: bool = True,
+                 bos_id: Optional[int] = None):
+        if model not in ("gpt2", "llama"):
+            raise ValueError(f"Unsupported tokenizer model: {model}")
+        self.model = model
+        self.pre = pre
+        self.add_space_prefix = add_space_prefix
+        self.vocab = {token: i for i, token in enumerate(tokens)}
+        self.scores = scores or [0.0] * len(tokens)
+        self.merge_ranks: Dict[Tuple[str, str], int] = {}
+        for rank, merge in enumerate(merges or []):
+            left, _, right = merge.partition(" ")
+            self.merge_ranks[(left, right)] = rank
+        self.add_bos = add_bos
+        self.bos_id = bos_id
+
+        # Control tokens such as <|header_start|> appear verbatim in prompts
+        special = [
+            token for token, token_type in zip(tokens, token_types or [])
+            if token_type in (TOKEN_TYPE_CONTROL, TOKEN_TYPE_USER_DEFINED) and token
+        ]
+        special.sort(key=len, reverse=True)
+        self._special_pattern = re.compile("(" + "|".join(re.escape(t) for t in special) + ")") if special else None
+
+        pattern = PRETOKENIZE_PATTERNS.get(pre or "llama3")
+        if model == "gpt2" and pattern is None:
+            logger.warning(f"Unknown pre-tokenizer {pre!r}; using Llama 3's, token counts are approximate")
+            pattern = _LLAMA3_PATTERN
+        if _regex is not None:
+            self._pretokenize = _regex.compile(pattern).findall
+        else:
+            if model == "gpt2":
+                logger.warning("The regex package is not installed; token counts are approximate")
+            self._pretokenize = re.compile(_PRETOKENIZE_PATTERN_RE).findall
+        self._encode_word = lru_cache(maxsize=65536)(self._encode_word_uncached)
+
+    @classmethod
+    def from_gguf(cls, path: Path) -> "GGUFTokenizer":
+        """
+        Load the tokenizer stored in a GGUF file.
+
+        Args:
+            path: GGUF model file
+
+        Returns:
+            Tokenizer instance
+        """
+        metadata = read_gguf_metadata(path, TOKENIZER_KEYS)
+        if "tokenizer.ggml.tokens" not in metadata:
+            raise GGUFError(f"{path} has no embedded vocabulary")
+        model = metadata.get("tokenizer.ggml.model", "gpt2")
+        # llama.cpp's defaults when the keys are missing: SentencePiece adds BOS, id 1
+        spm = model == "llama"
+        return cls(
+            model,
+            metadata["tokenizer.ggml.tokens"],
+            metadata.get("tokenizer.ggml.scores"),
+            metadata.get("tokenizer.ggml.merges"),
+            metadata.get("tokenizer.ggml.token_type"),
+            bool(metadata.get("tokenizer.ggml.add_bos_token", spm)),
+            metadata.get("tokenizer.ggml.pre"),
+            bool(metadata.get("tokenizer.ggml.add_space_prefix", True)),
+            metadata.get("tokenizer.ggml.bos_token_id", 1 if spm else None)
+        )
+
+    def encode(self, text: str, add_bos: bool = True) -> List[int]:
+        """
+        Convert text to token ids.
+
+        Args:
+            text: Text, optionally containing control tokens
+            add_bos: Start with BOS when the model asks for it, as llama.cpp
+                does for a prompt; False for text that goes inside one
+
+        Returns:
+            Token ids
+        """
+        ids: List[int] = [self.bos_id] if add_bos and self.add_bos and self.bos_id is not None else []
+        parts = self._special_pattern.split(text) if self._special_pattern else [text]
+        prev_special = True
+        for i, part in enumerate(parts):
+            if not part:
+                continue
+            if i % 2 == 1:
+                ids.append(self.vocab[part])
+                prev_special = True
+                continue
+            if self.model == "gpt2":
+                for word in self._pretokenize(part):
+                    ids.extend(self._encode_word("".join(_BYTE_ENCODER[b] for b in word.encode("utf-8"))))
+            else:
+                # llama.cpp prefixes SentencePiece text with a space at the start and after control tokens
+                if self.add_space_prefix and prev_special:
+                    part = " " + part
+                for word in re.findall(r"\s*\S+|\s+", part.replace(" ", "▁")):
+                    ids.extend(self._encode_word(word))
+            prev_special = False
+        return ids
+
+    def count(self, text: str, add_bos: bool = True) -> int:
+        """
+        Count the tokens llama.cpp will see for a text.
+
+        Args:
+            text: Text to count
+            add_bos: Include the BOS token llama.cpp adds to a prompt
+
+        Returns:
+            Number of tokens
+        """
+        return len(self.encode(text, add_bos))
+
+    def _encode_word_uncached(self, word: str) -> Tuple[int, ...]:
+        if word in self.vocab:
+            return (self.vocab[word],)
+        symbols = list(word)
+        if self.model == "gpt2":
+            # Apply BPE merges in rank order
+            while len(symbols) > 1:
+                pairs = [(self.merge_ranks.get((a, b)), i) for i, (a, b) in enumerate(zip(symbols, symbols[1:]))]
+                ranked = [(rank, i) for rank, i in pairs if rank is not None]
+                if not ranked:
+                    break
+                _, i = min(ranked)
+                symbols[i:i + 2] = [symbols[i] + symbols[i + 1]]
+        else:
+            # SentencePiece: repeatedly merge the adjacent pair with the best score
+            while len(symbols) > 1:
+                best = None
+                for i, (a, b) in enumerate(zip(symbols, symbols[1:])):
+                    token_id = self.vocab.get(a + b)
+                    if token_id is not None and (best is None or self.scores[token_id] > best[0]):
+                        best = (self.scores[token_id], i)
+                if best is None:
+                    break
+                i = best[1]
+                symbols[i:i + 2] = [symbols[i] + symbols[i + 1]]
+
+        ids: List[int] = []
+        for symbol in symbols:
+            if symbol in self.vocab:
+                ids.append(self.vocab[symbol])
+            elif self.model == "llama":
+                # Byte fallback tokens <0xXX>
+                ids.extend(self.vocab.get(f"<0x{b:02X}>", 0) for b in symbol.encode("utf-8"))
+            else:
+                ids.extend(self.vocab.get(ch, 0) for ch in symbol)
+        return tuple(ids)
+
+@lru_cache(maxsize=4)
+def _load_tokenizer(path: str, mtime_ns: int, size: int) -> Optional[GGUFTokenizer]:
+    # A file that fails to load is remembered too, so a corrupt model is
+    # parsed once rather than on every count
+    logger.info(f"Loading tokenizer from {path}")
+    try:
+        return GGUFTokenizer.from_gguf(Path(path))
+    except (GGUFError, ValueError, KeyError, OSError) as e:
+        logger.warning(f"Could not load tokenizer from {path}: {e}")
+        return None
+
+def get_tokenizer(model_path: Path) -> Optional[GGUFTokenizer]:
+    """
+    Get the tokenizer for a model file, loading it once per process.
+
+    The cache is keyed by path, mtime and size, so a replaced model file
+    is picked up on the next call.
+
+    Args:
+        model_path: GGUF model file
+
+    Returns:
+        Tokenizer, or None when the model is missing or unreadable
+    """
+    try:
+        stat = model_path.stat()
+    except OSError:
+        return None
+    return _load_tokenizer(str(model_path), stat.st_mtime_ns, stat.st_size)
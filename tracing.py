@@ -0,0 +1,229 @@
+"""
+Lightweight request tracing for the Llama 4 Chat Interface
+
+A trace is a tree of timed spans for one request: sanitizing input,
+building the prompt, queueing, writing the prompt file, spawning llama.cpp
+and llama.cpp's own load / prompt-eval / generation phases. Finished
+traces are written as Chrome trace-event JSON, viewable in
+chrome://tracing or https://ui.perfetto.dev.
+
+    with start_trace("chat turn", sampled=True):
+        with span("fit_conversation"):
+            ...
+
+The current trace and span live in context variables, so instrumented
+code needs no extra arguments. Outside a sampled trace span() costs one
+context-variable lookup.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, List
+
+from config import TRACING_CONFIG
+
+logger = logging.getLogger(__name__)
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ("name", "span_id", "parent_id", "start_us", "end_us", "thread_id", "attributes")
+
+    def __init__(self, name: str, parent_id: Optional[str], start_us: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_us = start_us
+        self.end_us: Optional[int] = None
+        self.thread_id = threading.get_ident()
+        self.attributes = attributes
+
+class Trace:
+    """Spans recorded for one request"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.spans: List[Span] = []
+        self.path: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Convert the spans to the Chrome trace-event format.
+
+        Returns:
+            Dictionary with traceEvents as complete ("X") events in microseconds
+        """
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{self.name} {self.trace_id}"}}]
+        with self._lock:
+            for span in self.spans:
+                events.append({
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": span.start_us,
+                    "dur": (span.end_us or span.start_us) - span.start_us,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": dict(span.attributes, span_id=span.span_id, parent_id=span.parent_id)
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace_id": self.trace_id}}
+
+    def export(self, output_dir: Optional[Path] = None) -> Path:
+        """
+        Write the trace as JSON and prune old trace files.
+
+        Args:
+            output_dir: Directory to write to, TRACING_CONFIG output_dir by default
+
+        Returns:
+            Path of the written file
+        """
+        output_dir = Path(output_dir or TRACING_CONFIG["output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.path = output_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{self.trace_id}.json"
+        self.path.write_text(json.dumps(self.to_chrome_trace()), encoding="utf-8")
+        for old in sorted(output_dir.glob("*.json"))[:-TRACING_CONFIG["max_files"]]:
+            old.unlink(missing_ok=True)
+        logger.info(f"Trace written to {self.path}")
+        return self.path
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("llama_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("llama_span", default=None)
+
+def now_us() -> int:
+    """Monotonic timestamp in microseconds, the trace time base"""
+    return time.perf_counter_ns() // 1000
+
+def _reset(variable: ContextVar, token) -> None:
+    # A generator finalized from another context cannot reset its token
+    try:
+        variable.reset(token)
+    except ValueError:
+        pass
+
+def current_trace() -> Optional[Trace]:
+    """The trace active in this context, if any"""
+    return _current_trace.get()
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """
+    Time a block as a child of the current span.
+
+    Args:
+        name: Span name
+        **attributes: Values shown with the span
+
+    Yields:
+        The span, or None when no trace is active
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else None, now_us(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        current.end_us = now_us()
+        _reset(_current_span, token)
+        trace.add(current)
+
+def add_span(name: str, start_us: int, duration_us: int, **attributes) -> None:
+    """
+    Record an already-measured operation as a child of the current span.
+
+    Used for phases timed by llama.cpp itself.
+
+    Args:
+        name: Span name
+        start_us: Start time on the now_us() time base
+        duration_us: Duration in microseconds
+        **attributes: Values shown with the span
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    recorded = Span(name, parent.span_id if parent else None, start_us, attributes)
+    recorded.end_us = start_us + duration_us
+    trace.add(recorded)
+
+@contextmanager
+def start_trace(name: str, sampled: Optional[bool] = None, **attributes) -> Iterator[Optional[Trace]]:
+    """
+    Trace a request. Inside an active trace this is just a span.
+
+    Args:
+        name: Name of the root span
+        sampled: Force tracing on or off; by default requests are traced
+            at TRACING_CONFIG sample_rate
+        **attributes: Values shown with the root span
+
+    Yields:
+        The trace, or None when the request is not sampled
+    """
+    active = _current_trace.get()
+    if active is not None:
+        with span(name, **attributes):
+            yield active
+        return
+    if sampled is None:
+        sampled = TRACING_CONFIG["enabled"] and random.random() < TRACING_CONFIG["sample_rate"]
+    if not sampled:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        with span(name, **attributes):
+            yield trace
+    finally:
+        _reset(_current_trace, token)
+        try:
+            trace.export()
+        except OSError as e:
+            logger.warning(f"Could not write trace {trace.trace_id}: {e}")
+
+def add_timing_spans(start_us: int, timings: Dict[str, float]) -> None:
+    """
+    Lay llama.cpp's phase timings out as child spans of the current span.
+
+    llama.cpp reports durations only. Load, prompt eval and generation run
+    one after another, so they are placed back to back from start_us;
+    sampling is interleaved with generation and shown as one span inside it.
+
+    Args:
+        start_us: When llama.cpp started on this request (now_us() time base)
+        timings: parse_llama_timings() result or llama-server timings
+    """
+    if _current_trace.get() is None:
+        return
+    position = start_us
+    phases = (("load_ms", "load model", None), ("prompt_ms", "prompt eval", "prompt_n"),
+              ("predicted_ms", "generation", "predicted_n"))
+    for key, name, count_key in phases:
+        if not timings.get(key):
+            continue
+        duration = int(timings[key] * 1000)
+        attributes = {"tokens": timings[count_key]} if count_key in timings else {}
+        add_span(name, position, duration, **attributes)
+        if key == "predicted_ms" and timings.get("sampling_ms"):
+            add_span("sampling", position, int(timings["sampling_ms"] * 1000))
+        position += duration
@@ -0,0 +1,246 @@
+"""
+Hardware auto-tuner for the Llama 4 Chat Interface
+
+Picks threads, batch sizes, ctx_size and GPU offload for this machine and
+saves them, per model, in a per-host profile (profiles/<hostname>.json)
+that run_llama_inference loads automatically.
+
+Thread and batch candidates are derived from the core and NUMA layout and
+then measured with short llama-bench runs: generation alone for each
+thread count, then prompt eval alone for each batch setting at the
+fastest thread count. Without llama-bench the heuristic choice is saved
+as-is.
+
+    python tune.py                        # detect, calibrate and save for the default model
+    python tune.py --model llama-3.2-3b   # tune another registered model
+    python tune.py --dry-run              # print the profile without saving
+"""
+
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from config import (
+    INFERENCE_CONFIG, TUNING_CONFIG, PROFILES_DIR, MODEL_REGISTRY, DEFAULT_MODEL,
+    get_model_path, get_llama_bench_path, get_host_profile_path
+)
+from gguf import get_model_info
+from utils import get_system_info
+
+logger = logging.getLogger(__name__)
+
+def candidate_thread_counts(hardware: Dict[str, Any]) -> List[int]:
+    """
+    Thread counts worth measuring.
+
+    llama.cpp generation is memory-bound and usually peaks at or below the
+    number of physical cores; hyperthreads and cross-NUMA threads tend to
+    slow it down.
+
+    Args:
+        hardware: get_system_info() result
+
+    Returns:
+        Sorted, de-duplicated thread counts
+    """
+    physical = hardware["physical_cores"]
+    per_node = max(1, physical // hardware["numa_nodes"])
+    candidates = {physical, max(1, physical // 2), max(1, physical * 3 // 4), per_node}
+    return sorted(candidates)
+
+def pick_ctx_size(hardware: Dict[str, Any], model_info: Dict[str, Any]) -> int:
+    """
+    Largest context whose KV cache fits next to the model in RAM.
+
+    Args:
+        hardware: get_system_info() result
+        model_info: get_model_info() result for the model
+
+    Returns:
+        ctx_size, a multiple of 1024 within TUNING_CONFIG limits
+    """
+    ctx_size = TUNING_CONFIG["max_ctx_size"]
+    kv_bytes_per_token = model_info.get("kv_bytes_per_token")
+    if kv_bytes_per_token:
+        free_bytes = (hardware["memory_total_gb"] - TUNING_CONFIG["ram_headroom_gb"]) * 1024**3
+        free_bytes -= model_info.get("file_size") or 0
+        ctx_size = min(ctx_size, int(free_bytes // kv_bytes_per_token))
+    if model_info.get("context_length"):
+        ctx_size = min(ctx_size, model_info["context_length"])
+    ctx_size = max(TUNING_CONFIG["min_ctx_size"], ctx_size // 1024 * 1024)
+    return ctx_size
+
+def run_llama_bench(model: str, threads: List[int], batch_sizes: List[int], ubatch_sizes: List[int],
+                    n_gpu_layers: int, n_prompt: int, n_gen: int) -> List[Dict[str, Any]]:
+    """
+    Measure prompt-eval and/or generation speed for every parameter combination.
+
+    Args:
+        model: MODEL_REGISTRY key
+        threads: Thread counts to test
+        batch_sizes: Logical batch sizes to test
+        ubatch_sizes: Physical batch sizes to test
+        n_gpu_layers: Layers to offload
+        n_prompt: Prompt tokens per prompt-eval test, 0 to skip prompt eval
+        n_gen: Tokens per generation test, 0 to skip generation
+
+    Returns:
+        llama-bench JSON rows (n_threads, n_batch, n_ubatch, n_prompt, n_gen, avg_ts, ...)
+    """
+    cmd = [
+        str(get_llama_bench_path()),
+        "--model", str(get_model_path(model)),
+        "--threads", ",".join(str(t) for t in threads),
+        "--batch-size", ",".join(str(b) for b in batch_sizes),
+        "--ubatch-size", ",".join(str(u) for u in ubatch_sizes),
+        "--n-gpu-layers", str(n_gpu_layers),
+        "--n-prompt", str(n_prompt),
+        "--n-gen", str(n_gen),
+        "--repetitions", str(TUNING_CONFIG["repetitions"]),
+        "--output", "json"
+    ]
+    logger.info(f"Calibrating: {' '.join(cmd)}")
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)
+    if result.returncode != 0:
+        raise RuntimeError(f"llama-bench failed: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+def choose_from_calibration(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Pick the thread count with the fastest generation, then the batch sizes
+    with the fastest prompt eval at that thread count.
+
+    Args:
+        rows: run_llama_bench() result
+
+    Returns:
+        threads, batch_size and ubatch_size
+    """
+    gen_rows = [r for r in rows if r.get("n_gen", 0) > 0 and r.get("n_prompt", 0) == 0]
+    prompt_rows = [r for r in rows if r.get("n_prompt", 0) > 0 and r.get("n_gen", 0) == 0]
+    if not gen_rows or not prompt_rows:
+        raise RuntimeError("llama-bench returned no usable measurements")
+
+    # Generation does not depend on batch size; average over batch settings
+    gen_speed: Dict[int, List[float]] = {}
+    for row in gen_rows:
+        gen_speed.setdefault(row["n_threads"], []).append(row["avg_ts"])
+    threads = max(gen_speed, key=lambda t: sum(gen_speed[t]) / len(gen_speed[t]))
+
+    best_prompt = max((r for r in prompt_rows if r["n_threads"] == threads), key=lambda r: r["avg_ts"])
+    return {
+        "threads": threads,
+        "batch_size": best_prompt["n_batch"],
+        "ubatch_size": best_prompt["n_ubatch"]
+    }
+
+def build_profile(model: Optional[str] = None, calibrate: bool = True) -> Dict[str, Any]:
+    """
+    Detect the hardware and work out a model's inference parameters for it.
+
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+        calibrate: Run llama-bench when it and the model are available
+
+    Returns:
+        Profile with the model key, hardware, inference parameters and calibration data
+    """
+    model = model or DEFAULT_MODEL
+    hardware = get_system_info()
+    model_info = get_model_info(get_model_path(model))
+    n_gpu_layers = INFERENCE_CONFIG["n_gpu_layers"] if hardware["gpu"] else 0
+
+    threads = candidate_thread_counts(hardware)
+    inference = {
+        "threads": hardware["physical_cores"],
+        "batch_size": INFERENCE_CONFIG["batch_size"],
+        "ubatch_size": INFERENCE_CONFIG["ubatch_size"],
+        "ctx_size": pick_ctx_size(hardware, model_info),
+        "n_gpu_layers": n_gpu_layers
+    }
+
+    calibration: List[Dict[str, Any]] = []
+    if calibrate and get_llama_bench_path().exists() and model_info["valid"]:
+        # Generation speed does not depend on the batch sizes, and prompt eval is
+        # only worth sweeping at the thread count generation will use
+        calibration = run_llama_bench(
+            model, threads, [inference["batch_size"]], [inference["ubatch_size"]], n_gpu_layers,
+            n_prompt=0, n_gen=TUNING_CONFIG["gen_tokens"]
+        )
+        gen_speed = {row["n_threads"]: row["avg_ts"] for row in calibration if row.get("n_gen", 0) > 0}
+        if gen_speed:
+            calibration += run_llama_bench(
+                model, [max(gen_speed, key=gen_speed.get)], TUNING_CONFIG["batch_sizes"], TUNING_CONFIG["ubatch_sizes"],
+                n_gpu_layers, n_prompt=TUNING_CONFIG["prompt_tokens"], n_gen=0
+            )
+        inference.update(choose_from_calibration(calibration))
+    elif calibrate:
+        logger.warning("llama-bench or a valid model is missing; saving heuristic settings without calibration")
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "hardware": hardware,
+        "model": model,
+        "model_file": get_model_path(model).name,
+        "inference": inference,
+        "calibration": calibration
+    }
+
+def save_profile(profile: Dict[str, Any], path: Optional[Path] = None) -> Path:
+    """
+    Merge a model's profile into the host profile, where load_host_profile() will find it.
+
+    Other models' parameters and the quantization choices download.py
+    saved in the same file are kept.
+
+    Args:
+        profile: build_profile() result
+        path: Destination, defaults to this host's profile path
+
+    Returns:
+        Path written
+    """
+    path = path or get_host_profile_path()
+    existing = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    inference = existing.get("inference", {})
+    calibration = existing.get("calibration", {})
+    if inference and not all(isinstance(value, dict) for value in inference.values()):
+        # Written before per-model tuning, for the default model
+        inference = {DEFAULT_MODEL: inference}
+        calibration = {DEFAULT_MODEL: calibration}
+    model = profile["model"]
+    merged = dict(existing)
+    merged.pop("model", None)
+    merged.update(
+        created=profile["created"],
+        hardware=profile["hardware"],
+        inference=dict(inference, **{model: profile["inference"]}),
+        calibration=dict(calibration, **{model: profile["calibration"]})
+    )
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(merged, indent=2), encoding="utf-8")
+    return path
+
+def main():
+    """Main tuning function"""
+    parser = argparse.ArgumentParser(description="Tune llama.cpp parameters for this machine")
+    parser.add_argument("--model", choices=list(MODEL_REGISTRY), default=DEFAULT_MODEL,
+                        help=f"Model to tune (default {DEFAULT_MODEL})")
+    parser.add_argument("--no-calibrate", action="store_true", help="Skip llama-bench, use heuristics only")
+    parser.add_argument("--dry-run", action="store_true", help="Print the profile without saving it")
+    args = parser.parse_args()
+
+    profile = build_profile(args.model, calibrate=not args.no_calibrate)
+    print(json.dumps(profile["inference"], indent=2))
+    if args.dry_run:
+        return
+    path = save_profile(profile)
+    print(f"✅ Saved {args.model} tuning profile to {path}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,208 +1,641 @@
-"""
-Utility functions for the Llama 4 Chat Interface
-"""
-
-import tempfile
-import os
-import subprocess
-import logging
-from pathlib import Path
-from typing import Optional, Dict, Any
-import time
-
-from config import INFERENCE_CONFIG, get_model_path, get_llama_cpp_path
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-def format_prompt(user_input: str, system_prompt: Optional[str] = None) -> str:
-    """
-    Format user input into the expected prompt format for Llama 4.
-    
-    Args:
-        user_input: The user's input text
-        system_prompt: Optional system prompt to prepend
-    
-    Returns:
-        Formatted prompt string
-    """
-    if system_prompt:
-        formatted = f"<|header_start|>system<|header_end|>\n\n{system_prompt}<|eot|>"
-    else:
-        formatted = ""
-    
-    formatted += f"<|header_start|>user<|header_end|>\n\n{user_input}<|eot|><|header_start|>assistant<|header_end|>\n\n"
-    return formatted
-
-def run_llama_inference(prompt: str, custom_config: Optional[Dict[str, Any]] = None) -> str:
-    """
-    Run Llama inference using llama.cpp.
-    
-    Args:
-        prompt: The formatted prompt to send to the model
-        custom_config: Optional custom configuration parameters
-    
-    Returns:
-        Model response as string
-    """
-    config = INFERENCE_CONFIG.copy()
-    if custom_config:
-        config.update(custom_config)
-    
-    # Create temporary file for prompt
-    with tempfile.NamedTemporaryFile(delete=False, mode="w", suffix=".txt", encoding="utf-8") as tmp_prompt:
-        tmp_prompt.write(prompt)
-        tmp_prompt_path = tmp_prompt.name
-
-    try:
-        # Build command
-        cmd = [
-            str(get_llama_cpp_path()),
-            "--model", str(get_model_path()),
-            "--threads", str(config["threads"]),
-            "--ctx-size", str(config["ctx_size"]),
-            "--n-gpu-layers", str(config["n_gpu_layers"]),
-            "-ot", config["gpu_layers_filter"],
-            "--seed", str(config["seed"]),
-            "--prio", str(config["priority"]),
-            "--temp", str(config["temperature"]),
-            "--min-p", str(config["min_p"]),
-            "--top-p", str(config["top_p"]),
-            "--repeat-penalty", str(config["repeat_penalty"]),
-            "--file", tmp_prompt_path
-        ]
-        
-        logger.info(f"Running inference with config: {config}")
-        start_time = time.time()
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
-        )
-        
-        inference_time = time.time() - start_time
-        logger.info(f"Inference completed in {inference_time:.2f} seconds")
-        
-        if result.returncode != 0:
-            logger.error(f"llama.cpp error: {result.stderr}")
-            return f"Error: {result.stderr}"
-        
-        return result.stdout.strip()
-        
-    except subprocess.TimeoutExpired:
-        logger.error("Inference timed out")
-        return "Error: Inference timed out after 5 minutes"
-    except Exception as e:
-        logger.error(f"Inference error: {e}")
-        return f"Error: {e}"
-    finally:
-        # Clean up temporary file
-        try:
-            os.remove(tmp_prompt_path)
-        except OSError:
-            pass
-
-def validate_model_exists() -> bool:
-    """
-    Check if the model file exists.
-    
-    Returns:
-        True if model exists, False otherwise
-    """
-    model_path = get_model_path()
-    exists = model_path.exists()
-    if not exists:
-        logger.warning(f"Model not found at {model_path}")
-    return exists
-
-def validate_llama_cpp_exists() -> bool:
-    """
-    Check if llama.cpp executable exists.
-    
-    Returns:
-        True if executable exists, False otherwise
-    """
-    llama_path = get_llama_cpp_path()
-    exists = llama_path.exists()
-    if not exists:
-        logger.warning(f"llama.cpp not found at {llama_path}")
-    return exists
-
-def get_system_info() -> Dict[str, Any]:
-    """
-    Get system information for debugging.
-    
-    Returns:
-        Dictionary with system information
-    """
-    import psutil
-    import sys
-    
-    return {
-        "python_version": sys.version,
-        "platform": sys.platform,
-        "cpu_count": psutil.cpu_count(),
-        "memory_total_gb": psutil.virtual_memory().total / (1024**3),
-        "memory_available_gb": psutil.virtual_memory().available / (1024**3),
-        "disk_usage": psutil.disk_usage('/').percent if os.name != 'nt' else psutil.disk_usage('C:\\').percent
-    }
-
-def sanitize_input(text: str) -> str:
-    """
-    Sanitize user input to prevent injection attacks.
-    
-    Args:
-        text: Input text to sanitize
-    
-    Returns:
-        Sanitized text
-    """
-    # Remove potentially dangerous characters
-    dangerous_chars = ['<script>', '</script>', 'javascript:', 'data:', 'vbscript:']
-    sanitized = text
-    for char in dangerous_chars:
-        sanitized = sanitized.replace(char, '')
-    
-    # Limit length
-    if len(sanitized) > 10000:
-        sanitized = sanitized[:10000] + "..."
-    
-    return sanitized
-
-def estimate_tokens(text: str) -> int:
-    """
-    Rough estimate of token count (approximate).
-    
-    Args:
-        text: Text to estimate tokens for
-    
-    Returns:
-        Estimated token count
-    """
-    # Rough approximation: 1 token ≈ 4 characters for English text
-    return len(text) // 4
-
-def format_response_time(seconds: float) -> str:
-    """
-    Format response time in a human-readable format.
-    
-    Args:
-        seconds: Time in seconds
-    
-    Returns:
-        Formatted time string
-    """
-    if seconds < 1:
-        return f"{seconds*1000:.0f}ms"
-    elif seconds < 60:
-        return f"{seconds:.1f}s"
-    else:
-        minutes = int(seconds // 60)
-        remaining_seconds = seconds % 60
+"""
+Utility functions for the Llama 4 Chat Interface
+"""
+
+import os
+import subprocess
+import logging
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator, Sequence, Callable
+import time
+
+from config import (
+    INFERENCE_CONFIG, PROMPT_CACHE_DIR, MODEL_REGISTRY, DEFAULT_MODEL,
+    get_model_config, get_model_path, get_llama_cpp_path, get_llama_server_path, load_host_profile
+)
+from response_cache import get_response_cache
+from semantic_cache import get_semantic_cache
+from tokenizer import get_tokenizer
+from gguf import get_model_info
+from scheduler import get_scheduler, QueueFullError, RequestCancelledError
+from metrics import record_request
+from tracing import start_trace, span, add_span, now_us
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Message header and end-of-turn tokens of each chat_format in MODEL_REGISTRY
+CHAT_FORMATS = {
+    "llama4": ("<|header_start|>", "<|header_end|>", "<|eot|>"),
+    "llama3": ("<|start_header_id|>", "<|end_header_id|>", "<|eot_id|>")
+}
+
+def get_chat_format(model: Optional[str] = None) -> str:
+    """
+    Get the prompt template a model was trained with.
+    
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+    
+    Returns:
+        Key of CHAT_FORMATS
+    """
+    return get_model_config(model)["chat_format"]
+
+def format_prompt(user_input: str, system_prompt: Optional[str] = None,
+                  chat_format: Optional[str] = None) -> str:
+    """
+    Format user input into the expected prompt format of the model.
+    
+    Args:
+        user_input: The user's input text
+        system_prompt: Optional system prompt to prepend
+        chat_format: Prompt template, the default model's when None
+    
+    Returns:
+        Formatted prompt string
+    """
+    header_start, header_end, _ = CHAT_FORMATS[chat_format or get_chat_format()]
+    if system_prompt:
+        formatted = format_turn("system", system_prompt, chat_format)
+    else:
+        formatted = ""
+    
+    formatted += format_turn("user", user_input, chat_format) + f"{header_start}assistant{header_end}\n\n"
+    return formatted
+
+def format_turn(role: str, content: str, chat_format: Optional[str] = None) -> str:
+    """
+    Format a single completed message in the model's header format.
+    
+    Args:
+        role: Message role (system, user or assistant)
+        content: Message text
+        chat_format: Prompt template, the default model's when None
+    
+    Returns:
+        Formatted message string
+    """
+    header_start, header_end, eot = CHAT_FORMATS[chat_format or get_chat_format()]
+    return f"{header_start}{role}{header_end}\n\n{content}{eot}"
+
+def format_conversation(history: Sequence[Sequence[str]], user_input: str,
+                        system_prompt: Optional[str] = None,
+                        chat_format: Optional[str] = None) -> str:
+    """
+    Format a multi-turn conversation into the expected prompt format of the model.
+    
+    Each turn's prompt extends the previous turn's prompt plus its reply, so
+    llama.cpp can reuse the cached prefix and only evaluate the new suffix.
+    
+    Args:
+        history: Previous turns as (user_message, assistant_message, ...) tuples
+        user_input: The new user message
+        system_prompt: Optional system prompt to prepend
+        chat_format: Prompt template, the default model's when None
+    
+    Returns:
+        Formatted prompt string
+    """
+    formatted = format_turn("system", system_prompt, chat_format) if system_prompt else ""
+    for turn in history:
+        user_msg, assistant_msg = turn[0], turn[1]
+        # Failed turns never reached the model, so leave them out
+        if assistant_msg.startswith("Error:"):
+            continue
+        formatted += format_turn("user", user_msg, chat_format) + format_turn("assistant", assistant_msg, chat_format)
+    
+    return formatted + format_prompt(user_input, chat_format=chat_format)
+
+def get_session_cache_path(session_id: str, backend: str, model: Optional[str] = None) -> Path:
+    """
+    Get the prompt-cache file holding a chat session's evaluated KV state.
+    
+    KV state only fits the model that produced it, so every model a
+    session talks to has its own file.
+    
+    Args:
+        session_id: Chat session identifier (letters, digits, - and _)
+        backend: "cli" for llama-cli --prompt-cache files, "slot" for llama-server slot snapshots
+        model: MODEL_REGISTRY key, the default model when None
+    
+    Returns:
+        Path of the cache file
+    """
+    if not session_id.replace("-", "").replace("_", "").isalnum():
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    PROMPT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return PROMPT_CACHE_DIR / f"{session_id}.{model or DEFAULT_MODEL}.{backend}.bin"
+
+def clear_session_cache(session_id: str) -> None:
+    """
+    Delete the prompt-cache files of a chat session.
+    
+    Args:
+        session_id: Chat session identifier
+    """
+    for model in MODEL_REGISTRY:
+        for backend in ("cli", "slot"):
+            try:
+                get_session_cache_path(session_id, backend, model).unlink()
+            except FileNotFoundError:
+                pass
+
+class InferenceError(RuntimeError):
+    """Raised when llama.cpp fails to produce a response"""
+
+class InferenceBusyError(InferenceError):
+    """Raised when the scheduler turns a request away because it is overloaded"""
+
+class InferenceTimeoutError(InferenceError):
+    """Raised when llama.cpp does not finish within the request timeout"""
+
+# llama.cpp timing lines, e.g.
+# "llama_perf_context_print: prompt eval time =  123.45 ms /  10 tokens (...)"
+_TIMING_PATTERN = re.compile(
+    r"(?:llama_perf_context_print|llama_perf_sampler_print|llama_print_timings):\s*"
+    r"(load|prompt eval|eval|sample|sampling|total) time\s*=\s*"
+    r"([\d.]+) ms(?:\s*/\s*(\d+) (?:tokens|runs))?"
+)
+
+def parse_llama_timings(output: str) -> Dict[str, float]:
+    """
+    Parse the timing summary llama.cpp prints to stderr.
+    
+    Keys follow the `timings` object returned by llama-server.
+    
+    Args:
+        output: llama.cpp stderr text
+    
+    Returns:
+        Dictionary with load_ms, prompt_n, prompt_ms, prompt_per_second,
+        predicted_n, predicted_ms, predicted_per_second, sampling_ms and
+        total_ms (when present)
+    """
+    timings: Dict[str, float] = {}
+    for phase, ms, count in _TIMING_PATTERN.findall(output):
+        ms = float(ms)
+        if phase == "load":
+            timings["load_ms"] = ms
+        elif phase == "total":
+            timings["total_ms"] = ms
+        elif phase in ("sample", "sampling"):
+            timings["sampling_ms"] = ms
+        else:
+            prefix = "prompt" if phase == "prompt eval" else "predicted"
+            timings[f"{prefix}_ms"] = ms
+            if count:
+                timings[f"{prefix}_n"] = int(count)
+                timings[f"{prefix}_per_second"] = int(count) * 1000 / ms if ms > 0 else 0.0
+    return timings
+
+# Cancel flags of in-flight requests, by session
+_cancel_events: Dict[str, threading.Event] = {}
+_cancel_lock = threading.Lock()
+
+def cancel_inference(session_id: str) -> bool:
+    """
+    Stop a session's in-flight request, killing llama-cli straight away.
+    
+    Args:
+        session_id: Chat session whose request should stop
+    
+    Returns:
+        True if a request was running
+    """
+    with _cancel_lock:
+        event = _cancel_events.get(session_id)
+    if event is None:
+        return False
+    logger.info(f"Cancelling inference for session {session_id}")
+    event.set()
+    return True
+
+def truncate_at_stop(chunks: Iterator[str], stop: Sequence[str],
+                     stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    End a text stream at the first stop sequence.
+    
+    Text that could be the start of a stop sequence split across chunks is
+    held back until the next chunk decides it. Returning early closes the
+    underlying stream, which stops llama.cpp.
+    
+    Args:
+        chunks: Generated text chunks
+        stop: Stop sequences
+        stats: Optional dictionary; stop_reason is set to "stop_sequence" on a match
+    
+    Yields:
+        Text up to, not including, the stop sequence
+    """
+    stop = [s for s in stop if s]
+    if not stop:
+        yield from chunks
+        return
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        matches = [(pending.find(s), s) for s in stop if s in pending]
+        if matches:
+            index, _ = min(matches)
+            if index:
+                yield pending[:index]
+            if stats is not None:
+                stats["stop_reason"] = "stop_sequence"
+            chunks.close()
+            return
+        # Keep the longest tail that is a prefix of some stop sequence
+        hold = max((n for s in stop for n in range(1, len(s)) if pending.endswith(s[:n])), default=0)
+        if len(pending) > hold:
+            yield pending[:len(pending) - hold]
+            pending = pending[len(pending) - hold:]
+    if pending:
+        yield pending
+
+def run_llama_inference(prompt: str, custom_config: Optional[Dict[str, Any]] = None,
+                        session_id: Optional[str] = None, question: Optional[str] = None) -> str:
+    """
+    Run Llama inference using llama.cpp.
+    
+    Collects the full response from `stream_llama_inference`.
+    
+    Args:
+        prompt: The formatted prompt to send to the model
+        custom_config: Optional custom configuration parameters
+        session_id: Optional chat session whose prompt cache should be reused
+        question: Optional sanitized user message the prompt ends with, for the semantic cache
+    
+    Returns:
+        Model response as string
+    """
+    try:
+        return "".join(stream_llama_inference(prompt, custom_config, session_id, question=question)).strip()
+    except InferenceError as e:
+        return f"Error: {e}"
+
+def stream_llama_inference(prompt: str, custom_config: Optional[Dict[str, Any]] = None,
+                           session_id: Optional[str] = None,
+                           stats: Optional[Dict[str, Any]] = None,
+                           on_wait: Optional[Callable[[int, float], None]] = None,
+                           question: Optional[str] = None,
+                           cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+    """
+    Stream Llama inference using llama.cpp, yielding text as it is generated.
+    
+    Runs on the backend selected in BACKEND_CONFIG; by default the
+    persistent llama-server worker when it is enabled and built, otherwise
+    llama-cli spawned for this prompt. With a session_id the session's KV
+    state is restored from its prompt-cache file first, so only the part
+    of the prompt added since the last turn is evaluated. Fixed-seed
+    repeats are answered from the response cache, and with a question, so
+    are paraphrases of a question already answered in the same context.
+    Everything else waits for a slot in the process-wide scheduler.
+    
+    Args:
+        prompt: The formatted prompt to send to the model
+        custom_config: Optional custom configuration parameters
+        session_id: Optional chat session whose prompt cache should be reused
+        stats: Optional dictionary filled with cache_hit, semantic_similarity
+            (on a semantic cache hit), queue_seconds, ttft_seconds,
+            total_seconds, stop_reason ("eos", "stop_sequence" or
+            "cancelled") and the llama.cpp timings of this request
+        on_wait: Optional callback receiving (queue position, estimated wait
+            in seconds) while the request is queued
+        question: Optional sanitized user message the prompt ends with
+        cancel_event: Optional event that stops generation, or withdraws the
+            request from the queue, when set; for callers that cancel
+            without a session_id
+    
+    Yields:
+        Chunks of generated text
+    
+    Raises:
+        InferenceBusyError: If the scheduler rejects the request
+        InferenceTimeoutError: If llama.cpp does not finish in time
+        InferenceError: If llama.cpp fails
+    """
+    config = resolve_inference_config(custom_config)
+    if stats is None:
+        stats = {}
+    stats["cache_hit"] = False
+    
+    with start_trace("inference", session_id=session_id or ""):
+        # Fixed-seed generations are deterministic, so repeats can be served from cache
+        cache = get_response_cache()
+        cache_key = cache.make_key(prompt, config) if cache else None
+        if cache_key:
+            with span("response_cache.get"):
+                cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("Response cache hit")
+                stats["cache_hit"] = True
+                record_request(stats, "cache", "ok")
+                yield cached
+                return
+        
+        # Paraphrases of a question already answered in the same context
+        semantic_cache = get_semantic_cache() if question else None
+        semantic_scope = semantic_cache.make_scope(prompt, question, config) if semantic_cache else None
+        if semantic_scope is not None:
+            with span("semantic_cache.get"):
+                match = semantic_cache.get(question, semantic_scope)
+            if match is not None:
+                cached, similarity = match
+                logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+                stats["cache_hit"] = True
+                stats["semantic_similarity"] = similarity
+                record_request(stats, "cache", "ok")
+                yield cached
+                return
+        
+        from backends import get_backend
+        backend = get_backend()
+        outcome = "error"
+        cancel_event = cancel_event or threading.Event()
+        if session_id:
+            with _cancel_lock:
+                _cancel_events[session_id] = cancel_event
+        try:
+            with get_scheduler().slot(session_id, on_wait, cancel_event) as ticket:
+                stats["queue_seconds"] = ticket.admitted_at - ticket.enqueued_at
+                queue_us = int(stats["queue_seconds"] * 1e6)
+                add_span("queue", now_us() - queue_us, queue_us)
+                parts = yield from _stream_admitted(prompt, config, session_id, stats, backend, cancel_event)
+            outcome = "cancelled" if cancel_event.is_set() else "ok"
+        except QueueFullError as e:
+            outcome = "rejected"
+            raise InferenceBusyError(str(e)) from e
+        except RequestCancelledError:
+            outcome = "cancelled"
+            stats["stop_reason"] = "cancelled"
+            return
+        except InferenceTimeoutError:
+            outcome = "timeout"
+            raise
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            if session_id:
+                with _cancel_lock:
+                    if _cancel_events.get(session_id) is cancel_event:
+                        del _cancel_events[session_id]
+            record_request(stats, backend.name, outcome)
+        
+        # A cancelled response is incomplete, so it must not be replayed
+        if cache_key and outcome == "ok":
+            cache.put(cache_key, "".join(parts))
+        if semantic_scope is not None and outcome == "ok":
+            semantic_cache.put(question, semantic_scope, "".join(parts))
+
+def _stream_admitted(prompt: str, config: Dict[str, Any], session_id: Optional[str],
+                     stats: Dict[str, Any], backend, cancel_event: threading.Event) -> Iterator[str]:
+    """Run a request that holds a scheduler slot; returns the generated parts"""
+    logger.info(f"Running inference with config: {config}")
+    start_time = time.time()
+    first_token_time = None
+    stats["stop_reason"] = "eos"
+    if cancel_event.is_set():
+        stats["stop_reason"] = "cancelled"
+        return []
+    
+    chunks = backend.stream(prompt, config, session_id, stats, cancel_event)
+    
+    parts = []
+    try:
+        for chunk in truncate_at_stop(chunks, config["stop"], stats):
+            if cancel_event.is_set():
+                stats["stop_reason"] = "cancelled"
+                break
+            if first_token_time is None:
+                first_token_time = time.time() - start_time
+                stats["ttft_seconds"] = first_token_time
+                logger.info(f"First token after {first_token_time:.2f} seconds")
+            parts.append(chunk)
+            yield chunk
+    finally:
+        # Stops llama-cli or drops the server connection, freeing the cores
+        chunks.close()
+    if cancel_event.is_set():
+        stats["stop_reason"] = "cancelled"
+    elif stats["stop_reason"] == "eos" and stats.get("predicted_n", 0) >= config["max_tokens"]:
+        stats["stop_reason"] = "length"
+    
+    inference_time = time.time() - start_time
+    stats["total_seconds"] = inference_time
+    logger.info(f"Inference completed in {inference_time:.2f} seconds")
+    return parts
+
+def resolve_inference_config(custom_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Merge custom parameters into INFERENCE_CONFIG and fit them to the model.
+    
+    custom_config["model"] picks the model from MODEL_REGISTRY. Precedence
+    is INFERENCE_CONFIG, then the model's defaults, then this host's tuning
+    profile for the model, then custom_config. ctx_size is capped at the
+    context length the model was trained with, as read from its GGUF header.
+    
+    Args:
+        custom_config: Optional custom configuration parameters
+    
+    Returns:
+        Resolved configuration dictionary, including the model key
+    """
+    model = (custom_config or {}).get("model") or DEFAULT_MODEL
+    config = INFERENCE_CONFIG.copy()
+    config.update(get_model_config(model)["inference"])
+    config.update(load_host_profile(model))
+    if custom_config:
+        config.update(custom_config)
+    config["model"] = model
+    
+    model_info = get_model_info(get_model_path(model))
+    context_length = model_info.get("context_length")
+    if context_length and config["ctx_size"] > context_length:
+        logger.info(f"Capping ctx_size {config['ctx_size']} to the model's context length {context_length}")
+        config["ctx_size"] = context_length
+    return config
+
+def use_server_worker() -> bool:
+    """
+    Check whether inference goes through the persistent worker.
+    
+    Returns:
+        True if the selected backend is the llama-server worker
+    """
+    from backends import get_backend
+    return get_backend().name == "server"
+
+def validate_model_exists(model: Optional[str] = None) -> bool:
+    """
+    Check if the model file exists and has a valid GGUF header.
+    
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+    
+    Returns:
+        True if model exists and is intact, False otherwise
+    """
+    model_path = get_model_path(model)
+    exists = model_path.exists()
+    if not exists:
+        logger.warning(f"Model not found at {model_path}")
+        return False
+    
+    # Catch truncated or corrupt downloads before llama.cpp tries to load them
+    model_info = get_model_info(model_path)
+    if not model_info["valid"]:
+        logger.error(f"Model at {model_path} is not usable: {model_info['error']}")
+        return False
+    return True
+
+def validate_llama_cpp_exists() -> bool:
+    """
+    Check if llama.cpp executable exists.
+    
+    Returns:
+        True if executable exists, False otherwise
+    """
+    llama_path = get_llama_cpp_path()
+    exists = llama_path.exists()
+    if not exists:
+        logger.warning(f"llama.cpp not found at {llama_path}")
+    return exists
+
+def validate_llama_server_exists() -> bool:
+    """
+    Check if the llama-server executable exists.
+    
+    Returns:
+        True if executable exists, False otherwise
+    """
+    return get_llama_server_path().exists()
+
+def get_system_info() -> Dict[str, Any]:
+    """
+    Get system information for debugging.
+    
+    Returns:
+        Dictionary with system information
+    """
+    import psutil
+    import sys
+    
+    return {
+        "python_version": sys.version,
+        "platform": sys.platform,
+        "cpu_count": psutil.cpu_count(),
+        "physical_cores": psutil.cpu_count(logical=False) or psutil.cpu_count(),
+        "numa_nodes": get_numa_node_count(),
+        "gpu": detect_gpu(),
+        "memory_total_gb": psutil.virtual_memory().total / (1024**3),
+        "memory_available_gb": psutil.virtual_memory().available / (1024**3),
+        "disk_usage": psutil.disk_usage('/').percent if os.name != 'nt' else psutil.disk_usage('C:\\').percent
+    }
+
+def get_numa_node_count() -> int:
+    """
+    Count NUMA nodes (Linux only).
+    
+    Returns:
+        Number of NUMA nodes, 1 when unknown
+    """
+    node_dir = Path("/sys/devices/system/node")
+    if not node_dir.is_dir():
+        return 1
+    nodes = [p for p in node_dir.iterdir() if re.fullmatch(r"node\d+", p.name)]
+    return max(1, len(nodes))
+
+def detect_gpu() -> Optional[str]:
+    """
+    Detect a GPU llama.cpp can offload layers to.
+    
+    Returns:
+        GPU description, or None when only the CPU is available
+    """
+    import platform
+    import shutil
+    
+    if shutil.which("nvidia-smi"):
+        try:
+            result = subprocess.run(
+                ["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader"],
+                capture_output=True, text=True, timeout=10
+            )
+            if result.returncode == 0 and result.stdout.strip():
+                return result.stdout.strip().splitlines()[0]
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+    if sys.platform == "darwin" and platform.machine() == "arm64":
+        return "Apple Metal"
+    return None
+
+def sanitize_input(text: str) -> str:
+    """
+    Sanitize user input to prevent injection attacks.
+    
+    Args:
+        text: Input text to sanitize
+    
+    Returns:
+        Sanitized text
+    """
+    # Remove potentially dangerous characters
+    dangerous_chars = ['<script>', '</script>', 'javascript:', 'data:', 'vbscript:']
+    sanitized = text
+    for char in dangerous_chars:
+        sanitized = sanitized.replace(char, '')
+    
+    # Limit length
+    if len(sanitized) > 10000:
+        sanitized = sanitized[:10000] + "..."
+    
+    return sanitized
+
+def estimate_tokens(text: str, model: Optional[str] = None, add_bos: bool = True) -> int:
+    """
+    Count tokens with the model's own vocabulary.
+    
+    Falls back to a rough estimate when no readable model is present.
+    
+    Args:
+        text: Text to estimate tokens for
+        model: MODEL_REGISTRY key, the default model when None
+        add_bos: Count the BOS token llama.cpp adds at the start of a
+            prompt; False for parts of a prompt and for generated text
+    
+    Returns:
+        Token count (exact when the model's tokenizer is available)
+    """
+    tokenizer = get_tokenizer(get_model_path(model))
+    if tokenizer is not None:
+        return tokenizer.count(text, add_bos)
+    
+    # Rough approximation: 1 token ≈ 4 characters for English text
+    return len(text) // 4
+
+def format_response_time(seconds: float) -> str:
+    """
+    Format response time in a human-readable format.
+    
+    Args:
+        seconds: Time in seconds
+    
+    Returns:
+        Formatted time string
+    """
+    if seconds < 1:
+        return f"{seconds*1000:.0f}ms"
+    elif seconds < 60:
+        return f"{seconds:.1f}s"
+    else:
+        minutes = int(seconds // 60)
+        remaining_seconds = seconds % 60
         return f"{minutes}m {remaining_seconds:.0f}s" 
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""
+Persistent llama-server worker for the Llama 4 Chat Interface
+"""
+
+import atexit
+import json
+import logging
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterator
+
+from config import (
+    SERVER_CONFIG, MODEL_REGISTRY, DEFAULT_MODEL, get_model_path, get_draft_model_path, get_llama_server_path
+)
+from metrics import MODEL_LOAD_SECONDS
+from model_pool import ModelPool
+from tracing import span, add_timing_spans, now_us
+from prefix_cache import find_prefix_snapshot
+from utils import get_session_cache_path, resolve_inference_config
+
+logger = logging.getLogger(__name__)
+
+class LlamaServerWorker:
+    """
+    Long-lived llama-server child process that keeps the model loaded
+    between requests.
+
+    Load-time parameters (threads, ctx_size, GPU offload) are fixed when the
+    process starts; sampling parameters are sent with every request.
+
+    Every model in MODEL_REGISTRY gets its own worker, listening on
+    SERVER_CONFIG["port"] plus the model's position in the registry.
+
+    When speculative decoding is on and the model's draft GGUF is
+    downloaded, the worker loads it next to the model: the draft proposes
+    up to draft_max tokens and the model verifies them in one batch.
+
+    Chat sessions take turns on slot 0: a session's KV state is saved to
+    its slot file after each turn and restored only when another request
+    used the slot in between. Requests without a session go to any free
+    slot, so batch jobs can use every configured slot concurrently.
+    """
+
+    def __init__(self, model: Optional[str] = None, port: Optional[int] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.model = model or DEFAULT_MODEL
+        self.model_path = get_model_path(self.model)
+        self.host = SERVER_CONFIG["host"]
+        self.port = port or SERVER_CONFIG["port"] + list(MODEL_REGISTRY).index(self.model)
+        self.config = resolve_inference_config(dict(config or {}, model=self.model))
+        self.draft_path = self._find_draft()
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.load_seconds: Optional[float] = None
+        self._log_file = None
+        self._lock = threading.RLock()
+        self._slot_lock = threading.Lock()
+        self._slot_owner: Optional[str] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _find_draft(self) -> Optional[Path]:
+        """The draft GGUF to load, None when speculative decoding is off or the draft is missing"""
+        if not self.config["speculative"]:
+            return None
+        draft_path = get_draft_model_path(self.model)
+        if draft_path is None:
+            return None
+        if not draft_path.exists():
+            logger.warning(
+                f"Draft model {draft_path.name} not found, running without speculative decoding; "
+                f"run `python download.py --model {self.model}` to fetch it"
+            )
+            return None
+        return draft_path
+
+    def build_command(self) -> List[str]:
+        """Build the llama-server command line from the load-time config"""
+        cmd = [
+            str(get_llama_server_path()),
+            "--model", str(self.model_path),
+            "--host", self.host,
+            "--port", str(self.port),
+            "--threads", str(self.config["threads"]),
+            "--ctx-size", str(self.config["ctx_size"]),
+            "--batch-size", str(self.config["batch_size"]),
+            "--ubatch-size", str(self.config["ubatch_size"]),
+            "--n-gpu-layers", str(self.config["n_gpu_layers"]),
+            "-ot", self.config["gpu_layers_filter"],
+            "--prio", str(self.config["priority"]),
+            "--parallel", str(SERVER_CONFIG["parallel"]),
+            "--slot-save-path", str(SERVER_CONFIG["slot_save_path"])
+        ]
+        if self.draft_path:
+            cmd += [
+                "--model-draft", str(self.draft_path),
+                "--gpu-layers-draft", str(self.config["draft_gpu_layers"]),
+                "--draft-max", str(self.config["draft_max"]),
+                "--draft-min", str(self.config["draft_min"]),
+                "--draft-p-min", str(self.config["draft_p_min"])
+            ]
+        return cmd
+
+    def start(self) -> None:
+        """Spawn llama-server and block until the model is loaded"""
+        with self._lock:
+            if self.is_alive():
+                return
+            Path(SERVER_CONFIG["slot_save_path"]).mkdir(parents=True, exist_ok=True)
+            self._slot_owner = None
+            cmd = self.build_command()
+            logger.info(f"Starting llama-server: {' '.join(cmd)}")
+            self._log_file = open(SERVER_CONFIG["log_file"], "ab")
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=self._log_file,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL
+            )
+            start_time = time.time()
+            with span("start llama-server"):
+                self._wait_until_ready()
+            self.load_seconds = time.time() - start_time
+            MODEL_LOAD_SECONDS.observe(self.load_seconds, backend="server")
+            logger.info(f"llama-server ready in {self.load_seconds:.2f} seconds (pid {self.process.pid})")
+
+    def _wait_until_ready(self) -> None:
+        deadline = time.time() + SERVER_CONFIG["startup_timeout"]
+        while time.time() < deadline:
+            if not self.is_alive():
+                code = self.process.returncode if self.process else None
+                raise RuntimeError(f"llama-server exited during startup (code {code}), see {SERVER_CONFIG['log_file']}")
+            if self.is_healthy():
+                return
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"llama-server did not become healthy within {SERVER_CONFIG['startup_timeout']} seconds")
+
+    def is_alive(self) -> bool:
+        """Check that the child process is still running"""
+        return self.process is not None and self.process.poll() is None
+
+    def is_healthy(self) -> bool:
+        """
+        Query the /health endpoint.
+
+        llama-server answers 503 while the model is still loading, which
+        urllib reports as an HTTPError.
+        """
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/health", timeout=SERVER_CONFIG["health_timeout"]) as resp:
+                return resp.status == 200
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+    def ensure_running(self) -> None:
+        """Start the worker, or restart it if it crashed or stopped answering"""
+        with self._lock:
+            if self.is_alive() and self.is_healthy():
+                return
+            if self.process is None:
+                self.start()
+                return
+            if self.restarts >= SERVER_CONFIG["max_restarts"]:
+                raise RuntimeError(f"llama-server failed {self.restarts} times, giving up")
+            self.restarts += 1
+            logger.warning(f"llama-server is down, restarting (attempt {self.restarts})")
+            self.stop()
+            self.start()
+
+    def stop(self) -> None:
+        """Terminate the child process and release its log handle"""
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                logger.info(f"Stopping llama-server (pid {self.process.pid})")
+                self.process.terminate()
+                try:
+                    self.process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                    self.process.wait()
+            self.process = None
+            if self._log_file:
+                self._log_file.close()
+                self._log_file = None
+
+    def request(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """POST a JSON payload to the worker and decode the JSON reply"""
+        with self._post(path, payload, timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    def _post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None):
+        """
+        Open a JSON POST request to the worker.
+
+        A connection failure triggers one restart and retry, so a crashed
+        worker is replaced transparently.
+        """
+        self.ensure_running()
+        req = urllib.request.Request(
+            f"{self.base_url}{path}",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        timeout = timeout or SERVER_CONFIG["request_timeout"]
+        try:
+            resp = urllib.request.urlopen(req, timeout=timeout)
+        except (urllib.error.URLError, ConnectionError) as e:
+            if self.is_alive() and self.is_healthy():
+                raise
+            logger.warning(f"llama-server request failed ({e}), restarting worker")
+            self.ensure_running()
+            resp = urllib.request.urlopen(req, timeout=timeout)
+        self.restarts = 0
+        return resp
+
+    def completion_payload(self, prompt: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Map INFERENCE_CONFIG-style sampling parameters onto a /completion request"""
+        payload = {
+            "prompt": prompt,
+            "n_predict": config["max_tokens"],
+            "stop": config["stop"],
+            "temperature": config["temperature"],
+            "top_p": config["top_p"],
+            "min_p": config["min_p"],
+            "repeat_penalty": config["repeat_penalty"],
+            "seed": config["seed"],
+            "cache_prompt": True
+        }
+        if self.draft_path:
+            # Per request, so speculative=False turns drafting off without reloading
+            payload["speculative.n_max"] = config["draft_max"] if config["speculative"] else 0
+            payload["speculative.n_min"] = config["draft_min"]
+            payload["speculative.p_min"] = config["draft_p_min"]
+        return payload
+
+    def complete(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None) -> str:
+        """Run a completion on the warm model"""
+        return "".join(self.stream(prompt, config, session_id)).strip()
+
+    def stream(self, prompt: str, config: Dict[str, Any], session_id: Optional[str] = None,
+               stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Stream a completion from the warm model.
+
+        llama-server sends server-sent events, one `data: {json}` line per
+        token; the final event carries `"stop": true`. With cache_prompt the
+        server only evaluates the part of the prompt that differs from the
+        KV state already in the slot. The server's `timings` for the request
+        are copied into stats when given.
+        """
+        payload = self.completion_payload(prompt, config)
+        payload["stream"] = True
+        if not session_id:
+            payload["id_slot"] = -1
+            # Slot 0 may be picked, so no session owns its KV state afterwards;
+            # waits for a session turn in progress so its save cannot reclaim it
+            with self._slot_lock:
+                self._slot_owner = None
+            yield from self._stream_events(payload, stats)
+            return
+
+        payload["id_slot"] = 0
+        with self._slot_lock:
+            with span("restore session"):
+                self._restore_session(session_id, prompt)
+            # The slot only holds a session's state once its turn completes
+            self._slot_owner = None
+            yield from self._stream_events(payload, stats)
+            self._slot_owner = session_id
+            with span("save session"):
+                self._save_session(session_id)
+
+    def _stream_events(self, payload: Dict[str, Any], stats: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        with span("llama-server completion"):
+            request_start = now_us()
+            with self._post("/completion", payload) as resp:
+                for line in resp:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    event = json.loads(line[len(b"data:"):].decode("utf-8"))
+                    if event.get("content"):
+                        yield event["content"]
+                    if event.get("stop"):
+                        if "timings" in event:
+                            add_timing_spans(request_start, event["timings"])
+                            if stats is not None:
+                                stats.update(event["timings"])
+                        break
+
+    def _restore_session(self, session_id: str, prompt: str) -> None:
+        """Load a session's saved KV state into the slot unless it is already there"""
+        if self._slot_owner == session_id:
+            return
+        self._slot_owner = None
+        cache_path = get_session_cache_path(session_id, "slot", self.model)
+        owner = session_id
+        if not cache_path.exists():
+            # A new session starts from the shared system-prompt state
+            cache_path = find_prefix_snapshot(prompt, "slot", self.model)
+            owner = None
+            if cache_path is None:
+                return
+        try:
+            self.request("/slots/0?action=restore", {"filename": cache_path.name})
+            self._slot_owner = owner
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.warning(f"Could not restore prompt cache for session {session_id}: {e}")
+
+    def save_prefix(self, prefix: str, filename: str) -> None:
+        """
+        Evaluate a prompt prefix in slot 0 and save its KV state.
+
+        Args:
+            prefix: Formatted prompt prefix
+            filename: Snapshot file name inside the slot save path
+        """
+        payload = self.completion_payload(prefix, self.config)
+        payload.update(n_predict=1, id_slot=0)
+        with self._slot_lock:
+            self._slot_owner = None
+            self.request("/completion", payload)
+            self.request("/slots/0?action=save", {"filename": filename})
+
+    def _save_session(self, session_id: str) -> None:
+        """Persist the slot's KV state so the session can resume after other requests"""
+        cache_path = get_session_cache_path(session_id, "slot", self.model)
+        try:
+            self.request("/slots/0?action=save", {"filename": cache_path.name})
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.warning(f"Could not save prompt cache for session {session_id}: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        """Summary for the sidebar"""
+        return {
+            "model": self.model,
+            "draft": self.draft_path.name if self.draft_path else None,
+            "running": self.is_alive(),
+            "pid": self.process.pid if self.is_alive() else None,
+            "url": self.base_url,
+            "load_seconds": self.load_seconds,
+            "restarts": self.restarts
+        }
+
+def _start_worker(model: str) -> LlamaServerWorker:
+    worker = LlamaServerWorker(model)
+    worker.start()
+    return worker
+
+# Streamlit reruns the script but keeps imported modules, so every session
+# in the process shares the same loaded models
+_pool = ModelPool("llama-server", load=_start_worker, unload=LlamaServerWorker.stop)
+
+def get_worker(model: Optional[str] = None) -> LlamaServerWorker:
+    """
+    Get a model's process-wide worker, starting it on first use.
+
+    Args:
+        model: MODEL_REGISTRY key, the default model when None
+
+    Returns:
+        The running worker
+    """
+    with use_worker(model) as worker:
+        return worker
+
+@contextmanager
+def use_worker(model: Optional[str] = None) -> Iterator[LlamaServerWorker]:
+    """Hold a model's worker for one request, so it is not evicted meanwhile"""
+    with _pool.use(model or DEFAULT_MODEL) as worker:
+        worker.ensure_running()
+        yield worker
+
+def get_worker_pool() -> ModelPool:
+    """The pool of running workers, for status displays"""
+    return _pool
+
+def shutdown_worker(model: Optional[str] = None) -> None:
+    """Stop one model's worker, or every worker when no model is given"""
+    if model:
+        _pool.evict(model)
+    else:
+        _pool.clear()
+
+atexit.register(shutdown_worker)